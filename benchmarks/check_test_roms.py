@@ -0,0 +1,119 @@
+"""
+Runs the test ROMs headless, in parallel processes, and reads their results from the serial port (Blargg's ROMs print
+"Passed" or "Failed" there, as well as on screen). Each ROM gets a budget of emulated cycles, after which it counts as
+timed out.
+
+Prints a summary, and can write it as JSON (with the wall time and emulated cycles of each ROM). Exits with status 1 if
+a ROM that is expected to pass doesn't, so it can be used as a gate for changes to the emulator core:
+
+    python -m benchmarks.check_test_roms --jobs 4 --json results.json
+"""
+
+import argparse
+import glob
+import json
+import os.path
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from gb_pymulator.emulator import Emulator, CPUS, CPU_NATIVE
+
+CYCLES_PER_SECOND = 4_194_304
+
+DEFAULT_CYCLE_BUDGET = 150_000_000
+CYCLE_BUDGETS = {
+    "cpu_instrs.gb": 400_000_000,  # All of 01-11 in one ROM
+}
+
+# ROMs that don't pass yet. (cpu_instrs.gb includes 02-interrupts.gb.)
+KNOWN_FAILURES = {"02-interrupts.gb", "cpu_instrs.gb"}
+
+# How often the serial output is checked
+FRAMES_PER_CHECK = 30
+
+
+def run_rom(rom_file: str, cycle_budget: int, cpu: str) -> dict:
+    with open(rom_file, "rb") as file:
+        emulator = Emulator(file.read(), cpu=cpu)
+
+    start = time.perf_counter()
+    result = "timeout"
+    while emulator.cycle_count < cycle_budget:
+        emulator.run_frames(FRAMES_PER_CHECK)
+        output = emulator.serial_output
+        if b"Passed" in output or b"Failed" in output:
+            # The details (e.g. which tests failed) may be printed after the result
+            emulator.run_frames(FRAMES_PER_CHECK)
+            result = "passed" if b"Passed" in output else "failed"
+            break
+
+    return {
+        "rom": os.path.basename(rom_file),
+        "result": result,
+        "wall_time": round(time.perf_counter() - start, 3),
+        "cycles": emulator.cycle_count,
+        "frames": emulator.frame_count,
+        "output": emulator.serial_output.decode("latin-1"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--roms", default="test_roms/*.gb", help="Glob pattern for the ROM files")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="Number of worker processes")
+    parser.add_argument("--cpu", choices=CPUS, default=CPU_NATIVE)
+    parser.add_argument("--budget-scale", type=float, default=1.0, help="Factor for the cycle budget of each ROM")
+    parser.add_argument("--json", metavar="FILE", help="Write the summary as JSON ('-' for stdout)")
+    args = parser.parse_args()
+
+    rom_files = sorted(glob.glob(args.roms))
+    budgets = {rom_file: int(CYCLE_BUDGETS.get(os.path.basename(rom_file), DEFAULT_CYCLE_BUDGET) * args.budget_scale)
+               for rom_file in rom_files}
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        # The longest ROMs are started first, so that they don't end up running alone at the end
+        futures = {rom_file: executor.submit(run_rom, rom_file, budgets[rom_file], args.cpu)
+                   for rom_file in sorted(rom_files, key=budgets.get, reverse=True)}
+        results = [futures[rom_file].result() for rom_file in rom_files]
+    wall_time = time.perf_counter() - start
+
+    regressions = [r["rom"] for r in results if r["result"] != "passed" and r["rom"] not in KNOWN_FAILURES]
+    fixed = [r["rom"] for r in results if r["result"] == "passed" and r["rom"] in KNOWN_FAILURES]
+
+    out = sys.stderr if args.json == "-" else sys.stdout
+    print(f"{'rom':<28} {'result':<8} {'seconds':>8} {'emulated (s)':>13}", file=out)
+    for r in results:
+        known = " (known)" if r["result"] != "passed" and r["rom"] in KNOWN_FAILURES else ""
+        print(f"{r['rom']:<28} {r['result']:<8} {r['wall_time']:>8.2f} {r['cycles'] / CYCLES_PER_SECOND:>13.1f}{known}",
+              file=out)
+    passed = sum(r["result"] == "passed" for r in results)
+    print(f"{passed}/{len(results)} passed in {wall_time:.1f}s ({args.jobs} jobs)", file=out)
+    for rom in fixed:
+        print(f"{rom} passes now, so it can be removed from KNOWN_FAILURES", file=out)
+    for rom in regressions:
+        print(f"FAILED: {rom}", file=out)
+
+    if args.json is not None:
+        summary = {
+            "cpu": args.cpu,
+            "jobs": args.jobs,
+            "wall_time": round(wall_time, 3),
+            "passed": passed,
+            "regressions": regressions,
+            "roms": results,
+        }
+        if args.json == "-":
+            json.dump(summary, sys.stdout, indent=2)
+            print()
+        else:
+            with open(args.json, "w") as file:
+                json.dump(summary, file, indent=2)
+
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
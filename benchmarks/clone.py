@@ -0,0 +1,68 @@
+"""
+Measures the cost of branching from a game state: the latency of Emulator.clone() (compared with creating an emulator
+and loading a save state into it), the memory used per clone, and the throughput of a search that steps many
+branches from the same state.
+
+    python -m benchmarks.clone games/super_mario.gb --branches 64 --frames 10
+"""
+
+import argparse
+import time
+import tracemalloc
+
+from gb_pymulator.emulator import Emulator
+
+
+def latency_us(function, n: int) -> float:
+    start = time.perf_counter()
+    for _ in range(n):
+        function()
+    return (time.perf_counter() - start) / n * 1_000_000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("rom_file")
+    parser.add_argument("--warmup-frames", type=int, default=300, help="Frames to run before branching")
+    parser.add_argument("--branches", type=int, default=64)
+    parser.add_argument("--frames", type=int, default=10, help="Frames to step each branch")
+    parser.add_argument("--n", type=int, default=1000, help="Repetitions for the latency measurements")
+    args = parser.parse_args()
+
+    with open(args.rom_file, "rb") as file:
+        rom = file.read()
+    emulator = Emulator(rom)
+    emulator.run_frames(args.warmup_frames)
+    state = emulator.save_state()
+
+    def new_and_load():
+        Emulator(rom).load_state(state)
+
+    snapshot = emulator.snapshot()
+    print(f"{'operation':<28} {'latency (us)':>12}")
+    print(f"{'clone()':<28} {latency_us(emulator.clone, args.n):>12.1f}")
+    print(f"{'Emulator() + load_state()':<28} {latency_us(new_and_load, args.n):>12.1f}")
+    print(f"{'save_state()':<28} {latency_us(emulator.save_state, args.n):>12.1f}")
+    print(f"{'restore(snapshot)':<28} {latency_us(lambda: emulator.restore(snapshot), args.n):>12.1f}")
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    clones = [emulator.clone() for _ in range(args.branches)]
+    per_clone = (tracemalloc.get_traced_memory()[0] - before) / args.branches
+    tracemalloc.stop()
+    print(f"Memory per clone: {per_clone / 1024:.1f} kB")
+    del clones
+
+    # Each branch presses a different combination of buttons, from the same state
+    start = time.perf_counter()
+    for buttons in range(args.branches):
+        branch = emulator.clone()
+        branch.set_buttons(buttons % 256)
+        branch.run_frames(args.frames)
+    elapsed = time.perf_counter() - start
+    print(f"Search: {args.branches} branches x {args.frames} frames in {elapsed * 1000:.1f} ms "
+          f"({args.branches / elapsed:.0f} branches/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Measures how long it takes to import the emulator, with "python -X importtime" in a new process. Lists the slowest
+modules, and checks that optional dependencies (pygame, numpy), the reference CPU, and the parts of the standard
+library that are only needed for files and commands (json, argparse) are not imported up front.
+
+    python -m benchmarks.import_time --module gb_pymulator.emulator --top 15
+"""
+
+import argparse
+import subprocess
+import sys
+
+# Modules that should only be imported when they are used
+DEFERRED_MODULES = ["pygame", "numpy", "gb_pymulator.instruction_decoding", "gb_pymulator.instructions", "json",
+                    "argparse"]
+
+
+def import_times(module: str):
+    """ Returns (self_us, cumulative_us, name) for each imported module, in import order """
+    check_script = f"import sys, {module}; print(','.join(sorted(sys.modules)))"
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", check_script], capture_output=True,
+                            text=True, check=True)
+    times = []
+    for line in result.stderr.splitlines():
+        # Format: "import time: self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        times.append((int(self_us), int(cumulative_us), name.strip()))
+    imported = set(result.stdout.strip().split(","))
+    return times, imported
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--module", default="gb_pymulator.emulator")
+    parser.add_argument("--top", type=int, default=15, help="How many of the slowest modules to list")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    import_times(args.module)  # warm-up (.pyc files)
+    runs = [import_times(args.module) for _ in range(args.runs)]
+
+    # The run with the fastest total import of the module
+    times, imported = min(runs, key=lambda run: next(t[1] for t in run[0] if t[2] == args.module))
+    total_us = next(cumulative for _, cumulative, name in times if name == args.module)
+
+    print(f"Import of {args.module}: {total_us / 1000:.1f} ms (best of {args.runs})")
+    print(f"{'self (ms)':>10} {'cumulative (ms)':>16}  module")
+    for self_us, cumulative_us, name in sorted(times, key=lambda t: t[0], reverse=True)[:args.top]:
+        print(f"{self_us / 1000:>10.1f} {cumulative_us / 1000:>16.1f}  {name}")
+
+    eagerly_imported = [name for name in DEFERRED_MODULES if name in imported]
+    if eagerly_imported:
+        print(f"Imported up front, but should be deferred: {', '.join(eagerly_imported)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
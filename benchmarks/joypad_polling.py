@@ -0,0 +1,98 @@
+"""
+Measures the cost of the joypad polling that games do every frame: writing P1 (0xFF00) to select the buttons or the
+directions, and reading them back. The workload is a generated ROM that waits for VBlank and then polls the joypad a
+number of times, like a game's input routine. A control ROM runs the same instructions, but writes to high RAM instead
+of P1, so the time per P1 write is the difference between them.
+
+Compare builds with it, e.g. one with the debug messages in the emulation loop compiled in (which used to be taken
+for every P1 write):
+
+    python -m benchmarks.joypad_polling
+    GB_PYMULATOR_LOG_LEVEL=2 python setup.py build_ext --inplace --force
+    python -m benchmarks.joypad_polling
+"""
+
+import argparse
+import time
+
+from benchmarks.test_roms import runtime_name
+from gb_pymulator.emulator import Emulator
+
+# The input routine of many games: select the directions, read them (a few times, to let the lines settle), select the
+# buttons, read them, and deselect both. That's 3 writes to P1 per poll.
+POLL = bytes([
+    0x3E, 0x20,  # LD A, $20
+    0xE0, 0x00,  # LDH ($00), A
+    0xF0, 0x00,  # LDH A, ($00)
+    0xF0, 0x00,  # LDH A, ($00)
+    0x3E, 0x10,  # LD A, $10
+    0xE0, 0x00,  # LDH ($00), A
+    0xF0, 0x00,  # LDH A, ($00)
+    0xF0, 0x00,  # LDH A, ($00)
+    0xF0, 0x00,  # LDH A, ($00)
+    0xF0, 0x00,  # LDH A, ($00)
+    0x3E, 0x30,  # LD A, $30
+    0xE0, 0x00,  # LDH ($00), A
+])
+WRITES_PER_POLL = 3
+
+WAIT_FOR_VBLANK = bytes([
+    0xF0, 0x44,  # LDH A, ($44)
+    0xFE, 0x90,  # CP 144
+    0x20, 0xFA,  # JR NZ, -6
+])
+WAIT_FOR_VBLANK_END = bytes([
+    0xF0, 0x44,  # LDH A, ($44)
+    0xFE, 0x90,  # CP 144
+    0x28, 0xFA,  # JR Z, -6
+])
+
+
+def polling_rom(polls_per_frame: int, control: bool = False) -> bytes:
+    """ :param control: write to high RAM ($FF80) instead of P1 """
+    rom = bytearray(0x8000)
+    rom[0x100:0x104] = bytes([0x00, 0xC3, 0x50, 0x01])  # NOP, JP $0150
+    poll = POLL.replace(b"\xE0\x00", b"\xE0\x80") if control else POLL
+    code = WAIT_FOR_VBLANK + poll * polls_per_frame + WAIT_FOR_VBLANK_END
+    code += bytes([0xC3, 0x50, 0x01])  # JP $0150
+    if 0x150 + len(code) > len(rom):
+        raise ValueError(f"Too many polls per frame: {polls_per_frame}")
+    rom[0x150:0x150 + len(code)] = code
+    checksum = 0
+    for byte in rom[0x134:0x14D]:
+        checksum = checksum - byte - 1
+    rom[0x14D] = checksum & 0xFF
+    return bytes(rom)
+
+
+def seconds_per_frame(roms: list, frames: int, repeats: int) -> list:
+    """ The best time per frame of each ROM. The ROMs take turns, so that they see the same noise. """
+    emulators = [Emulator(rom) for rom in roms]
+    best = [float("inf")] * len(roms)
+    for _ in range(repeats):
+        for i, emulator in enumerate(emulators):
+            start = time.perf_counter()
+            emulator.run_frames(frames)
+            best[i] = min(best[i], (time.perf_counter() - start) / frames)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--polls", type=int, nargs="+", default=[1, 10, 100],
+                        help="Polls per frame (a game usually polls once)")
+    args = parser.parse_args()
+
+    print(f"Runtime: {runtime_name()}")
+    print(f"{'polls/frame':>12} {'fps':>8} {'control fps':>12} {'ns/P1 write':>12}")
+    for polls in args.polls:
+        seconds, control = seconds_per_frame([polling_rom(polls), polling_rom(polls, control=True)], args.frames,
+                                             args.repeats)
+        per_write = (seconds - control) / (polls * WRITES_PER_POLL)
+        print(f"{polls:>12} {1 / seconds:>8.0f} {1 / control:>12.0f} {per_write * 1e9:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Compares the experimental lockstep core (gb_pymulator/lockstep.py) against N independent Emulator instances,
+at increasing N.
+
+    python -m benchmarks.lockstep test_roms/cpu_instrs.gb --frames 3 --max-instances 256
+
+With --diverge, every instance is given its own random button presses, so that their PCs drift apart and the
+lockstep core has to execute more (and smaller) groups per step.
+
+Note that the Emulator also draws every frame, while the lockstep core only emulates the CPU.
+"""
+
+import argparse
+import time
+
+import numpy
+
+from gb_pymulator.emulator import Emulator
+from gb_pymulator.lockstep import LockstepCore
+
+
+def _instance_counts(max_instances: int):
+    counts = []
+    n = 1
+    while n < max_instances:
+        counts.append(n)
+        n *= 4
+    counts.append(max_instances)
+    return counts
+
+
+def _run_emulators(rom: bytes, num_instances: int, frames: int, inputs) -> float:
+    emulators = [Emulator(rom) for _ in range(num_instances)]
+    start = time.perf_counter()
+    for frame in range(frames):
+        for i, emulator in enumerate(emulators):
+            emulator.set_buttons(int(inputs[frame, i]))
+            emulator.run_frames(1)
+    return time.perf_counter() - start
+
+
+def _run_lockstep(rom: bytes, num_instances: int, frames: int, inputs) -> float:
+    core = LockstepCore(rom, num_instances)
+    start = time.perf_counter()
+    for frame in range(frames):
+        core.set_buttons(inputs[frame])
+        core.run_frames(1)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("rom_file")
+    parser.add_argument("--frames", type=int, default=3)
+    parser.add_argument("--max-instances", type=int, default=256)
+    parser.add_argument("--diverge", action="store_true")
+    args = parser.parse_args()
+
+    with open(args.rom_file, "rb") as file:
+        rom = file.read()
+
+    random = numpy.random.default_rng(0)
+
+    print(f"{'instances':>10} {'emulators (frames/s)':>21} {'lockstep (frames/s)':>20} {'speedup':>8}")
+    for num_instances in _instance_counts(args.max_instances):
+        if args.diverge:
+            inputs = random.integers(0, 256, size=(args.frames, num_instances), dtype=numpy.uint8)
+        else:
+            inputs = numpy.zeros((args.frames, num_instances), dtype=numpy.uint8)
+
+        total_frames = num_instances * args.frames
+        emulators_fps = total_frames / _run_emulators(rom, num_instances, args.frames, inputs)
+        lockstep_fps = total_frames / _run_lockstep(rom, num_instances, args.frames, inputs)
+        print(f"{num_instances:>10} {emulators_fps:>21.1f} {lockstep_fps:>20.1f} "
+              f"{lockstep_fps / emulators_fps:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
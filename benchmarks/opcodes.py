@@ -0,0 +1,267 @@
+"""
+Measures each opcode (the 256 base opcodes and the 256 CB-prefixed ones) in isolation, so that the slowest handlers
+can be found without guessing. Each opcode is executed many times from work RAM on a prepared Motherboard, with the
+registers and program counter reset before every execution (the cost of the reset is subtracted). Register pairs and
+immediate operands point into work RAM or high RAM, so that loads and stores hit memory rather than I/O registers.
+Timings are noisy on shared machines, so compare runs with several rounds (--repeats).
+
+Reported per opcode: the instruction and its operand variant (e.g. LD(Reg,AddrReg)), ns/op, and the bytes allocated
+per op (the peak of the memory that tracemalloc sees allocated while the opcode executes, so 0 means that it doesn't
+allocate). The time includes the call and the fetch, so NOP's time is the floor. The slowest operand variants are
+summarized too.
+
+    python -m benchmarks.opcodes --cpu reference --save before.json
+    python -m benchmarks.opcodes --cpu reference --compare before.json
+"""
+
+import argparse
+import contextlib
+import dataclasses
+import gc
+import json
+import os
+import time
+import tracemalloc
+from collections import defaultdict
+
+from benchmarks.test_roms import runtime_name
+from gb_pymulator import cpu
+from gb_pymulator import instruction_decoding
+from gb_pymulator.cartridge import Cartridge
+from gb_pymulator.display import Display
+from gb_pymulator.emulator import CPUS, CPU_NATIVE, CPU_REFERENCE
+from gb_pymulator.frontend import HeadlessFrontend
+from gb_pymulator.instructions import Addr, AddrReg, HighPageAddr, HighPageAddrReg, Reg, Val
+from gb_pymulator.joypad import JoyPad
+from gb_pymulator.motherboard import Motherboard, Memory
+from gb_pymulator.timer import Timer
+
+CODE_ADDRESS = 0xC000
+
+# Immediate operands: as an 8-bit value, (a8) is high RAM, and as a 16-bit value, (a16) is work RAM
+IMMEDIATE_BYTES = [0x80, 0xC4]
+
+# A, B, C, D, E, F, H, L, SP. (BC), (DE) and (HL) are in work RAM, and (C) is in high RAM.
+REGISTERS = (0x12, 0xC1, 0x80, 0xC2, 0x00, 0x00, 0xC3, 0x00, 0xDFF0)
+
+INVALID_OPCODES = {0xD3, 0xDB, 0xDD, 0xE3, 0xE4, 0xEB, 0xEC, 0xED, 0xF4, 0xFC, 0xFD}
+
+
+def opcodes():
+    """ (key, code) for each valid opcode """
+    for opcode in range(256):
+        if opcode == 0xCB or opcode in INVALID_OPCODES:
+            continue
+        # STOP must be followed by 0x00
+        yield f"{opcode:02X}", bytes([opcode, 0x00] if opcode == 0x10 else [opcode] + IMMEDIATE_BYTES)
+    for opcode in range(256):
+        yield f"CB {opcode:02X}", bytes([0xCB, opcode])
+
+
+def prepared_motherboard() -> Motherboard:
+    rom = bytearray(0x8000)
+    memory = Memory(Cartridge(bytes(rom), bytearray()), JoyPad(), Timer(), Display(HeadlessFrontend()))
+    motherboard = Motherboard(memory, CODE_ADDRESS)
+    motherboard.reg.set_state(REGISTERS)
+    return motherboard
+
+
+def _operand_name(field_name: str, value) -> str:
+    if isinstance(value, Reg):
+        return value.register
+    if isinstance(value, AddrReg):
+        return f"({value.register})"
+    if isinstance(value, HighPageAddrReg):
+        return f"(FF00+{value.register})"
+    if isinstance(value, Addr):
+        return "(a16)"
+    if isinstance(value, HighPageAddr):
+        return "(a8)"
+    if isinstance(value, Val):
+        return "d8"
+    if field_name in ("relative_address", "n"):
+        # (n is an operand object, except in ADD SP,r8 and LD HL,SP+r8)
+        return "r8"
+    if field_name == "address":
+        # RST has a fixed address, while CALL has an immediate one
+        return f"{value:02X}h" if value <= 0x38 else "a16"
+    return str(value)
+
+
+def describe(instruction) -> tuple:
+    """ The instruction as assembly (e.g. "LD B,(HL)"), and its operand variant (e.g. "LD(Reg,AddrReg)") """
+    operands = []
+    operand_types = []
+    for field in dataclasses.fields(instruction):
+        value = getattr(instruction, field.name)
+        if field.name in ("cycles", "affect_flags") or value is None:
+            continue
+        operands.append(_operand_name(field.name, value))
+        if isinstance(value, (Reg, AddrReg, HighPageAddrReg, Addr, HighPageAddr, Val)):
+            operand_types.append(type(value).__name__)
+    name = type(instruction).__name__
+    return f"{name} {','.join(operands)}".strip(), f"{name}({','.join(operand_types)})"
+
+
+def _load_code(motherboard: Motherboard, code: bytes):
+    for offset, value in enumerate(code):
+        motherboard.memory.write(CODE_ADDRESS + offset, value)
+
+
+def time_ns(motherboard: Motherboard, state: tuple, execute, iterations: int) -> float:
+    """ The time per iteration of resetting the state and executing the opcode (or only resetting it) """
+    set_state = motherboard.set_state
+    # Like timeit, so that collections that other code caused don't end up in the timing
+    gc.disable()
+    start = time.perf_counter_ns()
+    if execute is None:
+        for _ in range(iterations):
+            set_state(state)
+    else:
+        for _ in range(iterations):
+            set_state(state)
+            execute(motherboard)
+    elapsed = time.perf_counter_ns() - start
+    gc.enable()
+    return elapsed / iterations
+
+
+def allocated_bytes(motherboard: Motherboard, state: tuple, execute, samples: int) -> float:
+    """ The average peak of the memory that is allocated while the opcode executes (tracemalloc must be running) """
+    total = 0
+    for _ in range(samples):
+        motherboard.set_state(state)
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        execute(motherboard)
+        total += tracemalloc.get_traced_memory()[1] - before
+    return total / samples
+
+
+def _execute_nothing(_motherboard: Motherboard):
+    return 0
+
+
+def measure(execute, iterations: int, repeats: int, alloc_samples: int) -> dict:
+    motherboard = prepared_motherboard()
+    # Every execution starts from this state
+    state = motherboard.get_state()
+
+    results = {}
+    for key, code in opcodes():
+        _load_code(motherboard, code)
+        motherboard.set_state(state)
+        name, variant = describe(instruction_decoding._fetch_and_decode_instruction(motherboard))
+        motherboard.set_state(state)
+        execute(motherboard)  # warm-up
+        results[key] = {"name": name, "variant": variant}
+
+    # The opcodes are timed round-robin (and the best round is kept), so that a period where the machine is slower
+    # makes all of them a little slower, rather than some of them a lot
+    overhead = None
+    best = {}
+    for _ in range(repeats):
+        elapsed = time_ns(motherboard, state, None, iterations)
+        overhead = elapsed if overhead is None else min(overhead, elapsed)
+        for key, code in opcodes():
+            _load_code(motherboard, code)
+            elapsed = time_ns(motherboard, state, execute, iterations)
+            best[key] = min(best.get(key, elapsed), elapsed)
+    for key, result in results.items():
+        result["ns"] = round(max(best[key] - overhead, 0), 1)
+
+    # Allocations are measured in a separate pass, since tracing slows down everything else. What the measurement
+    # itself allocates is subtracted.
+    tracemalloc.start()
+    alloc_overhead = allocated_bytes(motherboard, state, _execute_nothing, alloc_samples)
+    for key, code in opcodes():
+        _load_code(motherboard, code)
+        alloc = allocated_bytes(motherboard, state, execute, alloc_samples) - alloc_overhead
+        results[key]["alloc_bytes"] = round(max(alloc, 0), 1)
+    tracemalloc.stop()
+    return results
+
+
+def _change(result: dict, previous: dict) -> float:
+    return (result["ns"] - previous["ns"]) / previous["ns"] * 100 if previous["ns"] > 0 else 0
+
+
+def _allocates_more(result: dict, previous: dict, threshold: float) -> bool:
+    # (An increase of less than 16 bytes is measurement noise, rather than an allocated object)
+    return result["alloc_bytes"] > max(previous["alloc_bytes"] * (1 + threshold / 100), previous["alloc_bytes"] + 16)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cpu", choices=CPUS, default=CPU_REFERENCE)
+    parser.add_argument("--iterations", type=int, default=2000, help="Executions per timing")
+    parser.add_argument("--repeats", type=int, default=5, help="Rounds of timing every opcode (the best is reported)")
+    parser.add_argument("--alloc-samples", type=int, default=50)
+    parser.add_argument("--top", type=int, default=40, help="How many opcodes to list (0 for all)")
+    parser.add_argument("--sort", choices=["ns", "alloc", "opcode", "change"], default="ns")
+    parser.add_argument("--save", metavar="FILE", help="Write the results as JSON")
+    parser.add_argument("--compare", metavar="FILE", help="Compare with the results of a previous run (see --save)")
+    parser.add_argument("--threshold", type=float, default=10.0,
+                        help="Change in ns/op (in percent) that is reported when comparing")
+    args = parser.parse_args()
+
+    execute = instruction_decoding.fetch_decode_execute if args.cpu == CPU_REFERENCE else cpu.execute
+    # (STOP logs a message every time)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        results = measure(execute, args.iterations, args.repeats, args.alloc_samples)
+
+    previous = None
+    if args.compare is not None:
+        with open(args.compare) as file:
+            previous = json.load(file)["opcodes"]
+
+    print(f"{runtime_name()}, {args.cpu} CPU, {len(results)} opcodes")
+    keys = list(results)
+    if args.sort == "ns":
+        keys.sort(key=lambda k: results[k]["ns"], reverse=True)
+    elif args.sort == "alloc":
+        keys.sort(key=lambda k: results[k]["alloc_bytes"], reverse=True)
+    elif args.sort == "change" and previous is not None:
+        keys.sort(key=lambda k: _change(results[k], previous[k]) if k in previous else 0, reverse=True)
+    print(f"{'opcode':<7} {'instruction':<18} {'variant':<28} {'ns/op':>8} {'alloc B/op':>11}"
+          + (f" {'change':>8}" if previous is not None else ""))
+    for key in keys[:args.top or None]:
+        result = results[key]
+        line = (f"{key:<7} {result['name']:<18} {result['variant']:<28} {result['ns']:>8.1f} "
+                f"{result['alloc_bytes']:>11.1f}")
+        if previous is not None and key in previous:
+            line += f" {_change(result, previous[key]):>+7.1f}%"
+        print(line)
+
+    by_variant = defaultdict(list)
+    for result in results.values():
+        by_variant[result["variant"]].append(result["ns"])
+    print()
+    print(f"{'variant':<28} {'opcodes':>8} {'mean ns/op':>11}")
+    for variant, times in sorted(by_variant.items(), key=lambda item: sum(item[1]) / len(item[1]), reverse=True)[:15]:
+        print(f"{variant:<28} {len(times):>8} {sum(times) / len(times):>11.1f}")
+
+    if previous is not None:
+        slower = [k for k in results if k in previous and _change(results[k], previous[k]) > args.threshold]
+        faster = [k for k in results if k in previous and _change(results[k], previous[k]) < -args.threshold]
+        more_allocations = [k for k in results if k in previous
+                            and _allocates_more(results[k], previous[k], args.threshold)]
+        total_before = sum(previous[k]["ns"] for k in results if k in previous)
+        total_after = sum(results[k]["ns"] for k in results if k in previous)
+        print()
+        print(f"Compared with {args.compare}: total {(total_after - total_before) / total_before * 100:+.1f}%, "
+              f"{len(slower)} slower and {len(faster)} faster by more than {args.threshold:.0f}%, "
+              f"{len(more_allocations)} allocating more")
+        for key in slower:
+            print(f"Slower: {key} {results[key]['name']} ({_change(results[key], previous[key]):+.1f}%)")
+        for key in more_allocations:
+            print(f"Allocates more: {key} {results[key]['name']} "
+                  f"({previous[key]['alloc_bytes']:.0f} -> {results[key]['alloc_bytes']:.0f} bytes)")
+
+    if args.save is not None:
+        with open(args.save, "w") as file:
+            json.dump({"runtime": runtime_name(), "cpu": args.cpu, "opcodes": results}, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
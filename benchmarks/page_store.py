@@ -0,0 +1,97 @@
+"""
+Measures how many machine states fit in memory with the page store (see page_store.py), compared with full copies,
+and the latency of storing and restoring a state (from memory, and from the spill file).
+
+The states are collected like a search would: branches of a few frames with random buttons, from states that were
+stored earlier.
+
+    python -m benchmarks.page_store games/super_mario.gb --states 5000
+"""
+
+import argparse
+import random
+import time
+import tracemalloc
+
+from gb_pymulator.emulator import Emulator
+from gb_pymulator.page_store import PageStore
+
+GB = 1024 ** 3
+
+
+def collect_states(store: PageStore, emulator: Emulator, num_states: int, frames_per_branch: int, seed: int):
+    """ Returns the handles and the average latency of put(), in microseconds """
+    rng = random.Random(seed)
+    handles = [store.put(emulator)]
+    put_time = 0
+    while len(handles) < num_states:
+        store.restore(emulator, rng.choice(handles))
+        emulator.set_buttons(rng.randrange(256))
+        emulator.run_frames(frames_per_branch)
+        start = time.perf_counter()
+        handles.append(store.put(emulator))
+        put_time += time.perf_counter() - start
+    return handles, put_time / (num_states - 1) * 1_000_000
+
+
+def restore_latency_us(store: PageStore, emulator: Emulator, handles, n: int, seed: int) -> float:
+    rng = random.Random(seed)
+    sample = [rng.choice(handles) for _ in range(n)]
+    start = time.perf_counter()
+    for handle in sample:
+        store.restore(emulator, handle)
+    return (time.perf_counter() - start) / n * 1_000_000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("rom_file")
+    parser.add_argument("--states", type=int, default=2000)
+    parser.add_argument("--frames-per-branch", type=int, default=2)
+    parser.add_argument("--warmup-frames", type=int, default=300)
+    parser.add_argument("--restores", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with open(args.rom_file, "rb") as file:
+        emulator = Emulator(file.read())
+    emulator.run_frames(args.warmup_frames)
+    full_state_size = len(emulator.save_state())
+    compressed_state_size = len(emulator.save_state(compress=True))
+
+    # Memory is measured in a separate run, since tracing allocations slows down put()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    with PageStore() as store:
+        start_state = emulator.save_state()
+        collect_states(store, emulator, args.states, args.frames_per_branch, args.seed)
+        # Includes the page dictionaries, and the registers and page ids of each state
+        per_state = (tracemalloc.get_traced_memory()[0] - before) / len(store)
+    tracemalloc.stop()
+
+    emulator.load_state(start_state)
+    store = PageStore()
+    handles, put_us = collect_states(store, emulator, args.states, args.frames_per_branch, args.seed)
+
+    print(f"States: {len(store)}, distinct pages: {store.num_pages} "
+          f"({store.memory_bytes / 1024:.0f} kB of pages, for {store.logical_bytes / 1024:.0f} kB of state memory)")
+    print(f"{'storage':<28} {'bytes/state':>12} {'states/GB':>12}")
+    print(f"{'save_state()':<28} {full_state_size:>12.0f} {GB / full_state_size:>12.0f}")
+    print(f"{'save_state(compress=True)':<28} {compressed_state_size:>12.0f} {GB / compressed_state_size:>12.0f}")
+    print(f"{'PageStore':<28} {per_state:>12.0f} {GB / per_state:>12.0f}")
+
+    print(f"put(): {put_us:.1f} us")
+    print(f"restore(), pages in memory: {restore_latency_us(store, emulator, handles, args.restores, args.seed):.1f} us")
+
+    # Most pages are spilled when the memory cap is a tenth of the pages
+    emulator.load_state(start_state)
+    with PageStore(max_bytes=store.memory_bytes // 10) as spilling_store:
+        handles, _ = collect_states(spilling_store, emulator, args.states, args.frames_per_branch, args.seed)
+        latency = restore_latency_us(spilling_store, emulator, handles, args.restores, args.seed)
+        print(f"restore(), with {spilling_store.spilled_pages} of {spilling_store.num_pages} pages spilled: "
+              f"{latency:.1f} us")
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Measures emulation speed on real gameplay, by replaying a recorded movie (see movie.py) headless, as fast as possible.
+The replay is deterministic, so runs are comparable across commits. The recorded state hashes are checked too, so a
+core optimization that changes the emulated behaviour fails here (with the frame where the replay diverged).
+
+    gb-pymulator games/super_mario.gb --record super_mario.gbm
+    python -m benchmarks.replay games/super_mario.gb super_mario.gbm
+"""
+
+import argparse
+import sys
+import time
+
+from benchmarks.test_roms import runtime_name
+from gb_pymulator.emulator import Emulator, CPUS, CPU_NATIVE
+from gb_pymulator.movie import DesyncError, Movie, MoviePlayer
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("rom_file")
+    parser.add_argument("movie_file")
+    parser.add_argument("--cpu", choices=CPUS, default=CPU_NATIVE)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--no-verify", action="store_true", help="Don't check the recorded state hashes")
+    args = parser.parse_args()
+
+    with open(args.rom_file, "rb") as file:
+        rom = file.read()
+    with open(args.movie_file, "rb") as file:
+        movie = Movie.parse(file.read())
+
+    print(f"{runtime_name()}, {args.cpu} CPU")
+    print(f"Movie: {movie.num_frames} frames, {len(movie.events)} input events, {len(movie.hashes)} state hashes")
+    best = None
+    for run in range(args.runs):
+        emulator = Emulator(rom, cpu=args.cpu)
+        player = MoviePlayer(emulator, movie, verify=not args.no_verify)
+        start = time.perf_counter()
+        try:
+            frames = player.run()
+        except DesyncError as e:
+            print(e)
+            sys.exit(1)
+        elapsed = time.perf_counter() - start
+        print(f"Run {run + 1}: {elapsed:.2f}s ({frames / elapsed:.1f} fps)")
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"Best: {movie.num_frames / best:.1f} fps")
+
+
+if __name__ == "__main__":
+    main()
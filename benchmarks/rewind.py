@@ -0,0 +1,75 @@
+"""
+Measures the cost of the rewind history: the frame time with and without capturing states, the memory used per
+captured state, and how many seconds of gameplay fit in the memory cap.
+
+    python -m benchmarks.rewind games/super_mario.gb --frames 600
+"""
+
+import argparse
+import time
+
+from gb_pymulator.emulator import Emulator
+from gb_pymulator.rewind import Rewinder
+
+# The overhead that capturing states may add to the frame time
+MAX_OVERHEAD_PERCENT = 5
+
+FRAMES_PER_SECOND = 60
+
+
+def frame_time(rom: bytes, frames: int, rewinder_kwargs=None):
+    """ Returns (seconds per frame, rewinder or None) """
+    emulator = Emulator(rom)
+    emulator.run_frames(60)  # skip the boot screen
+    rewinder = Rewinder(emulator, **rewinder_kwargs) if rewinder_kwargs is not None else None
+    start = time.perf_counter()
+    for _ in range(frames):
+        emulator.step_frame()
+        if rewinder is not None:
+            rewinder.on_frame()
+    return (time.perf_counter() - start) / frames, rewinder
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("rom_file")
+    parser.add_argument("--frames", type=int, default=600)
+    parser.add_argument("--interval", type=int, default=2, help="Frames between captured states")
+    parser.add_argument("--keyframe-interval", type=int, default=60, help="Captured states between keyframes")
+    parser.add_argument("--max-mb", type=float, default=16, help="Memory cap of the history")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    with open(args.rom_file, "rb") as file:
+        rom = file.read()
+    rewinder_kwargs = dict(interval=args.interval, keyframe_interval=args.keyframe_interval,
+                           max_bytes=int(args.max_mb * 1024 * 1024))
+
+    baseline = min(frame_time(rom, args.frames)[0] for _ in range(args.runs))
+    runs = [frame_time(rom, args.frames, rewinder_kwargs) for _ in range(args.runs)]
+    with_rewind, rewinder = min(runs, key=lambda run: run[0])
+    overhead = (with_rewind - baseline) / baseline * 100
+
+    bytes_per_capture = rewinder.size / len(rewinder)
+    captures_in_cap = rewinder_kwargs["max_bytes"] / bytes_per_capture
+    seconds_in_cap = captures_in_cap * args.interval / FRAMES_PER_SECOND
+
+    print(f"Frame time without rewind: {baseline * 1000:.3f} ms")
+    print(f"Frame time with rewind:    {with_rewind * 1000:.3f} ms ({overhead:+.1f}%)")
+    print(f"Stored states: {len(rewinder)} ({rewinder.size / 1024:.1f} kB, {bytes_per_capture:.0f} bytes per state)")
+    print(f"History that fits in {args.max_mb:g} MB: {seconds_in_cap / 60:.1f} minutes")
+
+    # Rewind through the whole history, the way holding the rewind key does
+    start = time.perf_counter()
+    rewound = 0
+    while rewinder.rewind():
+        rewound += 1
+    if rewound:
+        print(f"Rewind step: {(time.perf_counter() - start) / rewound * 1000:.3f} ms")
+
+    if overhead > MAX_OVERHEAD_PERCENT:
+        print(f"Overhead is above {MAX_OVERHEAD_PERCENT}%")
+
+
+if __name__ == "__main__":
+    main()
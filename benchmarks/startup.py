@@ -0,0 +1,54 @@
+"""
+Measures the startup time: from the start of a new Python process until the emulator has executed its first
+instruction (the entrypoint of the ROM). The target is to stay below 200 ms.
+
+    python -m benchmarks.startup test_roms/cpu_instrs.gb --runs 10
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+TARGET_MS = 200
+
+# Runs in the new process. Creating an Emulator executes the first instruction of the ROM.
+CHILD_SCRIPT = """
+import sys
+from gb_pymulator.emulator import Emulator
+Emulator(sys.argv[1])
+sys.stdout.write("ready\\n")
+sys.stdout.flush()
+"""
+
+
+def measure_once(rom_file: str) -> float:
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "-c", CHILD_SCRIPT, rom_file], stdout=subprocess.PIPE)
+    # The emulator's log messages come before the marker
+    for line in process.stdout:
+        if line.strip() == b"ready":
+            elapsed = time.perf_counter() - start
+            process.wait()
+            return elapsed
+    raise RuntimeError(f"Emulator process failed (exit code {process.wait()})")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("rom_file")
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    measure_once(args.rom_file)  # warm-up (file system caches, and .pyc files)
+    times_ms = [measure_once(args.rom_file) * 1000 for _ in range(args.runs)]
+
+    median = statistics.median(times_ms)
+    print(f"Startup time over {args.runs} runs: median {median:.1f} ms, min {min(times_ms):.1f} ms, "
+          f"max {max(times_ms):.1f} ms")
+    print(f"Target: {TARGET_MS} ms ({'OK' if median < TARGET_MS else 'too slow'})")
+
+
+if __name__ == "__main__":
+    main()
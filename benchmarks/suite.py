@@ -0,0 +1,262 @@
+"""
+Runs a fixed set of workloads on each build of the emulator, and compares the results with a stored baseline:
+
+- builds: "python" (the plain Python modules on CPython, even if compiled modules exist), "cython" (the compiled
+  modules, see setup.py) and "pypy" (the plain Python modules on PyPy, if pypy3 is installed)
+- workloads: the test ROMs, for a fixed number of frames, and the recorded movies (see movie.py) whose ROM is found
+  locally (games are not bundled, so those workloads are skipped otherwise)
+
+Each workload runs in a new process, so that the peak RSS is that of the workload alone. Reported per workload:
+emulated cycles/s, instructions/s, frames/s, speed as a percentage of a real Game Boy, and peak RSS.
+
+    python -m benchmarks.suite --save-baseline baseline.json
+    python -m benchmarks.suite --baseline baseline.json --tolerance 0.1
+
+With --baseline, the command exits with status 1 if the cycles/s of a workload dropped by more than the tolerance.
+Baselines are specific to the machine they were measured on.
+"""
+
+import argparse
+import glob
+import importlib.abc
+import importlib.util
+import json
+import os.path
+import platform
+import shutil
+import subprocess
+import sys
+import time
+import zlib
+
+CYCLES_PER_SECOND = 4_194_304
+
+BUILDS = ["python", "cython", "pypy"]
+
+REPOSITORY_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGE_DIR = os.path.join(REPOSITORY_DIR, "gb_pymulator")
+
+
+class _SourceFinder(importlib.abc.MetaPathFinder):
+    """ Imports the gb_pymulator modules from their .py files, rather than from compiled extension modules """
+
+    def find_spec(self, fullname, path, target=None):
+        if not fullname.startswith("gb_pymulator."):
+            return None
+        source_file = os.path.join(PACKAGE_DIR, *fullname.split(".")[1:]) + ".py"
+        if not os.path.exists(source_file):
+            return None
+        return importlib.util.spec_from_file_location(fullname, source_file)
+
+
+def peak_rss_bytes():
+    try:
+        import resource
+    except ImportError:
+        # Not available on Windows
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in bytes on macOS, and in kilobytes elsewhere
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+def run_workload(workload: dict) -> dict:
+    """ Runs in the worker process """
+    if workload["build"] == "python":
+        sys.meta_path.insert(0, _SourceFinder())
+    from gb_pymulator import emulator as emulator_module
+    from gb_pymulator.emulator import Emulator
+    from gb_pymulator.movie import DesyncError, Movie, MoviePlayer
+
+    compiled = not emulator_module.__file__.endswith(".py")
+    if workload["build"] == "cython" and not compiled:
+        return {"skipped": "not compiled (run: python setup.py build_ext --inplace)"}
+
+    with open(workload["rom"], "rb") as file:
+        emulator = Emulator(file.read(), cpu=workload["cpu"])
+    if workload["movie"] is not None:
+        with open(workload["movie"], "rb") as file:
+            player = MoviePlayer(emulator, Movie.parse(file.read()))
+    start_cycles = emulator.cycle_count
+    start_frames = emulator.frame_count
+
+    start = time.perf_counter()
+    try:
+        if workload["movie"] is not None:
+            player.run()
+        else:
+            emulator.run_frames(workload["frames"])
+    except DesyncError as e:
+        return {"error": str(e)}
+    seconds = time.perf_counter() - start
+
+    return {
+        "seconds": seconds,
+        "cycles": emulator.cycle_count - start_cycles,
+        "instructions": emulator.instruction_count,
+        "frames": emulator.frame_count - start_frames,
+        "peak_rss": peak_rss_bytes(),
+        "runtime": f"{platform.python_implementation()} {platform.python_version()}",
+    }
+
+
+def find_rom(movie_file: str, rom_dirs) -> str:
+    """ The ROM that a movie was recorded with (identified by the checksum in its start state), or None """
+    from gb_pymulator import save_state
+    from gb_pymulator.movie import Movie
+
+    with open(movie_file, "rb") as file:
+        movie = Movie.parse(file.read())
+    rom_checksum = save_state.decode(movie.start_state)[0][0][0]
+    for rom_dir in rom_dirs:
+        for rom_file in sorted(glob.glob(os.path.join(rom_dir, "*.gb*"))):
+            with open(rom_file, "rb") as file:
+                if zlib.crc32(file.read()) == rom_checksum:
+                    return rom_file
+    return None
+
+
+def interpreter(build: str, pypy: str):
+    if build == "pypy":
+        return shutil.which(pypy)
+    return sys.executable
+
+
+def run_in_worker(executable: str, workload: dict) -> dict:
+    completed = subprocess.run([executable, "-m", "benchmarks.suite", "--worker", json.dumps(workload)],
+                               cwd=REPOSITORY_DIR, capture_output=True, text=True)
+    if completed.returncode != 0:
+        lines = completed.stderr.strip().splitlines()
+        return {"error": lines[-1] if lines else f"exit status {completed.returncode}"}
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def measure(executable: str, workload: dict, runs: int) -> dict:
+    """ The fastest of the runs, and the highest peak RSS """
+    results = [run_in_worker(executable, workload) for _ in range(runs)]
+    for result in results:
+        if "seconds" not in result:
+            return result
+    best = min(results, key=lambda r: r["seconds"])
+    seconds = best["seconds"]
+    peak_rss = [r["peak_rss"] for r in results if r["peak_rss"] is not None]
+    return {
+        "runtime": best["runtime"],
+        "seconds": round(seconds, 3),
+        "cycles_per_second": round(best["cycles"] / seconds),
+        "instructions_per_second": round(best["instructions"] / seconds),
+        "frames_per_second": round(best["frames"] / seconds, 1),
+        "realtime_percent": round(best["cycles"] / seconds / CYCLES_PER_SECOND * 100, 1),
+        "peak_rss_mb": round(max(peak_rss) / 1024 / 1024, 1) if peak_rss else None,
+    }
+
+
+def workloads(args) -> list:
+    """ (name, workload) for each workload that can run here. Prints the ones that are skipped. """
+    result = []
+    for rom_file in sorted(glob.glob(args.roms)):
+        result.append((os.path.basename(rom_file),
+                       {"rom": rom_file, "movie": None, "frames": args.frames, "cpu": args.cpu}))
+    for movie_file in sorted(glob.glob(args.movies)):
+        rom_file = find_rom(movie_file, args.rom_dirs)
+        if rom_file is None:
+            print(f"Skipping {movie_file}: its ROM is not in {', '.join(args.rom_dirs)}")
+            continue
+        result.append((os.path.basename(movie_file),
+                       {"rom": rom_file, "movie": movie_file, "frames": None, "cpu": args.cpu}))
+    return result
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """ Prints how each result compares with the baseline, and returns the keys of the regressions """
+    regressions = []
+    for key, result in results.items():
+        baseline_result = baseline.get(key)
+        if baseline_result is None or "cycles_per_second" not in result:
+            continue
+        ratio = result["cycles_per_second"] / baseline_result["cycles_per_second"]
+        if ratio < 1 - tolerance:
+            regressions.append(key)
+            print(f"REGRESSION: {key}: {(ratio - 1) * 100:+.1f}% cycles/s")
+        elif ratio > 1 + tolerance:
+            print(f"Improved: {key}: {(ratio - 1) * 100:+.1f}% cycles/s")
+    missing = [key for key in baseline if key not in results or "cycles_per_second" not in results[key]]
+    for key in missing:
+        print(f"Not measured (in the baseline): {key}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--builds", nargs="+", choices=BUILDS, default=BUILDS)
+    parser.add_argument("--roms", default="test_roms/[01]*.gb", help="Glob pattern for the ROM files")
+    parser.add_argument("--frames", type=int, default=300, help="Frames to emulate per ROM")
+    parser.add_argument("--movies", default="benchmarks/movies/*.gbm", help="Glob pattern for the movie files")
+    parser.add_argument("--rom-dirs", nargs="+", default=["games", "test_roms"],
+                        help="Where to look for the ROMs that the movies were recorded with")
+    # (The emulator isn't imported here, since the workers of the "python" build must import it from source)
+    parser.add_argument("--cpu", choices=["native", "reference"], default="native")
+    parser.add_argument("--runs", type=int, default=1, help="Runs per workload (the fastest is reported)")
+    parser.add_argument("--pypy", default="pypy3", help="The PyPy interpreter")
+    parser.add_argument("--baseline", metavar="FILE", help="Compare with a baseline (see --save-baseline)")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="Drop in cycles/s (as a fraction) that counts as a regression")
+    parser.add_argument("--save-baseline", metavar="FILE", help="Write the results as a baseline")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker is not None:
+        print(json.dumps(run_workload(json.loads(args.worker))))
+        return
+
+    baseline = None
+    if args.baseline is not None:
+        with open(args.baseline) as file:
+            baseline = json.load(file)["results"]
+
+    workload_list = workloads(args)
+    results = {}
+    print(f"{'build':<7} {'workload':<28} {'Mcycles/s':>10} {'Minstr/s':>9} {'fps':>7} {'realtime':>9} "
+          f"{'RSS (MB)':>9} {'baseline':>9}")
+    for build in args.builds:
+        executable = interpreter(build, args.pypy)
+        if executable is None:
+            print(f"{build:<7} skipped: {args.pypy} is not installed")
+            continue
+        for name, workload in workload_list:
+            key = f"{build}/{name}"
+            result = measure(executable, dict(workload, build=build), args.runs)
+            if "skipped" in result:
+                print(f"{build:<7} skipped: {result['skipped']}")
+                break
+            results[key] = result
+            if "error" in result:
+                print(f"{build:<7} {name:<28} ERROR: {result['error']}")
+                continue
+            versus = ""
+            if baseline is not None and key in baseline:
+                versus = f"{(result['cycles_per_second'] / baseline[key]['cycles_per_second'] - 1) * 100:+.1f}%"
+            rss = f"{result['peak_rss_mb']:.1f}" if result["peak_rss_mb"] is not None else "-"
+            print(f"{build:<7} {name:<28} {result['cycles_per_second'] / 1e6:>10.2f} "
+                  f"{result['instructions_per_second'] / 1e6:>9.2f} {result['frames_per_second']:>7.1f} "
+                  f"{result['realtime_percent']:>8.1f}% {rss:>9} {versus:>9}")
+
+    if args.save_baseline is not None:
+        with open(args.save_baseline, "w") as file:
+            json.dump({
+                "machine": platform.node(),
+                "platform": platform.platform(),
+                "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "frames": args.frames,
+                "cpu": args.cpu,
+                "results": results,
+            }, file, indent=2)
+
+    errors = [key for key, result in results.items() if "error" in result]
+    regressions = compare(results, baseline, args.tolerance) if baseline is not None else []
+    if errors or regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Measures emulation speed (frames per second) on the bundled test ROMs, with the CPU core that the current interpreter
+runs: CPython, CPython with the Cython-compiled modules, or PyPy.
+
+    python -m benchmarks.test_roms --frames 300
+    pypy3 -m benchmarks.test_roms --frames 300
+"""
+
+import argparse
+import glob
+import os.path
+import platform
+import time
+
+from gb_pymulator import emulator as emulator_module
+from gb_pymulator.emulator import Emulator, CPUS, CPU_NATIVE
+
+
+def runtime_name() -> str:
+    if platform.python_implementation() == "PyPy":
+        return f"PyPy {platform.python_version()}"
+    compiled = not emulator_module.__file__.endswith(".py")
+    return f"CPython {platform.python_version()}" + (" + Cython" if compiled else "")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--roms", default="test_roms/[01]*.gb", help="Glob pattern for the ROM files")
+    parser.add_argument("--frames", type=int, default=300, help="Frames to emulate per ROM")
+    parser.add_argument("--cpu", choices=CPUS, default=CPU_NATIVE)
+    args = parser.parse_args()
+
+    print(f"{runtime_name()}, {args.cpu} CPU")
+    print(f"{'rom':<28} {'seconds':>8} {'fps':>8}")
+    total_frames = 0
+    total_time = 0
+    for rom_file in sorted(glob.glob(args.roms)):
+        with open(rom_file, "rb") as file:
+            emulator = Emulator(file.read(), cpu=args.cpu)
+
+        # The time includes warm-up (which is significant for PyPy's JIT), like it would for a player
+        start = time.perf_counter()
+        emulator.run_frames(args.frames)
+        elapsed = time.perf_counter() - start
+
+        total_frames += args.frames
+        total_time += elapsed
+        print(f"{os.path.basename(rom_file):<28} {elapsed:>8.2f} {args.frames / elapsed:>8.1f}")
+    print(f"{'total':<28} {total_time:>8.2f} {total_frames / total_time:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Measures how the throughput of independent Emulators scales with the number of threads that run them.
+
+The compiled emulator releases the GIL in run_frames(), so the threads run in parallel and the speedup is bounded by
+the number of cores. When running as plain Python, the threads take turns and there is no speedup.
+
+    python -m benchmarks.threads test_roms/cpu_instrs.gb --frames 120
+"""
+
+import argparse
+import multiprocessing
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from gb_pymulator import emulator as emulator_module
+from gb_pymulator.emulator import Emulator
+
+
+def _thread_counts(max_threads: int):
+    counts = []
+    n = 1
+    while n < max_threads:
+        counts.append(n)
+        n *= 2
+    counts.append(max_threads)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("rom_file")
+    parser.add_argument("--frames", type=int, default=120)
+    parser.add_argument("--max-threads", type=int, default=multiprocessing.cpu_count())
+    args = parser.parse_args()
+
+    with open(args.rom_file, "rb") as file:
+        rom = file.read()
+
+    compiled = not emulator_module.__file__.endswith(".py")
+    print(f"Compiled: {compiled}, cores: {multiprocessing.cpu_count()}")
+    print(f"{'threads':>8} {'frames/s':>10} {'speedup':>8}")
+    baseline = None
+    for num_threads in _thread_counts(args.max_threads):
+        # One emulator per thread, each running the same number of frames
+        emulators = [Emulator(rom) for _ in range(num_threads)]
+        with ThreadPoolExecutor(num_threads) as pool:
+            start = time.perf_counter()
+            list(pool.map(lambda emulator: emulator.run_frames(args.frames), emulators))
+            elapsed = time.perf_counter() - start
+
+        frames_per_second = num_threads * args.frames / elapsed
+        if baseline is None:
+            baseline = frames_per_second
+        print(f"{num_threads:>8} {frames_per_second:>10.1f} {frames_per_second / baseline:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
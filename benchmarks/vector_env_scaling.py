@@ -0,0 +1,62 @@
+"""
+Measures how the throughput of VectorEnv scales with the number of worker processes, from 1 to all cores.
+
+    python -m benchmarks.vector_env_scaling test_roms/cpu_instrs.gb --envs-per-worker 4 --steps 50
+"""
+
+import argparse
+import multiprocessing
+import time
+
+from gb_pymulator.vector_env import VectorEnv
+
+
+def _worker_counts(max_workers: int):
+    counts = []
+    n = 1
+    while n < max_workers:
+        counts.append(n)
+        n *= 2
+    counts.append(max_workers)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("rom_file")
+    parser.add_argument("--envs-per-worker", type=int, default=4)
+    parser.add_argument("--steps", type=int, default=50)
+    parser.add_argument("--frames-per-step", type=int, default=1)
+    parser.add_argument("--max-workers", type=int, default=multiprocessing.cpu_count())
+    args = parser.parse_args()
+
+    with open(args.rom_file, "rb") as file:
+        rom = file.read()
+
+    print(f"{'workers':>8} {'envs':>6} {'steps/s':>10} {'frames/s':>10} {'speedup':>8} {'reset (ms)':>11}")
+    baseline = None
+    for num_workers in _worker_counts(args.max_workers):
+        num_envs = num_workers * args.envs_per_worker
+        with VectorEnv(rom, num_envs, num_workers, ram_addresses=[0xC000],
+                       frames_per_step=args.frames_per_step) as env:
+            actions = [0] * num_envs
+            env.step(actions)  # warm-up
+
+            start = time.perf_counter()
+            for _ in range(args.steps):
+                env.step(actions)
+            elapsed = time.perf_counter() - start
+
+            start = time.perf_counter()
+            env.reset()
+            reset_time = time.perf_counter() - start
+
+        frames_per_second = num_envs * args.steps * args.frames_per_step / elapsed
+        if baseline is None:
+            baseline = frames_per_second
+        print(f"{num_workers:>8} {num_envs:>6} {args.steps / elapsed:>10.2f} {frames_per_second:>10.1f} "
+              f"{frames_per_second / baseline:>7.2f}x {reset_time * 1000:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
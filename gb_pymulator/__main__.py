@@ -0,0 +1,89 @@
+"""
+Command line entry point. Installed as the "gb-pymulator" command, and also runs with "python -m gb_pymulator".
+"""
+
+import argparse
+import os.path
+
+from gb_pymulator import emulator
+from gb_pymulator import logger
+from gb_pymulator import sampler
+
+GAMES_DIR = "games"
+TESTS_DIR = "test_roms"
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="gb-pymulator")
+    parser.add_argument("rom_file_name", nargs="?", default=f"{GAMES_DIR}/dr_mario.gb")
+    parser.add_argument("--scale", type=int, choices=range(1, 7), default=2,
+                        help="Integer factor that the screen is scaled up by")
+    parser.add_argument("--headless", action="store_true",
+                        help="Run without a window (pygame is not loaded)")
+    parser.add_argument("--cpu", choices=emulator.CPUS, default=emulator.CPU_NATIVE,
+                        help="The CPU implementation (the reference CPU is slower, but easier to debug)")
+    parser.add_argument("--record", metavar="MOVIE_FILE",
+                        help="Record the input into a movie file, that can be replayed with --replay")
+    parser.add_argument("--replay", metavar="MOVIE_FILE",
+                        help="Replay a movie file (as fast as possible with --headless), checking for desyncs")
+    parser.add_argument("--hash-interval", type=int, default=60,
+                        help="Frames between the state hashes that are recorded in a movie (0 for none)")
+    parser.add_argument("--boot-rom", metavar="FILE",
+                        help="Run a boot ROM (e.g. DMG_ROM.bin) first. Later runs start from the cached post-boot state")
+    parser.add_argument("--cold-boot", action="store_true",
+                        help="Run the boot ROM even if the post-boot state is cached")
+    parser.add_argument("--checkpoint", metavar="NAME",
+                        help="Start from a named snapshot in the cache (saved with F5 when it doesn't exist yet)")
+    parser.add_argument("--counters", action="store_true",
+                        help="Print execution counters on exit (requires a build with GB_PYMULATOR_COUNTERS=1)")
+    parser.add_argument("--trace", metavar="TRACE_FILE",
+                        help="Save trace events (for chrome://tracing or Perfetto) to a JSON file on exit "
+                             "(requires a build with GB_PYMULATOR_TRACING=1)")
+    parser.add_argument("--guest-profile", action="store_true",
+                        help="Sample the game's program counter, and print the routines with the most cycles on exit")
+    parser.add_argument("--sample-interval", type=int, default=sampler.DEFAULT_INTERVAL,
+                        help="Emulated cycles between the samples of --guest-profile")
+    parser.add_argument("--symbols", metavar="SYM_FILE",
+                        help="Symbol file (RGBDS or no$gmb) that names the routines in the guest profile "
+                             "(by default, the .sym file next to the ROM)")
+    parser.add_argument("--folded", metavar="FOLDED_FILE",
+                        help="Write the guest profile as folded stacks, for a flamegraph (implies --guest-profile)")
+    parser.add_argument("--instruction-trace", metavar="TRACE_FILE",
+                        help="Keep a trace of the last instructions, and write it to a file if the emulator crashes "
+                             "(requires a build with GB_PYMULATOR_TRACING=1)")
+    parser.add_argument("--metrics", metavar="JSONL_FILE",
+                        help="Append the frames/s, speed, instructions/s and frame times to a JSON-lines file every "
+                             "second, and print a summary on exit")
+    parser.add_argument("--hud", action="store_true",
+                        help="Show the frames/s, speed and instructions/s in the window")
+    parser.add_argument("--log-level", choices=logger.LEVELS, default="info",
+                        help="The lowest level of log messages to print (the debug messages in the emulation loop "
+                             "require a build with GB_PYMULATOR_LOG_LEVEL=2)")
+    args = parser.parse_args()
+    logger.set_level(args.log_level)
+    filename_arg = args.rom_file_name
+
+    if os.path.isfile(filename_arg):
+        rom_filename = filename_arg
+    elif os.path.isfile(f"{GAMES_DIR}/{filename_arg}"):
+        rom_filename = f"{GAMES_DIR}/{filename_arg}"
+    elif os.path.isfile(f"{TESTS_DIR}/{filename_arg}"):
+        rom_filename = f"{TESTS_DIR}/{filename_arg}"
+    else:
+        print(f"File not found: '{filename_arg}'")
+        return
+
+    print(f"Running emulator on ROM file: {rom_filename}")
+
+    emulator.run_game_from_file(rom_filename, args.scale, args.headless, cpu=args.cpu, record_file=args.record,
+                                replay_file=args.replay, hash_interval=args.hash_interval,
+                                boot_rom_file=args.boot_rom, cold_boot=args.cold_boot, checkpoint=args.checkpoint,
+                                counters=args.counters, trace_file=args.trace,
+                                sample_interval=args.sample_interval if args.guest_profile or args.folded else None,
+                                symbols_file=args.symbols, folded_file=args.folded,
+                                instruction_trace_file=args.instruction_trace, metrics_file=args.metrics,
+                                hud=args.hud)
+
+
+if __name__ == "__main__":
+    main()
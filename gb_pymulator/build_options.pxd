@@ -0,0 +1,37 @@
+# Compile-time options (see build_options.py). There is no extension module for this file: the declarations are
+# C macros and functions, that the modules which cimport it compile in.
+
+cdef extern from *:
+    """
+    #include <time.h>
+
+    #ifndef GB_PYMULATOR_COUNTERS
+    #define GB_PYMULATOR_COUNTERS 0
+    #endif
+
+    #ifndef GB_PYMULATOR_TRACING
+    #define GB_PYMULATOR_TRACING 0
+    #endif
+
+    #ifndef GB_PYMULATOR_LOG_LEVEL
+    #define GB_PYMULATOR_LOG_LEVEL 3
+    #endif
+    #define GB_PYMULATOR_LOG_TRACE (GB_PYMULATOR_LOG_LEVEL <= 1)
+    #define GB_PYMULATOR_LOG_DEBUG (GB_PYMULATOR_LOG_LEVEL <= 2)
+    #define GB_PYMULATOR_LOG_INFO (GB_PYMULATOR_LOG_LEVEL <= 3)
+    #define GB_PYMULATOR_LOG_WARN (GB_PYMULATOR_LOG_LEVEL <= 4)
+
+    static inline long long gb_pymulator_now_ns(void) {
+        struct timespec ts;
+        timespec_get(&ts, TIME_UTC);
+        return (long long)ts.tv_sec * 1000000000LL + ts.tv_nsec;
+    }
+    """
+    const bint COUNTERS "GB_PYMULATOR_COUNTERS"
+    const bint TRACING "GB_PYMULATOR_TRACING"
+    const int LOG_LEVEL "GB_PYMULATOR_LOG_LEVEL"
+    const bint LOG_TRACE "GB_PYMULATOR_LOG_TRACE"
+    const bint LOG_DEBUG "GB_PYMULATOR_LOG_DEBUG"
+    const bint LOG_INFO "GB_PYMULATOR_LOG_INFO"
+    const bint LOG_WARN "GB_PYMULATOR_LOG_WARN"
+    long long now_ns "gb_pymulator_now_ns" () noexcept nogil
@@ -0,0 +1,28 @@
+"""
+Options that are chosen when the extension modules are compiled (see setup.py). In the compiled modules, they are C
+constants from build_options.pxd, so the code that an option switches off is compiled out. This module is what the
+plain Python modules (and PyPy) see instead, where the options are read from the environment when it's imported.
+"""
+
+import os
+import time
+
+# Execution counters (see counters.py). Compiled in with GB_PYMULATOR_COUNTERS=1.
+COUNTERS = os.environ.get("GB_PYMULATOR_COUNTERS") == "1"
+
+# Trace events and the instruction trace (see tracing.py and instruction_trace.py). Compiled in with
+# GB_PYMULATOR_TRACING=1.
+TRACING = os.environ.get("GB_PYMULATOR_TRACING") == "1"
+
+# The lowest level of the log messages in the emulation loop (see logger.py) that are compiled in. It's INFO by
+# default, so the debug messages of e.g. every joypad poll cost nothing. Compiled in with GB_PYMULATOR_LOG_LEVEL=2.
+LOG_LEVEL = int(os.environ.get("GB_PYMULATOR_LOG_LEVEL", "3"))
+LOG_TRACE = LOG_LEVEL <= 1
+LOG_DEBUG = LOG_LEVEL <= 2
+LOG_INFO = LOG_LEVEL <= 3
+LOG_WARN = LOG_LEVEL <= 4
+
+
+def now_ns() -> int:
+    """ A clock for measuring durations """
+    return time.perf_counter_ns()
@@ -0,0 +1,29 @@
+import cython
+from gb_pymulator cimport build_options
+from gb_pymulator cimport logger
+
+cdef int CARTRIDGE_ROM_ONLY
+cdef int CARTRIDGE_MBC1
+cdef int CARTRIDGE_MBC3_RAM_BATTERY
+
+@cython.final
+cdef class Cartridge:
+
+    cdef readonly bytes data
+    cdef readonly bytearray ram
+
+    cdef int _cartridge_type
+    cdef bint _ram_enabled
+    cdef int _memory_bank_offset
+    cdef int _ram_offset
+    cdef const unsigned char[::1] _rom_view
+    cdef unsigned char[::1] _ram_view
+    cdef int _ram_size
+    cdef long long _unsupported_writes
+
+    cdef _attach_buffers(self)
+    cpdef tuple get_state(self)
+    cpdef set_state(self, tuple state)
+    cpdef int rom_bank(self) noexcept nogil
+    cpdef int read(self, int address) except -1 nogil
+    cpdef int write(self, int address, int value) except -1 nogil
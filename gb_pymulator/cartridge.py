@@ -1,28 +1,71 @@
+import copyreg
+
+try:
+    import cython
+except ImportError:
+    from gb_pymulator import cython_shim as cython
+
 from gb_pymulator.cartridge_header import CartridgeType
+from gb_pymulator import build_options
 from gb_pymulator import logger
 
+CARTRIDGE_ROM_ONLY = CartridgeType.ROM_ONLY.value
+CARTRIDGE_MBC1 = CartridgeType.MBC1.value
+CARTRIDGE_MBC3_RAM_BATTERY = CartridgeType.MBC3_BATTERY_BUFFERED_RAM.value
+
 
 class Cartridge:
-    def __init__(self, data, ram):
-        self._cartridge_type = CartridgeType(data[0x147])
+    def __init__(self, data: bytes, ram: bytearray):
+        self._cartridge_type = CartridgeType(data[0x147]).value
 
-        self._data = data
+        self.data = data
+        self.ram = ram
         self._ram_enabled = False
         self._memory_bank_offset = 0
-        self._ram = ram
         self._ram_offset = 0
+        # Writes to the registers that aren't emulated yet (they are logged, but not every time)
+        self._unsupported_writes = 0
+        self._attach_buffers()
+
+    def _attach_buffers(self):
+        # Typed views of the ROM and RAM, that can be accessed without holding the GIL
+        self._rom_view = self.data
+        self._ram_view = self.ram
+        self._ram_size = len(self.ram)
+
+    def __reduce__(self):
+        # The typed views can't be copied (or pickled) automatically, so the state is listed explicitly
+        return copyreg.__newobj__, (type(self),), (self.data, self.ram, self._cartridge_type, self.get_state())
+
+    def __setstate__(self, state):
+        self.data, self.ram, self._cartridge_type, banking = state
+        self._unsupported_writes = 0
+        self._attach_buffers()
+        self.set_state(banking)
+
+    def get_state(self) -> tuple:
+        # The RAM is saved separately, as bytes (and the ROM isn't saved at all)
+        return self._ram_enabled, self._memory_bank_offset, self._ram_offset
+
+    def set_state(self, state: tuple):
+        self._ram_enabled, self._memory_bank_offset, self._ram_offset = state
+
+    def rom_bank(self):
+        # The bank that is mapped at 0x4000-0x7FFF
+        return self._memory_bank_offset // 0x4000 + 1
 
     def read(self, address):
         if address < 0x4000:
-            value = self._data[address]
+            value = self._rom_view[address]
             return value
         elif 0x4000 <= address < 0x8000:
-            value = self._data[self._memory_bank_offset + address]
+            value = self._rom_view[self._memory_bank_offset + address]
             return value
         elif 0xA000 <= address < 0xC000:
-            return self._ram[self._ram_offset + address - 0xA000]
+            return self._ram_view[self._ram_offset + address - 0xA000]
         else:
-            raise ValueError(f"TODO: read from cartridge {hex(address)}")
+            with cython.gil:
+                raise ValueError(f"TODO: read from cartridge {hex(address)}")
 
     def write(self, address, value):
         if 0x0000 <= address < 0x2000:
@@ -31,23 +74,35 @@ class Cartridge:
             else:
                 self._ram_enabled = False
         elif 0x2000 <= address < 0x4000:
-            if self._cartridge_type == CartridgeType.ROM_ONLY:
+            if self._cartridge_type == CARTRIDGE_ROM_ONLY:
                 pass
-            elif self._cartridge_type in [CartridgeType.MBC1, CartridgeType.MBC3_BATTERY_BUFFERED_RAM]:
+            elif self._cartridge_type == CARTRIDGE_MBC1 or self._cartridge_type == CARTRIDGE_MBC3_RAM_BATTERY:
                 if value == 0:
                     self._memory_bank_offset = 0
                 else:
                     self._memory_bank_offset = (value - 1) * 0x4000
             else:
-                raise ValueError(f"TODO Handle write to cartridge type {self._cartridge_type}")
+                with cython.gil:
+                    raise ValueError(f"TODO Handle write to cartridge type {CartridgeType(self._cartridge_type)}")
         elif 0x4000 <= address < 0x6000:
             self._ram_offset = value * 0x2000
-            logger.info(f"Select RAM bank: {value}")
+            if build_options.LOG_DEBUG:
+                with cython.gil:
+                    logger.debug(f"Select RAM bank: {value}")
         elif 0x6000 <= address < 0x8000:
-            pass
-            logger.warn(f"TODO: RTC registers (clock). Writing {value} to {hex(address)}")
+            # The banking mode (MBC1) or the latching of the clock (MBC3), which games can write every frame
+            if build_options.LOG_WARN and self._cartridge_type != CARTRIDGE_ROM_ONLY:
+                self._unsupported_writes += 1
+                if logger.warning_due(self._unsupported_writes):
+                    with cython.gil:
+                        logger.warn_limited(self._unsupported_writes,
+                                            "TODO: banking mode select (MBC1). Writing {} to {:#x}"
+                                            if self._cartridge_type == CARTRIDGE_MBC1
+                                            else "TODO: RTC latch (MBC3 clock). Writing {} to {:#x}",
+                                            (value, address))
         elif 0xA000 <= address < 0xC000:
-            if self._ram:
-                self._ram[self._ram_offset + address - 0xA000] = value
+            if self._ram_size > 0:
+                self._ram_view[self._ram_offset + address - 0xA000] = value
         else:
-            raise ValueError(f"Write to ROM. rom[{hex(address)}] = {hex(value)}")
+            with cython.gil:
+                raise ValueError(f"Write to ROM. rom[{hex(address)}] = {hex(value)}")
@@ -0,0 +1,29 @@
+import cython
+from gb_pymulator cimport build_options
+
+cpdef int region(int address) noexcept nogil
+
+@cython.final
+cdef class Counters:
+
+    cdef readonly object opcode_counts
+    cdef readonly object region_reads
+    cdef readonly object region_writes
+    cdef readonly object io_reads
+    cdef readonly object io_writes
+    cdef long long[::1] _opcode_counts
+    cdef long long[::1] _region_reads
+    cdef long long[::1] _region_writes
+    cdef long long[::1] _io_reads
+    cdef long long[::1] _io_writes
+
+    cdef public long long cpu_ns
+    cdef public long long timer_ns
+    cdef public long long ppu_ns
+    cdef public long long input_ns
+    cdef public long long frames
+
+    cdef _attach_buffers(self)
+    cdef int count_opcode(self, int opcode) noexcept nogil
+    cdef int count_read(self, int address) noexcept nogil
+    cdef int count_write(self, int address) noexcept nogil
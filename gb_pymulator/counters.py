@@ -0,0 +1,155 @@
+"""
+Execution counters, for finding out where an emulated game spends its time: how often each opcode runs, the host time
+spent in the CPU, timer, PPU and input polling, and the memory accesses per region and per I/O register.
+
+The counters are compiled out unless the extension modules are built with GB_PYMULATOR_COUNTERS=1 (see setup.py), and
+then they are only collected for an emulator that has them enabled (with Emulator.enable_counters()).
+"""
+
+from array import array
+
+from gb_pymulator import build_options
+
+# Whether the counters are compiled in
+AVAILABLE = build_options.COUNTERS
+
+# The regions of the address space
+REGIONS = ["ROM0", "ROMX", "VRAM", "ERAM", "WRAM", "ECHO", "OAM", "UNUSED", "IO", "HRAM", "IE"]
+
+# Opcodes 0x100-0x1FF are the CB-prefixed ones
+NUM_OPCODES = 512
+
+IO_REGISTER_NAMES = {
+    0xFF00: "P1", 0xFF01: "SB", 0xFF02: "SC", 0xFF04: "DIV", 0xFF05: "TIMA", 0xFF06: "TMA", 0xFF07: "TAC",
+    0xFF0F: "IF", 0xFF40: "LCDC", 0xFF41: "STAT", 0xFF42: "SCY", 0xFF43: "SCX", 0xFF44: "LY", 0xFF45: "LYC",
+    0xFF46: "DMA", 0xFF47: "BGP", 0xFF48: "OBP0", 0xFF49: "OBP1", 0xFF4A: "WY", 0xFF4B: "WX", 0xFF50: "BOOT",
+    0xFFFF: "IE",
+}
+
+
+def region(address) -> int:
+    """ The index (in REGIONS) of the region that an address is in """
+    if address < 0x4000:
+        return 0
+    elif address < 0x8000:
+        return 1
+    elif address < 0xA000:
+        return 2
+    elif address < 0xC000:
+        return 3
+    elif address < 0xE000:
+        return 4
+    elif address < 0xFE00:
+        return 5
+    elif address < 0xFEA0:
+        return 6
+    elif address < 0xFF00:
+        return 7
+    elif address < 0xFF80:
+        return 8
+    elif address < 0xFFFF:
+        return 9
+    return 10
+
+
+def _zeros(n: int) -> array:
+    return array("q", bytes(8 * n))
+
+
+class Counters:
+    def __init__(self):
+        self.opcode_counts = _zeros(NUM_OPCODES)
+        self.region_reads = _zeros(len(REGIONS))
+        self.region_writes = _zeros(len(REGIONS))
+        # Indexed by address - 0xFF00 (so IE is the last one)
+        self.io_reads = _zeros(0x100)
+        self.io_writes = _zeros(0x100)
+        self._attach_buffers()
+
+        # Host time (in nanoseconds) spent in each part of the emulator
+        self.cpu_ns = 0
+        self.timer_ns = 0
+        self.ppu_ns = 0
+        self.input_ns = 0
+        self.frames = 0
+
+    def _attach_buffers(self):
+        # Typed views, that can be updated without holding the GIL
+        self._opcode_counts = self.opcode_counts
+        self._region_reads = self.region_reads
+        self._region_writes = self.region_writes
+        self._io_reads = self.io_reads
+        self._io_writes = self.io_writes
+
+    def reset(self):
+        for counts in (self.opcode_counts, self.region_reads, self.region_writes, self.io_reads, self.io_writes):
+            counts[:] = _zeros(len(counts))
+        self.cpu_ns = 0
+        self.timer_ns = 0
+        self.ppu_ns = 0
+        self.input_ns = 0
+        self.frames = 0
+
+    def count_opcode(self, opcode):
+        self._opcode_counts[opcode] += 1
+        return 0
+
+    def count_read(self, address):
+        self._region_reads[region(address)] += 1
+        if address >= 0xFF00 and (address < 0xFF80 or address == 0xFFFF):
+            self._io_reads[address - 0xFF00] += 1
+        return 0
+
+    def count_write(self, address):
+        self._region_writes[region(address)] += 1
+        if address >= 0xFF00 and (address < 0xFF80 or address == 0xFFFF):
+            self._io_writes[address - 0xFF00] += 1
+        return 0
+
+    def as_dict(self) -> dict:
+        """ The non-zero counters, keyed by name (e.g. "CB 7C" for an opcode, "LY" for an I/O register) """
+        return {
+            "frames": self.frames,
+            "ns_per_frame": {name: ns / max(self.frames, 1) for name, ns in self._times()},
+            "opcodes": {_opcode_name(opcode): count for opcode, count in enumerate(self.opcode_counts) if count},
+            "region_reads": {name: count for name, count in zip(REGIONS, self.region_reads) if count},
+            "region_writes": {name: count for name, count in zip(REGIONS, self.region_writes) if count},
+            "io_reads": {_io_name(index): count for index, count in enumerate(self.io_reads) if count},
+            "io_writes": {_io_name(index): count for index, count in enumerate(self.io_writes) if count},
+        }
+
+    def summary(self, top: int = 10) -> str:
+        """ A readable report, with the most frequent opcodes and I/O registers """
+        frames = max(self.frames, 1)
+        total_ns = max(sum(ns for _, ns in self._times()), 1)
+        lines = [f"{self.frames} frames. Host time per frame:"]
+        for name, ns in self._times():
+            lines.append(f"  {name:<8} {ns / frames / 1000:>9.1f} us {ns / total_ns * 100:>5.1f}%")
+
+        instructions = max(sum(self.opcode_counts), 1)
+        lines.append(f"Most frequent opcodes (of {sum(self.opcode_counts)}):")
+        for opcode in sorted(range(NUM_OPCODES), key=lambda o: self.opcode_counts[o], reverse=True)[:top]:
+            count = self.opcode_counts[opcode]
+            lines.append(f"  {_opcode_name(opcode):<8} {count:>12} {count / instructions * 100:>5.1f}%")
+
+        lines.append("Memory accesses per region (reads, writes):")
+        for name, reads, writes in zip(REGIONS, self.region_reads, self.region_writes):
+            if reads or writes:
+                lines.append(f"  {name:<8} {reads:>12} {writes:>12}")
+
+        lines.append("Most accessed I/O registers (reads, writes):")
+        for index in sorted(range(0x100), key=lambda i: self.io_reads[i] + self.io_writes[i], reverse=True)[:top]:
+            if self.io_reads[index] or self.io_writes[index]:
+                lines.append(f"  {_io_name(index):<8} {self.io_reads[index]:>12} {self.io_writes[index]:>12}")
+        return "\n".join(lines)
+
+    def _times(self):
+        return [("cpu", self.cpu_ns), ("timer", self.timer_ns), ("ppu", self.ppu_ns), ("input", self.input_ns)]
+
+
+def _opcode_name(opcode: int) -> str:
+    return f"CB {opcode - 0x100:02X}" if opcode >= 0x100 else f"{opcode:02X}"
+
+
+def _io_name(index: int) -> str:
+    return IO_REGISTER_NAMES.get(0xFF00 + index, f"{0xFF00 + index:04X}")
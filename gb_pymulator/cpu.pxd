@@ -0,0 +1,44 @@
+import cython
+
+from gb_pymulator.motherboard cimport Motherboard, Memory, Registers
+from gb_pymulator cimport build_options
+from gb_pymulator cimport logger
+
+cdef int FLAG_Z, FLAG_N, FLAG_H, FLAG_C
+cdef int _ADDR_HL
+
+cpdef int execute(Motherboard motherboard) except -1 nogil
+
+@cython.locals(opcode=int, r=int, value=int, result=int, address=int, offset=int, hl=int)
+cdef int _execute(Motherboard motherboard, Registers reg, Memory memory) except -1 nogil
+
+@cython.locals(r=int, bit=int, value=int, result=int, carry=int)
+cdef int _execute_extended(Registers reg, Memory memory, int opcode) except -1 nogil
+
+# Fast paths for memory accesses
+cdef int _read(Memory memory, int address) except -1 nogil
+cdef int _write(Memory memory, int address, int value) except -1 nogil
+
+@cython.locals(value=int)
+cdef int _fetch_u8(Motherboard motherboard, Memory memory) except -1 nogil
+@cython.locals(value=int)
+cdef int _fetch_i8(Motherboard motherboard, Memory memory) except? -1 nogil
+@cython.locals(low=int)
+cdef int _fetch_u16(Motherboard motherboard, Memory memory) except -1 nogil
+
+cdef int _read_r8(Registers reg, Memory memory, int r) except -1 nogil
+cdef int _write_r8(Registers reg, Memory memory, int r, int value) except -1 nogil
+
+cdef int _read_r16(Registers reg, int rr) noexcept nogil
+cdef void _write_r16(Registers reg, int rr, int value) noexcept nogil
+cdef void _set_hl(Registers reg, int value) noexcept nogil
+cdef bint _condition(Registers reg, int cc) noexcept nogil
+
+@cython.locals(sp=int)
+cdef int _add_sp_offset(Registers reg, int offset) noexcept nogil
+
+@cython.locals(a=int, result=int, carry=int)
+cdef void _alu(Registers reg, int operation, int value) noexcept nogil
+
+@cython.locals(a=int)
+cdef void _daa(Registers reg) noexcept nogil
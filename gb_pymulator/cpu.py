@@ -0,0 +1,604 @@
+"""
+The CPU core: fetches, decodes and executes one instruction at a time, directly on the typed machine state.
+
+Opcodes are dispatched with one if/elif chain on the opcode, which Cython compiles to a C switch. The regular blocks
+(LD r,r' and the 8-bit arithmetic) are decoded from the bits of the opcode instead. Nothing here touches a Python
+object, so the compiled core runs without holding the GIL.
+
+Instructions behave like the ones in instructions.py (which are used during startup, and serve as the reference).
+"""
+
+try:
+    import cython
+except ImportError:
+    from gb_pymulator import cython_shim as cython
+
+from gb_pymulator import build_options
+from gb_pymulator import logger
+
+FLAG_Z = 0b1000_0000
+FLAG_N = 0b0100_0000
+FLAG_H = 0b0010_0000
+FLAG_C = 0b0001_0000
+
+# (HL) in the operand encoding used in opcodes: B, C, D, E, H, L, (HL), A
+_ADDR_HL = 6
+
+
+def execute(motherboard) -> int:
+    """ Execute the instruction at the program counter. Returns the number of cycles it took. """
+    return _execute(motherboard, motherboard.reg, motherboard.memory)
+
+
+def _execute(motherboard, reg, memory) -> int:
+    opcode = _fetch_u8(motherboard, memory)
+    if build_options.COUNTERS and memory.counters is not None:
+        memory.counters.count_opcode(opcode)
+
+    if 0x40 <= opcode < 0x80:
+        if opcode == 0x76:
+            # HALT
+            motherboard.halted = True
+            return 4
+        # LD r, r'
+        _write_r8(reg, memory, (opcode >> 3) & 7, _read_r8(reg, memory, opcode & 7))
+        return 8 if opcode & 7 == _ADDR_HL or (opcode >> 3) & 7 == _ADDR_HL else 4
+
+    if 0x80 <= opcode < 0xC0:
+        # ADD, ADC, SUB, SBC, AND, XOR, OR, CP
+        _alu(reg, (opcode >> 3) & 7, _read_r8(reg, memory, opcode & 7))
+        return 8 if opcode & 7 == _ADDR_HL else 4
+
+    if opcode == 0x00:
+        # NOP
+        return 4
+
+    # -------------------
+    #   8-bit loads
+    # -------------------
+
+    elif opcode in (0x06, 0x0E, 0x16, 0x1E, 0x26, 0x2E, 0x36, 0x3E):
+        # LD r, d8
+        r = (opcode >> 3) & 7
+        _write_r8(reg, memory, r, _fetch_u8(motherboard, memory))
+        return 12 if r == _ADDR_HL else 8
+    elif opcode == 0x02:
+        _write(memory, (reg.B << 8) | reg.C, reg.A)
+        return 8
+    elif opcode == 0x12:
+        _write(memory, (reg.D << 8) | reg.E, reg.A)
+        return 8
+    elif opcode == 0x22 or opcode == 0x32:
+        # LDI (HL), A / LDD (HL), A
+        address = (reg.H << 8) | reg.L
+        _write(memory, address, reg.A)
+        _set_hl(reg, address + 1 if opcode == 0x22 else address - 1)
+        return 8
+    elif opcode == 0x0A:
+        reg.A = _read(memory, (reg.B << 8) | reg.C)
+        return 8
+    elif opcode == 0x1A:
+        reg.A = _read(memory, (reg.D << 8) | reg.E)
+        return 8
+    elif opcode == 0x2A or opcode == 0x3A:
+        # LDI A, (HL) / LDD A, (HL)
+        address = (reg.H << 8) | reg.L
+        reg.A = _read(memory, address)
+        _set_hl(reg, address + 1 if opcode == 0x2A else address - 1)
+        return 8
+    elif opcode == 0xE0:
+        _write(memory, 0xFF00 + _fetch_u8(motherboard, memory), reg.A)
+        return 12
+    elif opcode == 0xF0:
+        reg.A = _read(memory, 0xFF00 + _fetch_u8(motherboard, memory))
+        return 12
+    elif opcode == 0xE2:
+        _write(memory, 0xFF00 + reg.C, reg.A)
+        return 8
+    elif opcode == 0xF2:
+        reg.A = _read(memory, 0xFF00 + reg.C)
+        return 8
+    elif opcode == 0xEA:
+        _write(memory, _fetch_u16(motherboard, memory), reg.A)
+        return 16
+    elif opcode == 0xFA:
+        reg.A = _read(memory, _fetch_u16(motherboard, memory))
+        return 16
+
+    # -------------------
+    #   16-bit loads
+    # -------------------
+
+    elif opcode == 0x01:
+        value = _fetch_u16(motherboard, memory)
+        reg.B = value >> 8
+        reg.C = value & 0xFF
+        return 12
+    elif opcode == 0x11:
+        value = _fetch_u16(motherboard, memory)
+        reg.D = value >> 8
+        reg.E = value & 0xFF
+        return 12
+    elif opcode == 0x21:
+        _set_hl(reg, _fetch_u16(motherboard, memory))
+        return 12
+    elif opcode == 0x31:
+        reg.stack_pointer = _fetch_u16(motherboard, memory)
+        return 12
+    elif opcode == 0x08:
+        address = _fetch_u16(motherboard, memory)
+        _write(memory, address, reg.stack_pointer & 0xFF)
+        _write(memory, address + 1, reg.stack_pointer >> 8)
+        return 20
+    elif opcode == 0xF9:
+        reg.stack_pointer = (reg.H << 8) | reg.L
+        return 8
+    elif opcode == 0xF8:
+        # LD HL, SP + r8
+        _set_hl(reg, _add_sp_offset(reg, _fetch_u8(motherboard, memory)))
+        return 12
+    elif opcode == 0xE8:
+        # ADD SP, r8
+        reg.stack_pointer = _add_sp_offset(reg, _fetch_u8(motherboard, memory))
+        return 16
+    elif opcode == 0xC1:
+        value = motherboard.pop_from_stack()
+        reg.B = value >> 8
+        reg.C = value & 0xFF
+        return 12
+    elif opcode == 0xD1:
+        value = motherboard.pop_from_stack()
+        reg.D = value >> 8
+        reg.E = value & 0xFF
+        return 12
+    elif opcode == 0xE1:
+        _set_hl(reg, motherboard.pop_from_stack())
+        return 12
+    elif opcode == 0xF1:
+        value = motherboard.pop_from_stack()
+        reg.A = value >> 8
+        reg.F = value & 0xF0
+        return 12
+    elif opcode == 0xC5:
+        motherboard.push_to_stack((reg.B << 8) | reg.C)
+        return 16
+    elif opcode == 0xD5:
+        motherboard.push_to_stack((reg.D << 8) | reg.E)
+        return 16
+    elif opcode == 0xE5:
+        motherboard.push_to_stack((reg.H << 8) | reg.L)
+        return 16
+    elif opcode == 0xF5:
+        motherboard.push_to_stack((reg.A << 8) | reg.F)
+        return 16
+
+    # -------------------
+    #   Arithmetic
+    # -------------------
+
+    elif opcode in (0x04, 0x0C, 0x14, 0x1C, 0x24, 0x2C, 0x34, 0x3C):
+        # INC r
+        r = (opcode >> 3) & 7
+        value = _read_r8(reg, memory, r)
+        result = (value + 1) & 0xFF
+        _write_r8(reg, memory, r, result)
+        reg.F = (reg.F & FLAG_C) | (FLAG_Z if result == 0 else 0) | (FLAG_H if value & 0xF == 0xF else 0)
+        return 12 if r == _ADDR_HL else 4
+    elif opcode in (0x05, 0x0D, 0x15, 0x1D, 0x25, 0x2D, 0x35, 0x3D):
+        # DEC r
+        r = (opcode >> 3) & 7
+        value = _read_r8(reg, memory, r)
+        result = (value - 1) & 0xFF
+        _write_r8(reg, memory, r, result)
+        reg.F = (reg.F & FLAG_C) | FLAG_N | (FLAG_Z if result == 0 else 0) | (FLAG_H if value & 0xF == 0 else 0)
+        return 12 if r == _ADDR_HL else 4
+    elif opcode in (0x03, 0x13, 0x23, 0x33):
+        # INC rr
+        _write_r16(reg, opcode >> 4, _read_r16(reg, opcode >> 4) + 1)
+        return 8
+    elif opcode in (0x0B, 0x1B, 0x2B, 0x3B):
+        # DEC rr
+        _write_r16(reg, opcode >> 4, _read_r16(reg, opcode >> 4) - 1)
+        return 8
+    elif opcode in (0x09, 0x19, 0x29, 0x39):
+        # ADD HL, rr
+        hl = (reg.H << 8) | reg.L
+        value = _read_r16(reg, opcode >> 4)
+        result = hl + value
+        _set_hl(reg, result)
+        reg.F = ((reg.F & FLAG_Z) | (FLAG_H if (hl & 0xFFF) + (value & 0xFFF) > 0xFFF else 0)
+                 | (FLAG_C if result > 0xFFFF else 0))
+        return 8
+    elif opcode in (0xC6, 0xCE, 0xD6, 0xDE, 0xE6, 0xEE, 0xF6, 0xFE):
+        # ADD, ADC, SUB, SBC, AND, XOR, OR, CP with d8
+        _alu(reg, (opcode >> 3) & 7, _fetch_u8(motherboard, memory))
+        return 8
+    elif opcode == 0x27:
+        _daa(reg)
+        return 4
+    elif opcode == 0x2F:
+        # CPL
+        reg.A = ~reg.A & 0xFF
+        reg.F |= FLAG_N | FLAG_H
+        return 4
+    elif opcode == 0x37:
+        # SCF
+        reg.F = (reg.F & FLAG_Z) | FLAG_C
+        return 4
+    elif opcode == 0x3F:
+        # CCF
+        reg.F = (reg.F & FLAG_Z) | (reg.F & FLAG_C ^ FLAG_C)
+        return 4
+
+    # -------------------
+    #   Rotations of A
+    # -------------------
+
+    elif opcode == 0x07:
+        # RLCA
+        value = reg.A
+        reg.A = ((value << 1) | (value >> 7)) & 0xFF
+        reg.F = FLAG_C if value & 0x80 else 0
+        return 4
+    elif opcode == 0x0F:
+        # RRCA
+        value = reg.A
+        reg.A = (value >> 1) | ((value & 1) << 7)
+        reg.F = FLAG_C if value & 1 else 0
+        return 4
+    elif opcode == 0x17:
+        # RLA
+        value = reg.A
+        reg.A = ((value << 1) | (1 if reg.F & FLAG_C else 0)) & 0xFF
+        reg.F = FLAG_C if value & 0x80 else 0
+        return 4
+    elif opcode == 0x1F:
+        # RRA
+        value = reg.A
+        reg.A = (value >> 1) | (0x80 if reg.F & FLAG_C else 0)
+        reg.F = FLAG_C if value & 1 else 0
+        return 4
+
+    # -------------------
+    #   Jumps and calls
+    # -------------------
+
+    elif opcode == 0x18:
+        offset = _fetch_i8(motherboard, memory)
+        motherboard.program_counter += offset
+        return 12
+    elif opcode in (0x20, 0x28, 0x30, 0x38):
+        # JR cc
+        offset = _fetch_i8(motherboard, memory)
+        if _condition(reg, (opcode >> 3) & 3):
+            motherboard.program_counter += offset
+            return 12
+        return 8
+    elif opcode == 0xC3:
+        motherboard.program_counter = _fetch_u16(motherboard, memory)
+        return 16
+    elif opcode in (0xC2, 0xCA, 0xD2, 0xDA):
+        # JP cc
+        address = _fetch_u16(motherboard, memory)
+        if _condition(reg, (opcode >> 3) & 3):
+            motherboard.program_counter = address
+            return 16
+        return 12
+    elif opcode == 0xE9:
+        motherboard.program_counter = (reg.H << 8) | reg.L
+        return 4
+    elif opcode == 0xCD:
+        address = _fetch_u16(motherboard, memory)
+        motherboard.push_to_stack(motherboard.program_counter)
+        motherboard.program_counter = address
+        return 24
+    elif opcode in (0xC4, 0xCC, 0xD4, 0xDC):
+        # CALL cc
+        address = _fetch_u16(motherboard, memory)
+        if _condition(reg, (opcode >> 3) & 3):
+            motherboard.push_to_stack(motherboard.program_counter)
+            motherboard.program_counter = address
+            return 24
+        return 12
+    elif opcode == 0xC9:
+        motherboard.program_counter = motherboard.pop_from_stack()
+        return 16
+    elif opcode in (0xC0, 0xC8, 0xD0, 0xD8):
+        # RET cc
+        if _condition(reg, (opcode >> 3) & 3):
+            motherboard.program_counter = motherboard.pop_from_stack()
+            return 20
+        return 8
+    elif opcode == 0xD9:
+        # RETI
+        motherboard.program_counter = motherboard.pop_from_stack()
+        motherboard.IME_flag = True
+        return 16
+    elif opcode in (0xC7, 0xCF, 0xD7, 0xDF, 0xE7, 0xEF, 0xF7, 0xFF):
+        # RST
+        motherboard.push_to_stack(motherboard.program_counter)
+        motherboard.program_counter = opcode & 0b0011_1000
+        return 16
+
+    # -------------------
+    #   Control
+    # -------------------
+
+    elif opcode == 0xF3:
+        motherboard.disable_interrupts_after_next_instruction()
+        return 4
+    elif opcode == 0xFB:
+        motherboard.enable_interrupts_after_next_instruction()
+        return 4
+    elif opcode == 0x10:
+        if _fetch_u8(motherboard, memory) != 0x00:
+            with cython.gil:
+                raise ValueError(f"Invalid opcode! {hex(opcode)}. (Expected 0x00 after STOP)")
+        motherboard.stopped = True
+        _write(memory, 0xFF04, 0)  # Write to DIV
+        if build_options.LOG_INFO:
+            with cython.gil:
+                logger.info("Stopping CPU and LCD")
+        return 4
+    elif opcode == 0xCB:
+        return _execute_extended(reg, memory, _fetch_u8(motherboard, memory))
+
+    with cython.gil:
+        raise ValueError(f"Unknown opcode: {hex(opcode)}")
+
+
+def _execute_extended(reg, memory, opcode) -> int:
+    if build_options.COUNTERS and memory.counters is not None:
+        memory.counters.count_opcode(0x100 + opcode)
+
+    r = opcode & 7
+    bit = (opcode >> 3) & 7
+    value = _read_r8(reg, memory, r)
+
+    if opcode < 0x40:
+        # Rotations and shifts. The bit field selects the operation.
+        carry = 1 if reg.F & FLAG_C else 0
+        if bit == 0:
+            # RLC
+            carry = value >> 7
+            result = ((value << 1) | carry) & 0xFF
+        elif bit == 1:
+            # RRC
+            result = (value >> 1) | ((value & 1) << 7)
+            carry = value & 1
+        elif bit == 2:
+            # RL
+            result = ((value << 1) | carry) & 0xFF
+            carry = value >> 7
+        elif bit == 3:
+            # RR
+            result = (value >> 1) | (carry << 7)
+            carry = value & 1
+        elif bit == 4:
+            # SLA
+            result = (value << 1) & 0xFF
+            carry = value >> 7
+        elif bit == 5:
+            # SRA
+            result = (value >> 1) | (value & 0x80)
+            carry = value & 1
+        elif bit == 6:
+            # SWAP
+            result = ((value & 0x0F) << 4) | (value >> 4)
+            carry = 0
+        else:
+            # SRL
+            result = value >> 1
+            carry = value & 1
+        _write_r8(reg, memory, r, result)
+        reg.F = (FLAG_Z if result == 0 else 0) | (FLAG_C if carry else 0)
+    elif opcode < 0x80:
+        # BIT
+        reg.F = (reg.F & FLAG_C) | FLAG_H | (0 if value & (1 << bit) else FLAG_Z)
+        return 12 if r == _ADDR_HL else 8
+    elif opcode < 0xC0:
+        # RES
+        _write_r8(reg, memory, r, value & ~(1 << bit))
+    else:
+        # SET
+        _write_r8(reg, memory, r, value | (1 << bit))
+
+    return 16 if r == _ADDR_HL else 8
+
+
+def _read(memory, address) -> int:
+    if ((build_options.COUNTERS and memory.counters is not None)
+            or (build_options.TRACING and memory.instruction_trace is not None)):
+        # Through the memory map, which counts (or traces) the access
+        return memory.read(address)
+
+    # Fast paths for the most frequent accesses (code in the first ROM bank, and work RAM), that bypass the memory map
+    if address < 0x4000:
+        return memory._rom0[address]
+    elif 0xC000 <= address < 0xE000:
+        return memory._internal_ram[address - 0xC000]
+    elif 0xFF80 <= address < 0xFFFF:
+        return memory._high_internal_ram[address - 0xFF80]
+    return memory.read(address)
+
+
+def _write(memory, address, value):
+    if ((build_options.COUNTERS and memory.counters is not None)
+            or (build_options.TRACING and memory.instruction_trace is not None)):
+        return memory.write(address, value)
+
+    if 0xC000 <= address < 0xE000:
+        memory._internal_ram[address - 0xC000] = value & 0xFF
+    elif 0xFF80 <= address < 0xFFFF:
+        memory._high_internal_ram[address - 0xFF80] = value & 0xFF
+    else:
+        memory.write(address, value)
+    return 0
+
+
+def _fetch_u8(motherboard, memory) -> int:
+    value = _read(memory, motherboard.program_counter)
+    motherboard.program_counter += 1
+    return value
+
+
+def _fetch_i8(motherboard, memory) -> int:
+    value = _fetch_u8(motherboard, memory)
+    return value - 0x100 if value & 0x80 else value
+
+
+def _fetch_u16(motherboard, memory) -> int:
+    low = _fetch_u8(motherboard, memory)
+    return low | (_fetch_u8(motherboard, memory) << 8)
+
+
+def _read_r8(reg, memory, r) -> int:
+    if r == 0:
+        return reg.B
+    elif r == 1:
+        return reg.C
+    elif r == 2:
+        return reg.D
+    elif r == 3:
+        return reg.E
+    elif r == 4:
+        return reg.H
+    elif r == 5:
+        return reg.L
+    elif r == _ADDR_HL:
+        return _read(memory, (reg.H << 8) | reg.L)
+    return reg.A
+
+
+def _write_r8(reg, memory, r, value):
+    value &= 0xFF
+    if r == 0:
+        reg.B = value
+    elif r == 1:
+        reg.C = value
+    elif r == 2:
+        reg.D = value
+    elif r == 3:
+        reg.E = value
+    elif r == 4:
+        reg.H = value
+    elif r == 5:
+        reg.L = value
+    elif r == _ADDR_HL:
+        _write(memory, (reg.H << 8) | reg.L, value)
+    else:
+        reg.A = value
+    return 0
+
+
+def _read_r16(reg, rr) -> int:
+    # Operand encoding used in opcodes: BC, DE, HL, SP
+    if rr == 0:
+        return (reg.B << 8) | reg.C
+    elif rr == 1:
+        return (reg.D << 8) | reg.E
+    elif rr == 2:
+        return (reg.H << 8) | reg.L
+    return reg.stack_pointer
+
+
+def _write_r16(reg, rr, value):
+    value &= 0xFFFF
+    if rr == 0:
+        reg.B = value >> 8
+        reg.C = value & 0xFF
+    elif rr == 1:
+        reg.D = value >> 8
+        reg.E = value & 0xFF
+    elif rr == 2:
+        _set_hl(reg, value)
+    else:
+        reg.stack_pointer = value
+
+
+def _set_hl(reg, value):
+    value &= 0xFFFF
+    reg.H = value >> 8
+    reg.L = value & 0xFF
+
+
+def _condition(reg, cc) -> bool:
+    # NZ, Z, NC, C
+    if cc == 0:
+        return reg.F & FLAG_Z == 0
+    elif cc == 1:
+        return reg.F & FLAG_Z != 0
+    elif cc == 2:
+        return reg.F & FLAG_C == 0
+    return reg.F & FLAG_C != 0
+
+
+def _add_sp_offset(reg, offset) -> int:
+    # The flags are computed from the unsigned offset, while the signed offset is added
+    sp = reg.stack_pointer
+    reg.F = ((FLAG_H if (sp & 0xF) + (offset & 0xF) > 0xF else 0)
+             | (FLAG_C if (sp & 0xFF) + offset > 0xFF else 0))
+    return (sp + offset - 0x100 if offset & 0x80 else sp + offset) & 0xFFFF
+
+
+def _alu(reg, operation, value):
+    a = reg.A
+    if operation == 0:
+        # ADD
+        result = a + value
+        reg.F = ((FLAG_Z if result & 0xFF == 0 else 0) | (FLAG_H if (a & 0xF) + (value & 0xF) > 0xF else 0)
+                 | (FLAG_C if result > 0xFF else 0))
+        reg.A = result & 0xFF
+    elif operation == 1:
+        # ADC
+        carry = 1 if reg.F & FLAG_C else 0
+        result = a + value + carry
+        reg.F = ((FLAG_Z if result & 0xFF == 0 else 0) | (FLAG_H if (a & 0xF) + (value & 0xF) + carry > 0xF else 0)
+                 | (FLAG_C if result > 0xFF else 0))
+        reg.A = result & 0xFF
+    elif operation == 2 or operation == 7:
+        # SUB, CP
+        result = a - value
+        reg.F = (FLAG_N | (FLAG_Z if result == 0 else 0) | (FLAG_H if (a & 0xF) < (value & 0xF) else 0)
+                 | (FLAG_C if result < 0 else 0))
+        if operation == 2:
+            reg.A = result & 0xFF
+    elif operation == 3:
+        # SBC
+        carry = 1 if reg.F & FLAG_C else 0
+        result = a - value - carry
+        reg.F = (FLAG_N | (FLAG_Z if result & 0xFF == 0 else 0)
+                 | (FLAG_H if (a & 0xF) - (value & 0xF) - carry < 0 else 0) | (FLAG_C if result < 0 else 0))
+        reg.A = result & 0xFF
+    elif operation == 4:
+        # AND
+        reg.A = a & value
+        reg.F = FLAG_H | (FLAG_Z if reg.A == 0 else 0)
+    elif operation == 5:
+        # XOR
+        reg.A = a ^ value
+        reg.F = FLAG_Z if reg.A == 0 else 0
+    else:
+        # OR
+        reg.A = a | value
+        reg.F = FLAG_Z if reg.A == 0 else 0
+
+
+def _daa(reg):
+    # Algorithm copied from https://forums.nesdev.com/viewtopic.php?t=15944
+    a = reg.A
+    if not reg.F & FLAG_N:
+        # after an addition, adjust if (half-)carry occurred or if result is out of bounds
+        if reg.F & FLAG_C or a > 0x99:
+            a += 0x60
+            reg.F |= FLAG_C
+        if reg.F & FLAG_H or (a & 0x0F) > 0x09:
+            a += 0x6
+    else:
+        # after a subtraction, only adjust if (half-)carry occurred
+        if reg.F & FLAG_C:
+            a -= 0x60
+        if reg.F & FLAG_H:
+            a -= 0x6
+    reg.A = a & 0xFF
+    reg.F = (reg.F & (FLAG_N | FLAG_C)) | (FLAG_Z if reg.A == 0 else 0)
@@ -0,0 +1,12 @@
+"""
+Stand-in for the parts of the cython module that the emulator uses, for when Cython isn't installed. The emulator
+then runs as plain Python (and never releases the GIL).
+"""
+
+from contextlib import nullcontext
+
+compiled = False
+
+# Used as "with cython.nogil:" and "with cython.gil:"
+nogil = nullcontext()
+gil = nullcontext()
@@ -1,12 +1,18 @@
-# cython: profile=True
 import cython
 
-cdef list COLORS
+@cython.locals(signed_offset=int, tile_offset=int)
+cdef int _tile_offset_8800_method(int tile_byte_size, int tile_number) noexcept nogil
 
+@cython.locals(tile_offset=int)
+cdef int _tile_offset_8000_method(int tile_byte_size, int tile_number) noexcept nogil
+
+@cython.final
 cdef class Display:
 
-    cdef public int[0x2000] VRAM
-    cdef public int[0xA0] OAM
+    cdef readonly bytearray VRAM
+    cdef readonly bytearray OAM
+    cdef unsigned char[::1] _vram
+    cdef unsigned char[::1] _oam
 
     cdef int LCDC
     cdef int STAT
@@ -21,32 +27,34 @@ cdef class Display:
     cdef int WX
     cdef int IE
 
-    cdef _screen
-    cdef int[160 * 144 * 3] _pixel_buffer
+    cdef readonly bytearray pixel_buffer
+    cdef unsigned char[::1] _pixels
     cdef int[160 * 144] _bg_pixel_color_indices
-    cdef _tiledata_surface
-    cdef _joypad
-    cdef int _last_draw
-    cdef int _last_draw_debug
-    cdef list _colors
+    cdef int[4 * 3] _colors
     cdef int _color_map_index
-
-    cdef int _key_down
-    cdef int _key_up
-    cdef int _key_left
-    cdef int _key_right
-    cdef int _key_start
-    cdef int _key_select
-    cdef int _key_a
-    cdef int _key_b
-
-    cpdef int advance_one_scanline(self)
-    cdef int handle_user_input(self)
-
-    @cython.locals(current_time=int)
-    cdef _redraw_screen(self)
-    # TODO optimize _draw_line with more static local vars
-    @cython.locals(bg_window_tile_data_select=int, tile_byte_size=int, bg_colors=list, sprite_colors_0=list, sprite_colors_1=list, bg_tilemap_address=int, bg_tile_hor_index=int, bg_tile_ver_index=int, tile_index=int)
-    cdef _draw_line(self)
-    @cython.locals(byte_offset=int, line_lsb=int, line_msb=int, lsb=int, msb=int, color_index=int, screen_pixel_x=int, buffer_offset=int, x=int, color=tuple, screen_position=int[2])
-    cdef _draw_tile_line(self, list colors, int offset_x, int y_inside_tile, int tile_offset, bint sprite, bint x_flip, bint sprite_covered_by_bg)
\ No newline at end of file
+    cdef _frontend
+    cdef int _cycles_until_next_scanline
+
+    cdef _attach_buffers(self)
+    cpdef tuple get_state(self)
+    cpdef set_state(self, tuple state)
+    cpdef cycle_color_map(self)
+    cdef _set_colors(self)
+    cpdef int write_reg(self, int address, int value) except -1 nogil
+    cpdef int read_reg(self, int address) except -1 nogil
+    cpdef int update(self, int cycle_delta) except -1 nogil
+    @cython.locals(interrupt_flag=int)
+    cpdef int advance_one_scanline(self) except -1 nogil
+
+    cdef int _redraw_screen(self) except -1 nogil
+    @cython.locals(bg_window_tile_data_select=int, tile_byte_size=int, bg_tilemap_address=int,
+                   bg_tile_hor_index=int, bg_tile_ver_index=int, bg_tile_index=int, tile_index=int, tile_offset=int,
+                   offset_x=int, y_inside_tile=int, window_tilemap_address=int, window_tile_ver_index=int,
+                   window_tile_hor_index=int, window_tile_index=int, sprites_drawn=int, spr_index=int,
+                   spr_offset=int, spr_screen_y=int, spr_screen_x=int, sprite_flags=int, sprite_covered_by_bg=bint,
+                   x_flip=bint, palette=int)
+    cdef int _draw_line(self) except -1 nogil
+    @cython.locals(byte_offset=int, line_lsb=int, line_msb=int, lsb=int, msb=int, color_index=int,
+                   screen_pixel_x=int, pixel_index=int, buffer_offset=int, x=int, color=int)
+    cdef void _draw_tile_line(self, int palette, int offset_x, int y_inside_tile, int tile_offset, bint sprite,
+                              bint x_flip, bint sprite_covered_by_bg) noexcept nogil
@@ -1,11 +1,11 @@
-# cython: profile=True
+import copyreg
 
-import pygame
-from pygame.surface import Surface
+try:
+    import cython
+except ImportError:
+    from gb_pymulator import cython_shim as cython
 
-from gb_pymulator.joypad import JoyPad
-from gb_pymulator import logger
-from gb_pymulator.key_bindings import UserInputKeyBindings
+from gb_pymulator.frontend import Frontend
 
 MARGIN = 10
 
@@ -46,17 +46,15 @@ def _tile_offset_8000_method(tile_byte_size, tile_number):
 
 
 class Display:
-    def __init__(self, joypad: JoyPad, user_input_key_bindings: UserInputKeyBindings):
-        # screen_resolution = (160 + MARGIN + 256 + 20, 256)
-        screen_resolution = (160, 144)
+    def __init__(self, frontend: Frontend):
 
         # In VRAM there are three "blocks" of 128 tiles each:
         # Block 0 is $8000-87FF
         # Block 1 is $8800-8FFF
         # Block 2 is $9000-97FF
-        self.VRAM = [0] * 0x2000  # 8kB video ram
+        self.VRAM = bytearray(0x2000)  # 8kB video ram
 
-        self.OAM = [0] * 0xA0  # 160B sprite attribute table
+        self.OAM = bytearray(0xA0)  # 160B sprite attribute table
 
         self.LCDC = 0  # LCD control register
         self.STAT = 0  # LCDC status
@@ -71,37 +69,58 @@ class Display:
         self.WX = 0  # Window X Position ($FF4B)
         self.IE = 0  # Interrupt Enable ($FFFF)
 
-        self._screen = pygame.display.set_mode((screen_resolution[0] * 2, screen_resolution[1] * 2))
-        self._pixel_buffer = [0] * 160 * 144 * 3
+        # 160x144 RGB. Frontends read the frame from here when it's presented.
+        self.pixel_buffer = bytearray(160 * 144 * 3)
+        self._attach_buffers()
         self._bg_pixel_color_indices = [0] * 160 * 144
-        self._tiledata_surface = Surface((256, 256))
-        self._joypad = joypad
-        self._screen.fill((0, 0, 0))
-        logger.debug("Initializing pygame")
-        pygame.init()
-        pygame.display.update()
-        logger.debug("Pygame initialized")
-        self._last_draw = pygame.time.get_ticks()
-        self._last_draw_debug = pygame.time.get_ticks()
 
         # Dynamic color maps are features of the emulator and not properties of the gameboy console itself.
         self._color_map_index = 0
-        self._colors = COLOR_MAPS[self._color_map_index]
-
-        self._key_down = user_input_key_bindings.down
-        self._key_up = user_input_key_bindings.up
-        self._key_left = user_input_key_bindings.left
-        self._key_right = user_input_key_bindings.right
-        self._key_start = user_input_key_bindings.start
-        self._key_select = user_input_key_bindings.select
-        self._key_a = user_input_key_bindings.a
-        self._key_b = user_input_key_bindings.b
-
-    @staticmethod
-    def set_title(title: str):
-        pygame.display.set_caption(title)
-
-    def write_reg(self, address: int, value: int):
+        self._set_colors()
+
+        self._cycles_until_next_scanline = 0
+
+        self._frontend = frontend
+        frontend.attach(self)
+
+    def _attach_buffers(self):
+        # Typed views, that can be accessed without holding the GIL
+        self._vram = self.VRAM
+        self._oam = self.OAM
+        self._pixels = self.pixel_buffer
+
+    def __reduce__(self):
+        # The typed views can't be copied (or pickled) automatically, so the state is listed explicitly
+        return copyreg.__newobj__, (type(self),), (
+            self.VRAM, self.OAM, self.get_state(), self.pixel_buffer, list(self._bg_pixel_color_indices),
+            self._color_map_index, self._frontend)
+
+    def __setstate__(self, state):
+        (self.VRAM, self.OAM, registers, self.pixel_buffer, bg_pixel_color_indices, self._color_map_index,
+         self._frontend) = state
+        self._bg_pixel_color_indices = bg_pixel_color_indices
+        self._attach_buffers()
+        self._set_colors()
+        self.set_state(registers)
+
+    def get_state(self) -> tuple:
+        # VRAM and OAM are saved separately, as bytes. The frame itself isn't part of the state; it's redrawn.
+        return (self.LCDC, self.STAT, self.SCY, self.SCX, self.LY, self.LYC, self.BGP, self.OBP0, self.OBP1, self.WY,
+                self.WX, self.IE, self._cycles_until_next_scanline)
+
+    def set_state(self, state: tuple):
+        (self.LCDC, self.STAT, self.SCY, self.SCX, self.LY, self.LYC, self.BGP, self.OBP0, self.OBP1, self.WY,
+         self.WX, self.IE, self._cycles_until_next_scanline) = state
+
+    def cycle_color_map(self):
+        self._color_map_index = (self._color_map_index + 1) % len(COLOR_MAPS)
+        self._set_colors()
+
+    def _set_colors(self):
+        # Flattened to 4 x RGB
+        self._colors = [component for color in COLOR_MAPS[self._color_map_index] for component in color]
+
+    def write_reg(self, address, value):
         if address == 0xFF40:
             self.LCDC = value
         elif address == 0xFF41:
@@ -126,9 +145,11 @@ class Display:
         elif address == 0xFF4B:
             self.WX = value
         else:
-            raise ValueError(f"write {hex(address)}")
+            with cython.gil:
+                raise ValueError(f"write {hex(address)}")
+        return 0
 
-    def read_reg(self, address: int):
+    def read_reg(self, address):
         if address == 0xFF40:
             return self.LCDC
         elif address == 0xFF41:
@@ -152,7 +173,16 @@ class Display:
         elif address == 0xFF4B:
             return self.WX
         else:
-            raise ValueError(f"read {address}")
+            with cython.gil:
+                raise ValueError(f"read {address}")
+
+    def update(self, cycle_delta):
+        # Returns the interrupts (LCDC-STAT or V-Blank) that are requested by the display
+        if self._cycles_until_next_scanline > 0:
+            self._cycles_until_next_scanline -= cycle_delta
+            return 0
+        self._cycles_until_next_scanline += 456
+        return self.advance_one_scanline()
 
     def advance_one_scanline(self):
 
@@ -183,6 +213,10 @@ class Display:
             if self.LY == 144:
                 interrupt_flag |= 0b0000_0001  # V-Blank interrupt
 
+                if self.LCDC & 0b1000_0000:
+                    with cython.gil:
+                        self._frontend.present()
+
                 # STAT.4 (Mode 1 STAT Interrupt Enable)
                 if self.STAT & 0b0001_0000:
                     interrupt_flag |= 0b0000_0010  # LCDC STAT interrupt
@@ -190,43 +224,21 @@ class Display:
         return interrupt_flag
 
     def _redraw_screen(self):
-        try:
-            current_time = pygame.time.get_ticks()
-
-            # Is LCD enabled
-            if self.LCDC & 0b1000_0000:
-                self._draw_line()
-            else:
-                return
-
-            # Here we limit FPS to get better performance
-            if current_time > self._last_draw + 50:
-                self._last_draw = current_time
-                main_surface = pygame.image.frombuffer(bytearray(self._pixel_buffer), (160, 144), "RGB")
-                main_surface = pygame.transform.scale2x(main_surface)
-                self._screen.blit(main_surface, (0, 0))
-                pygame.display.update()
-
-        except BaseException as e:
-            raise Exception(f"Pygame frame error: {repr(e)}")
+        # Is LCD enabled
+        if self.LCDC & 0b1000_0000:
+            self._draw_line()
 
     def _draw_line(self):
 
         if self.LCDC & 0b0000_0100:  # sprite size mode
-            raise ValueError("TODO: Support tall sprite mode")
+            with cython.gil:
+                raise ValueError("TODO: Support tall sprite mode")
 
         bg_window_tile_data_select = self.LCDC & 0b0001_0000
         tile_byte_size = 16
 
         if self.LCDC & 0b0000_0001:  # BG / window enabled
 
-            bg_colors = [
-                self._colors[(self.BGP & 0b0000_0011)],
-                self._colors[(self.BGP & 0b0000_1100) >> 2],
-                self._colors[(self.BGP & 0b0011_0000) >> 4],
-                self._colors[(self.BGP & 0b1100_0000) >> 6],
-            ]
-
             if self.LCDC & 0b0000_1000:
                 bg_tilemap_address = 0x9C00 - 0x8000  # offset within VRAM
             else:
@@ -236,7 +248,7 @@ class Display:
             y_inside_tile = (self.SCY + self.LY) % 8
             for bg_tile_hor_index in range(32):
                 bg_tile_index = bg_tile_ver_index * 32 + bg_tile_hor_index
-                tile_index = self.VRAM[bg_tilemap_address + bg_tile_index]
+                tile_index = self._vram[bg_tilemap_address + bg_tile_index]
                 if bg_window_tile_data_select == 0:
                     tile_offset = _tile_offset_8800_method(tile_byte_size, tile_index)
                 else:
@@ -249,7 +261,7 @@ class Display:
                     offset_x += 256
 
                 if offset_x < 160:
-                    self._draw_tile_line(bg_colors, offset_x, y_inside_tile, tile_offset, False, False, False)
+                    self._draw_tile_line(self.BGP, offset_x, y_inside_tile, tile_offset, False, False, False)
 
             if self.LCDC & 0b0010_0000:  # Window enabled
 
@@ -263,7 +275,7 @@ class Display:
                 if 0 <= window_tile_ver_index < 32:
                     for window_tile_hor_index in range(32):
                         window_tile_index = window_tile_ver_index * 32 + window_tile_hor_index
-                        tile_index = self.VRAM[window_tilemap_address + window_tile_index]
+                        tile_index = self._vram[window_tilemap_address + window_tile_index]
                         if bg_window_tile_data_select == 0:
                             tile_offset = _tile_offset_8800_method(tile_byte_size, tile_index)
                         else:
@@ -272,24 +284,10 @@ class Display:
                         offset_x = window_tile_hor_index * 8 + self.WX - 7
 
                         if -8 <= offset_x <= 160:
-                            self._draw_tile_line(bg_colors, offset_x, y_inside_tile, tile_offset, False, False, False)
+                            self._draw_tile_line(self.BGP, offset_x, y_inside_tile, tile_offset, False, False, False)
 
         if self.LCDC & 0b0000_0010:  # Sprites enabled
 
-            sprite_colors_0 = [
-                self._colors[(self.OBP0 & 0b0000_0011)],
-                self._colors[(self.OBP0 & 0b0000_1100) >> 2],
-                self._colors[(self.OBP0 & 0b0011_0000) >> 4],
-                self._colors[(self.OBP0 & 0b1100_0000) >> 6],
-            ]
-
-            sprite_colors_1 = [
-                self._colors[(self.OBP1 & 0b0000_0011)],
-                self._colors[(self.OBP1 & 0b0000_1100) >> 2],
-                self._colors[(self.OBP1 & 0b0011_0000) >> 4],
-                self._colors[(self.OBP1 & 0b1100_0000) >> 6],
-            ]
-
             sprites_drawn = 0
 
             for spr_index in range(40):
@@ -298,23 +296,23 @@ class Display:
                     break
 
                 spr_offset = spr_index * 4
-                spr_screen_y = self.OAM[spr_offset] - 16
+                spr_screen_y = self._oam[spr_offset] - 16
 
                 # Check if the sprite has any pixels on the line we're drawing at the moment
                 # (Support for tall sprites should be added here)
                 if self.LY - 7 <= spr_screen_y <= self.LY:
-                    spr_screen_x = self.OAM[spr_offset + 1] - 8
+                    spr_screen_x = self._oam[spr_offset + 1] - 8
 
                     if -8 < spr_screen_x < 160:
 
                         sprites_drawn += 1
 
-                        tile_index = self.OAM[spr_offset + 2]
-                        sprite_flags = self.OAM[spr_offset + 3]
+                        tile_index = self._oam[spr_offset + 2]
+                        sprite_flags = self._oam[spr_offset + 3]
 
-                        sprite_covered_by_bg = bool(sprite_flags & 0b1000_0000)
-                        x_flip = bool(sprite_flags & 0b0010_0000)
-                        colors = sprite_colors_1 if sprite_flags & 0b0001_0000 else sprite_colors_0
+                        sprite_covered_by_bg = sprite_flags & 0b1000_0000 != 0
+                        x_flip = sprite_flags & 0b0010_0000 != 0
+                        palette = self.OBP1 if sprite_flags & 0b0001_0000 else self.OBP0
 
                         tile_offset = _tile_offset_8000_method(tile_byte_size, tile_index)
 
@@ -322,15 +320,15 @@ class Display:
                         if sprite_flags & 0b0100_0000:  # Y-flip
                             y_inside_tile = 7 - y_inside_tile
 
-                        self._draw_tile_line(colors, spr_screen_x, y_inside_tile, tile_offset, True,
+                        self._draw_tile_line(palette, spr_screen_x, y_inside_tile, tile_offset, True,
                                              x_flip, sprite_covered_by_bg)
 
-    def _draw_tile_line(self, colors, offset_x, y_inside_tile, tile_offset, sprite: bool, x_flip: bool,
-                        sprite_covered_by_bg: bool):
+    def _draw_tile_line(self, palette, offset_x, y_inside_tile, tile_offset, sprite, x_flip,
+                        sprite_covered_by_bg):
 
         byte_offset = tile_offset + y_inside_tile * 2
-        line_lsb = self.VRAM[byte_offset]
-        line_msb = self.VRAM[byte_offset + 1]
+        line_lsb = self._vram[byte_offset]
+        line_msb = self._vram[byte_offset + 1]
         for x in range(8):
             lsb = (line_lsb & (1 << (7 - x))) >> (7 - x)
             msb = (line_msb & (1 << (7 - x))) >> (7 - x)
@@ -352,71 +350,10 @@ class Display:
                 elif sprite_covered_by_bg:
                     if self._bg_pixel_color_indices[pixel_index] != 0:
                         continue
-                color = colors[color_index]
-                self._pixel_buffer[buffer_offset] = color[0]
-                self._pixel_buffer[buffer_offset + 1] = color[1]
-                self._pixel_buffer[buffer_offset + 2] = color[2]
-
-    def handle_user_input(self) -> int:
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                return -1
-            elif event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_ESCAPE:
-                    return -1
-                elif event.key == self._key_down:
-                    self._joypad.on_press_down()
-                    return 1
-                elif event.key == self._key_up:
-                    self._joypad.on_press_up()
-                    return 1
-                elif event.key == self._key_left:
-                    self._joypad.on_press_left()
-                    return 1
-                elif event.key == self._key_right:
-                    self._joypad.on_press_right()
-                    return 1
-                elif event.key == self._key_start:
-                    self._joypad.on_press_start()
-                    return 1
-                elif event.key == self._key_select:
-                    self._joypad.on_press_select()
-                    return 1
-                elif event.key == self._key_a:
-                    self._joypad.on_press_a()
-                    return 1
-                elif event.key == self._key_b:
-                    self._joypad.on_press_b()
-                    return 1
-                elif event.key == pygame.K_c:
-                    self._color_map_index = (self._color_map_index + 1) % len(COLOR_MAPS)
-                    self._colors = COLOR_MAPS[self._color_map_index]
-            elif event.type == pygame.KEYUP:
-                if event.key == self._key_down:
-                    self._joypad.on_release_down()
-                    return 1
-                elif event.key == self._key_up:
-                    self._joypad.on_release_up()
-                    return 1
-                elif event.key == self._key_left:
-                    self._joypad.on_release_left()
-                    return 1
-                elif event.key == self._key_right:
-                    self._joypad.on_release_right()
-                    return 1
-                elif event.key == self._key_start:
-                    self._joypad.on_release_start()
-                    return 1
-                elif event.key == self._key_select:
-                    self._joypad.on_release_select()
-                    return 1
-                elif event.key == self._key_a:
-                    self._joypad.on_release_a()
-                    return 1
-                elif event.key == self._key_b:
-                    self._joypad.on_release_b()
-                    return 1
-        return 0
+                color = ((palette >> (color_index * 2)) & 0b11) * 3
+                self._pixels[buffer_offset] = self._colors[color]
+                self._pixels[buffer_offset + 1] = self._colors[color + 1]
+                self._pixels[buffer_offset + 2] = self._colors[color + 2]
 
 
 class QuitException(BaseException):
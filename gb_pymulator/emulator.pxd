@@ -1,13 +1,29 @@
-# cython: profile=True
 import cython
 from gb_pymulator.motherboard cimport Motherboard, Memory
 from gb_pymulator.display cimport Display
+from gb_pymulator.sampler cimport Sampler
 from gb_pymulator.timer cimport Timer
-from gb_pymulator cimport instruction_decoding
+from gb_pymulator cimport build_options
+from gb_pymulator cimport cpu
 from gb_pymulator cimport logger
 
-@cython.locals(i=cython.int, cycle=cython.int, cycles_until_next_scanline=cython.int, cycle_delta=cython.int, timer_interrupt=cython.int)
-cdef _run_game(Motherboard motherboard, Display display, Timer timer, object cartridge, str save_file_name)
+@cython.locals(cycles=cython.longlong, _=cython.int, timing=cython.bint)
+cdef long long _run_frames(Motherboard motherboard, Display display, Timer timer, int n, reference_execute,
+                           Sampler sampler, long long[::1] frame_times) except -1
+
+cpdef int _start_frame_timing(long long[::1] frame_times) except -1
+
+@cython.locals(last=cython.Py_ssize_t, now=cython.longlong, us=cython.longlong, bucket=cython.Py_ssize_t)
+cdef int _time_frame(long long[::1] frame_times) except -1 nogil
+
+@cython.locals(cycles=cython.int, cycle_delta=cython.int, timer_interrupt=cython.int, interrupt_flag=cython.int,
+               counting=cython.bint, start=cython.longlong, now=cython.longlong, tracing=cython.bint,
+               advancing=cython.bint, draw_start=cython.longlong, tracing_instructions=cython.bint)
+cdef int _run_frame(Motherboard motherboard, Display display, Timer timer, reference_execute,
+                    Sampler sampler) except -1 nogil
+
+@cython.locals(opcode=cython.int)
+cdef int _trace_instruction(Motherboard motherboard) except -1 nogil
 
 @cython.locals(flag=cython.int)
-cdef int _handle_interrupts(Motherboard motherboard) except -1
\ No newline at end of file
+cdef int _handle_interrupts(Motherboard motherboard) except -1 nogil
@@ -1,16 +1,36 @@
-# cython: profile=True
+import hashlib
 import os.path
-import json
+import time
+import zlib
+from typing import Callable, Optional, Union
 
-from gb_pymulator import instruction_decoding
+try:
+    import cython
+except ImportError:
+    from gb_pymulator import cython_shim as cython
+
+from gb_pymulator import build_options
+from gb_pymulator import cpu
 from gb_pymulator import logger
+from gb_pymulator import save_state
+from gb_pymulator import snapshot_cache
 from gb_pymulator.cartridge import Cartridge
 from gb_pymulator.cartridge_header import CartridgeHeader, CartridgeType, RAM_Size
+from gb_pymulator.counters import Counters
 from gb_pymulator.display import Display
-from gb_pymulator.key_bindings import load_keybindings
+from gb_pymulator.frontend import (
+    Frontend, HeadlessFrontend, INPUT_JOYPAD, INPUT_LOAD_STATE, INPUT_NONE, INPUT_QUIT, INPUT_SAVE_STATE
+)
+from gb_pymulator.instruction_trace import DEFAULT_CAPACITY as DEFAULT_TRACE_CAPACITY, InstructionTrace
 from gb_pymulator.joypad import JoyPad
+from gb_pymulator.metrics import DEFAULT_WINDOW, Metrics
 from gb_pymulator.motherboard import Motherboard, Memory
+from gb_pymulator.movie import Movie, MoviePlayer, MovieRecorder
+from gb_pymulator.rewind import Rewinder
+from gb_pymulator.sampler import DEFAULT_INTERVAL, Sampler
+from gb_pymulator.symbols import Symbols
 from gb_pymulator.timer import Timer
+from gb_pymulator.tracing import DEFAULT_CAPACITY, Tracer
 
 
 # DR_MARIO_DEBUG_POINTS = {
@@ -42,118 +62,759 @@ from gb_pymulator.timer import Timer
 # }
 
 
-def run_game_from_file(filename: str):
+# The CPU implementations that an Emulator can run with
+CPU_NATIVE = "native"  # cpu.py (compiled, and runs without the GIL, when Cython is available)
+CPU_REFERENCE = "reference"  # The decoded Instruction objects in instructions.py (imported only when used)
+CPUS = [CPU_NATIVE, CPU_REFERENCE]
+
+# The DMG boot ROM, which scrolls in the logo and then hands over to the cartridge
+BOOT_ROM_SIZE = 256
+
+
+class Emulator:
+    """ A gameboy that can be embedded and stepped frame by frame """
+
+    def __init__(self, rom: Union[bytes, bytearray, str], frontend: Optional[Frontend] = None,
+                 ram: Optional[bytes] = None, cpu: str = CPU_NATIVE, boot_rom: Union[bytes, str, None] = None):
+        """
+        :param boot_rom: the boot ROM (or the path to it), to run before the cartridge. Without it, the emulator starts
+                         at the cartridge's entrypoint.
+        """
+        if cpu not in CPUS:
+            raise ValueError(f"Unknown CPU: {cpu} (expected one of {CPUS})")
+        self.cpu = cpu
+        if cpu == CPU_REFERENCE:
+            # Imported here, since building its opcode tables makes up most of the time it takes to import the emulator
+            from gb_pymulator import instruction_decoding
+            self._reference_execute = instruction_decoding.fetch_decode_execute
+        else:
+            self._reference_execute = None
+
+        # rom is either the contents of a ROM file, or the path to one
+        if isinstance(rom, str):
+            with open(rom, "rb") as file:
+                rom = file.read()
+            logger.info(f"Loaded game ROM ({len(rom)} bytes)")
+        cartridge_data = bytes(rom)
+        # Identifies the ROM in save states
+        self._rom_checksum = zlib.crc32(cartridge_data)
+
+        ram_size = _cartridge_ram_size(cartridge_data)
+        if ram is None:
+            ram_data = bytearray(ram_size)
+        elif len(ram) != ram_size:
+            raise ValueError(f"Expected RAM size {ram_size} but got RAM data with size {len(ram)}")
+        else:
+            ram_data = bytearray(ram)
+
+        if isinstance(boot_rom, str):
+            with open(boot_rom, "rb") as file:
+                boot_rom = file.read()
+        if boot_rom is not None:
+            boot_rom = bytes(boot_rom)
+            if len(boot_rom) != BOOT_ROM_SIZE:
+                raise ValueError(f"Expected a boot ROM of {BOOT_ROM_SIZE} bytes, but got {len(boot_rom)} bytes")
+
+        self._build_machine(cartridge_data, ram_data, frontend if frontend is not None else HeadlessFrontend(),
+                            boot_rom)
+
+        if boot_rom is None:
+            cartridge_header = _handle_header_and_entrypoint(self._motherboard)
+        else:
+            # The boot ROM starts at address 0
+            cartridge_header = _parse_header(self._memory)
+        self.title = cartridge_header.title
+        self.frontend.set_title(self.title)
+
+        self.frame_count = 0
+        self.cycle_count = 0
+
+    def _build_machine(self, cartridge_data: bytes, ram_data: bytearray, frontend: Frontend,
+                       boot_rom: Optional[bytes]):
+        self.frontend = frontend
+        self._joypad = JoyPad()
+        self._timer = Timer()
+        self._display = Display(frontend)
+        self._cartridge = Cartridge(cartridge_data, ram_data)
+        self._memory = Memory(self._cartridge, self._joypad, self._timer, self._display, boot_rom)
+        self._motherboard = Motherboard(self._memory, 0)
+        # The guest code profiler, while it's enabled (it isn't part of the machine, so clones don't share it)
+        self._sampler = None
+        # Where the instruction trace is written if the emulator crashes
+        self._instruction_trace_file = None
+        # The live metrics, while they are enabled (they aren't part of the machine either)
+        self._metrics = None
+
+        # A zero-copy view of the display's pixel buffer, shaped as rows of RGB pixels
+        self._frame = memoryview(self._display.pixel_buffer).cast("B", (144, 160, 3))
+
+    def clone(self, frontend: Optional[Frontend] = None) -> "Emulator":
+        """
+        An independent emulator in the same state (including the current frame), that can be stepped and discarded
+        without affecting this one. The ROM is shared, and the rest of the machine is copied directly (about as cheap
+        as save_state(), and without the cartridge header parsing of creating an emulator).
+        """
+        clone = Emulator.__new__(Emulator)
+        clone.cpu = self.cpu
+        clone._reference_execute = self._reference_execute
+        clone._rom_checksum = self._rom_checksum
+        clone.title = self.title
+        clone._build_machine(self._cartridge.data, bytearray(len(self._cartridge.ram)),
+                             frontend if frontend is not None else HeadlessFrontend(), self._memory.boot_rom)
+        clone.frontend.set_title(clone.title)
+        clone._set_state(self._get_state(), self._buffers())
+        clone._display.pixel_buffer[:] = self._display.pixel_buffer
+        return clone
+
+    def snapshot(self):
+        """ An in-memory copy of the machine state, that can be restored (any number of times) with restore() """
+        return self._get_state(), [bytes(buffer) for buffer in self._buffers()], bytes(self._display.pixel_buffer)
+
+    def restore(self, snapshot):
+        int_groups, regions, pixels = snapshot
+        self._set_state(int_groups, regions)
+        self._display.pixel_buffer[:] = pixels
+
+    def save_state(self, compress: bool = False) -> bytes:
+        """
+        The whole machine state (CPU, memory, display, timer, joypad, cartridge banking and RAM) as a compact binary
+        blob, that can be loaded with load_state(). See save_state.py for the format.
+        """
+        return save_state.encode(self._get_state(), self._buffers(), compress)
+
+    def load_state(self, data: bytes):
+        """
+        Load a state created by save_state(), for the same ROM. The frame is redrawn as the emulator runs.
+
+        Raises save_state.InvalidStateError if the data isn't a save state of this version (or is corrupt), and
+        ValueError if the state doesn't fit this emulator (it was saved with another ROM, or while the boot ROM was
+        running and this emulator has none). Either way, the emulator is left unchanged.
+        """
+        int_groups, regions = save_state.decode(data)
+        if ([len(group) for group in int_groups] != [len(group) for group in self._get_state()]
+                or [len(region) for region in regions] != [len(buffer) for buffer in self._buffers()]):
+            raise save_state.InvalidStateError("Save state doesn't contain the expected machine state")
+        self._check_state(int_groups)
+        self._set_state(int_groups, regions)
+
+    def _check_state(self, int_groups):
+        # Checked before any of the state is set, so that a state that doesn't fit leaves the emulator unchanged
+        if int_groups[0][0] != self._rom_checksum:
+            raise ValueError("The state was saved with a different ROM")
+        _, _, boot_rom_mapped, _, _ = int_groups[2]
+        if boot_rom_mapped and self._memory.boot_rom is None:
+            raise ValueError("The state was saved while the boot ROM was running, but no boot ROM is loaded")
+
+    def _get_state(self) -> list:
+        return [
+            (self._rom_checksum, self.frame_count, self.cycle_count),
+            self._motherboard.get_state(),
+            self._memory.get_state(),
+            self._display.get_state(),
+            self._timer.get_state(),
+            self._joypad.get_state(),
+            self._cartridge.get_state(),
+        ]
+
+    def _buffers(self) -> list:
+        # The memory regions of the machine state, in the order of _get_state()
+        return [
+            self._memory.internal_ram,
+            self._memory.high_internal_ram,
+            self._display.VRAM,
+            self._display.OAM,
+            self._cartridge.ram,
+        ]
+
+    def _set_state(self, int_groups, regions):
+        (_, frame_count, cycle_count), motherboard, memory, display, timer, joypad, cartridge = int_groups
+        self._motherboard.set_state(motherboard)
+        self._memory.set_state(memory)
+        self._display.set_state(display)
+        self._timer.set_state(timer)
+        self._joypad.set_state(joypad)
+        self._cartridge.set_state(cartridge)
+        for buffer, region in zip(self._buffers(), regions):
+            # Copied into the existing buffers, which the typed views (and frontends) refer to
+            buffer[:] = region
+        self.frame_count = frame_count
+        self.cycle_count = cycle_count
+
+    def step_frame(self) -> int:
+        """ Run until the display enters V-Blank. Returns the number of emulated cycles. """
+        return self.run_frames(1)
+
+    def run_frames(self, n: int) -> int:
+        """
+        Run n frames. Returns the number of emulated cycles.
+
+        When compiled, the GIL is released while running (with the native CPU), so emulators in different threads run
+        in parallel.
+        """
+        instructions = self._motherboard.instruction_count
+        frame_times = self._metrics._frame_times if self._metrics is not None else None
+        try:
+            cycles = _run_frames(self._motherboard, self._display, self._timer, n, self._reference_execute,
+                                 self._sampler, frame_times)
+        except BaseException:
+            self._save_instruction_trace()
+            raise
+        self.frame_count += n
+        self.cycle_count += cycles
+        if self._metrics is not None:
+            self._metrics.on_frames(n, cycles, self._motherboard.instruction_count - instructions)
+        return cycles
+
+    def finish_boot(self, max_frames: int = 600) -> int:
+        """ Run frames until the boot ROM has handed over to the cartridge. Returns the number of frames that were run. """
+        frames = 0
+        while self._memory.boot_rom_mapped:
+            if frames == max_frames:
+                raise ValueError(f"The boot ROM didn't finish within {max_frames} frames")
+            self.step_frame()
+            frames += 1
+        return frames
+
+    def set_buttons(self, mask: int):
+        """ Set the buttons that are currently pressed. See BUTTON_* in joypad.py for the bits of the mask. """
+        if self._joypad.set_buttons(mask):
+            self._motherboard.memory.IF_flag |= 0b0001_0000  # Joypad interrupt
+            self._motherboard.stopped = False
+
+    def get_buttons(self) -> int:
+        return self._joypad.get_buttons()
+
+    def read_memory(self, address: int, length: int = 1) -> bytes:
+        """
+        Read a range of the address space, as seen by the CPU. A range within work RAM, high RAM, video RAM or OAM is
+        copied from its buffer in one slice, and other ranges are read byte by byte (through the memory map).
+        """
+        end = address + length
+        if address < 0 or length < 0 or end > 0x10000:
+            raise ValueError(f"Invalid memory range: {length} bytes at {address:#x}")
+        for start, buffer in ((0xC000, self._memory.internal_ram), (0xFF80, self._memory.high_internal_ram),
+                              (0x8000, self._display.VRAM), (0xFE00, self._display.OAM)):
+            if start <= address and end <= start + len(buffer):
+                return bytes(buffer[address - start:end - start])
+        # Peeked at, so that the reads aren't counted or traced as the game's
+        return bytes([self._memory.peek(address + i) for i in range(length)])
+
+    def frame(self) -> memoryview:
+        """ The current frame (144 x 160 x RGB), without copying. It's updated in place as the emulator runs. """
+        return self._frame
+
+    def frame_array(self):
+        """ The current frame as a (144, 160, 3) uint8 NumPy array that shares memory with the emulator """
+        import numpy
+        return numpy.frombuffer(self._display.pixel_buffer, dtype=numpy.uint8).reshape((144, 160, 3))
+
+    @property
+    def program_counter(self) -> int:
+        return self._motherboard.program_counter
+
+    @property
+    def instruction_count(self) -> int:
+        """ The number of instructions that this emulator has executed (it isn't part of the machine state) """
+        return self._motherboard.instruction_count
+
+    @property
+    def counters(self) -> Optional[Counters]:
+        """ The execution counters, while they are enabled """
+        return self._memory.counters
+
+    def enable_counters(self) -> Counters:
+        """
+        Start collecting execution counters (see counters.py). They are only available if the extension modules were
+        built with GB_PYMULATOR_COUNTERS=1 (or, when running as plain Python, if it's set in the environment).
+        """
+        if not build_options.COUNTERS:
+            raise RuntimeError("The counters are compiled out (build the emulator with GB_PYMULATOR_COUNTERS=1)")
+        if self._memory.counters is None:
+            self._memory.counters = Counters()
+        return self._memory.counters
+
+    def disable_counters(self):
+        self._memory.counters = None
+
+    @property
+    def tracer(self) -> Optional[Tracer]:
+        """ The trace events, while tracing is enabled """
+        return self._memory.tracer
+
+    def enable_tracing(self, capacity: int = DEFAULT_CAPACITY) -> Tracer:
+        """
+        Start recording trace events (see tracing.py), keeping the latest capacity events. Like the counters, they are
+        only available if the extension modules were built with GB_PYMULATOR_TRACING=1.
+        """
+        if not build_options.TRACING:
+            raise RuntimeError("Tracing is compiled out (build the emulator with GB_PYMULATOR_TRACING=1)")
+        if self._memory.tracer is None:
+            self._memory.tracer = Tracer(capacity)
+        return self._memory.tracer
+
+    def disable_tracing(self):
+        self._memory.tracer = None
+
+    @property
+    def instruction_trace(self) -> Optional[InstructionTrace]:
+        """ The trace of the last instructions, while it's enabled """
+        return self._memory.instruction_trace
+
+    def enable_instruction_trace(self, capacity: int = DEFAULT_TRACE_CAPACITY,
+                                 crash_file: Optional[str] = None) -> InstructionTrace:
+        """
+        Start recording the last capacity instructions (see instruction_trace.py), and write them to crash_file if the
+        emulator crashes. Like tracing, it's only available if the extension modules were built with
+        GB_PYMULATOR_TRACING=1.
+        """
+        if not build_options.TRACING:
+            raise RuntimeError("The instruction trace is compiled out (build the emulator with GB_PYMULATOR_TRACING=1)")
+        if self._memory.instruction_trace is None:
+            self._memory.instruction_trace = InstructionTrace(capacity, self.cycle_count)
+        self._instruction_trace_file = crash_file
+        return self._memory.instruction_trace
+
+    def disable_instruction_trace(self):
+        self._memory.instruction_trace = None
+        self._instruction_trace_file = None
+
+    def _save_instruction_trace(self):
+        trace = self._memory.instruction_trace
+        if trace is not None and self._instruction_trace_file is not None:
+            trace.save(self._instruction_trace_file)
+            logger.warn(f"Saved the last {min(trace.count, trace.capacity)} instructions to file "
+                        f"{self._instruction_trace_file}")
+
+    @property
+    def sampler(self) -> Optional[Sampler]:
+        """ The guest code profiler, while it's enabled """
+        return self._sampler
+
+    def enable_sampling(self, interval: int = DEFAULT_INTERVAL) -> Sampler:
+        """ Start sampling the program counter (and its callers) every interval emulated cycles (see sampler.py) """
+        if self._sampler is None:
+            self._sampler = Sampler(interval)
+        return self._sampler
+
+    def disable_sampling(self):
+        self._sampler = None
+
+    @property
+    def metrics(self) -> Optional[Metrics]:
+        """ The live metrics, while they are enabled """
+        return self._metrics
+
+    def enable_metrics(self, window: float = DEFAULT_WINDOW, json_file: Optional[str] = None,
+                       hud: bool = False) -> Metrics:
+        """
+        Start measuring the frames/s, speed, instructions/s and frame times of this emulator (see metrics.py). The
+        rates are updated every window seconds, when they are also appended to json_file, and shown on the frontend
+        (if hud is set).
+        """
+        if self._metrics is None:
+            self._metrics = Metrics(self.frontend, window, json_file, hud)
+            _start_frame_timing(self._metrics._frame_times)
+        return self._metrics
+
+    def disable_metrics(self):
+        if self._metrics is not None:
+            self._metrics.close()
+            self._metrics = None
+
+    @property
+    def serial_output(self) -> bytes:
+        """
+        The bytes that have been sent over the serial port (e.g. the results of test ROMs). Only the latest 32-64 kB
+        are kept (see SERIAL_OUTPUT_LIMIT in motherboard.py), unless they are drained with read_serial().
+        """
+        return bytes(self._memory.serial_output)
+
+    def read_serial(self) -> bytes:
+        """ The bytes sent over the serial port since the last call (they are removed from the buffer) """
+        output = bytes(self._memory.serial_output)
+        del self._memory.serial_output[:]
+        return output
+
+    @property
+    def boot_rom_mapped(self) -> bool:
+        return self._memory.boot_rom_mapped
+
+    @property
+    def rom_sha1(self) -> str:
+        """ Identifies the ROM (e.g. in the snapshot cache) """
+        return hashlib.sha1(self._cartridge.data).hexdigest()
+
+    @property
+    def cartridge_ram(self) -> bytes:
+        return bytes(self._cartridge.ram)
+
+    @cartridge_ram.setter
+    def cartridge_ram(self, ram: bytes):
+        if len(ram) != len(self._cartridge.ram):
+            raise ValueError(f"Expected RAM size {len(self._cartridge.ram)} but got RAM data with size {len(ram)}")
+        self._cartridge.ram[:] = ram
+
+
+def run_game_from_file(filename: str, scale: int = 2, headless: bool = False,
+                       key_bindings_file: str = "key_bindings.json", save_dir: str = "savefiles",
+                       cpu: str = CPU_NATIVE, record_file: Optional[str] = None, replay_file: Optional[str] = None,
+                       hash_interval: int = 60, boot_rom_file: Optional[str] = None, cold_boot: bool = False,
+                       checkpoint: Optional[str] = None, snapshot_dir: str = snapshot_cache.DEFAULT_DIRECTORY,
+                       counters: bool = False, trace_file: Optional[str] = None,
+                       sample_interval: Optional[int] = None, symbols_file: Optional[str] = None,
+                       folded_file: Optional[str] = None, instruction_trace_file: Optional[str] = None,
+                       metrics_file: Optional[str] = None, hud: bool = False):
+    """
+    :param record_file: record the input into a movie file, with a state hash every hash_interval frames
+    :param replay_file: replay a movie file instead of taking input (as fast as possible when headless)
+    :param boot_rom_file: run the boot ROM first. The post-boot state is cached, and later sessions start from it,
+                          unless cold_boot is set.
+    :param checkpoint: start from the named snapshot in the cache (if it exists). Saving and loading states (F5/F9)
+                       then uses this snapshot, instead of the state file next to the savefile.
+    :param counters: collect execution counters (see counters.py), and print them when the emulator exits
+    :param trace_file: record trace events (see tracing.py), and save them to this file when the emulator exits
+    :param sample_interval: profile the guest code (see sampler.py), and print the routines that it spent the most
+                            cycles in when the emulator exits. The routines are named by symbols_file (by default, the
+                            .sym file next to the ROM, if there is one).
+    :param folded_file: write the guest code profile as folded stacks to this file (for a flamegraph)
+    :param instruction_trace_file: keep a trace of the last instructions (see instruction_trace.py), and write it to
+                                   this file if the emulator crashes
+    :param metrics_file: measure the performance (see metrics.py), and append it to this JSON-lines file every second
+    :param hud: show the performance in the window
+    """
     with open(filename, "rb") as file:
-        cartridge_data = list(file.read())
+        cartridge_data = file.read()
         logger.info(f"Loaded game ROM ({len(cartridge_data)} bytes)")
 
-    with open("DMG_ROM.bin", "rb") as boot_file:
-        boot_rom_buffer = list(boot_file.read())
-        logger.info(f"Loaded boot ROM ({len(boot_rom_buffer)} bytes)")
-
-    joypad = JoyPad()
-    timer = Timer()
-
-    with open("key_bindings.json", "r") as file:
-        key_bindings_config = json.loads(file.read())
-    key_bindings = load_keybindings(key_bindings_config)
-
-    display = Display(joypad, key_bindings)
+    if symbols_file is None and os.path.exists(os.path.splitext(filename)[0] + ".sym"):
+        # (RGBDS names the symbol file after the ROM)
+        symbols_file = os.path.splitext(filename)[0] + ".sym"
 
-    ram_size_enum = RAM_Size(cartridge_data[0x149])
-    if ram_size_enum == RAM_Size.NONE:
-        ram_size = 0
-    elif ram_size_enum == RAM_Size.RAM_32KB:
-        ram_size = 32 * 1024
-    elif ram_size_enum == RAM_Size.RAM_8KB:
-        ram_size = 8 * 1024
+    if boot_rom_file is not None:
+        with open(boot_rom_file, "rb") as file:
+            boot_rom = file.read()
     else:
-        raise ValueError(f"TODO Handle RAM size: {ram_size_enum}")
+        boot_rom = None
 
-    escaped_title = bytes(cartridge_data[0x134:0x134 + 11]).decode("utf-8").replace("\x00", "")
-    save_file_name = f"savefiles/__{escaped_title.replace(' ', '_')}__"
+    if headless:
+        frontend = HeadlessFrontend()
+    else:
+        # Imported here, so that pygame is never loaded when running headless
+        import json
+        from gb_pymulator.key_bindings import load_keybindings
+        from gb_pymulator.pygame_frontend import PygameFrontend
+
+        with open(key_bindings_file, "r") as file:
+            key_bindings_config = json.loads(file.read())
+        key_bindings = load_keybindings(key_bindings_config)
+        frontend = PygameFrontend(key_bindings, scale)
+
+    escaped_title = cartridge_data[0x134:0x134 + 11].decode("utf-8").replace("\x00", "")
+    save_file_name = os.path.join(save_dir, f"__{escaped_title.replace(' ', '_')}__")
     if os.path.exists(save_file_name):
         logger.info(f"Savefile found: {save_file_name}")
         with open(save_file_name, "rb") as save_file:
-            ram_data = list(save_file.read())
+            ram_data = save_file.read()
             logger.debug(f"Loaded RAM data ({len(ram_data)} bytes)")
-            if len(ram_data) != ram_size:
-                raise ValueError(f"Expected RAM size {ram_size} but savefile has size {len(ram_data)}")
     else:
-        ram_data = [0] * ram_size
-        logger.info(f"Savefile not found: {save_file_name}. Created new RAM data with size {ram_size}")
-
-    cartridge = Cartridge(cartridge_data, ram_data)
-    memory = Memory(cartridge, joypad, timer, display)
-    motherboard = Motherboard(memory, 0)
-
-    cartridge_header = _handle_header_and_entrypoint(motherboard)
+        ram_data = None
+        logger.info(f"Savefile not found: {save_file_name}. Created new RAM data")
+
+    if replay_file is not None:
+        # The movie starts from a save state, which includes the cartridge RAM
+        emulator = Emulator(cartridge_data, frontend, None, cpu, boot_rom)
+        _enable_instrumentation(emulator, counters, trace_file, sample_interval, instruction_trace_file,
+                                metrics_file, hud)
+        _replay_game(emulator, replay_file, headless)
+        _save_instrumentation(emulator, trace_file, symbols_file, folded_file)
+        logger.info("Exiting emulator")
+        return
+
+    emulator = Emulator(cartridge_data, frontend, ram_data, cpu, boot_rom)
+    _enable_instrumentation(emulator, counters, trace_file, sample_interval, instruction_trace_file, metrics_file,
+                            hud)
+    cache = snapshot_cache.SnapshotCache(snapshot_dir)
+    state_file_name = f"{save_file_name}.state"
+    on_booted = None
+
+    if checkpoint is not None:
+        state_file_name = cache.path(emulator, checkpoint)
+        if cache.load(emulator, checkpoint):
+            logger.info(f"Started from checkpoint: {checkpoint}")
+        else:
+            logger.info(f"Checkpoint not found: {checkpoint} (press F5 to save it)")
+    elif boot_rom is not None:
+        post_boot = snapshot_cache.post_boot_name(boot_rom)
+        if not cold_boot and cache.load(emulator, post_boot):
+            # The savefile may have changed since the post-boot state was cached (and the boot ROM doesn't use it)
+            emulator.cartridge_ram = ram_data if ram_data is not None else bytes(len(emulator.cartridge_ram))
+            logger.info("Started from the cached post-boot state")
+        else:
+            def on_booted():
+                cache.save(emulator, post_boot)
+                logger.info(f"Cached the post-boot state: {cache.path(emulator, post_boot)}")
+
+    recorder = MovieRecorder(emulator, hash_interval) if record_file is not None else None
+    try:
+        _run_game(emulator, save_file_name, state_file_name, recorder, on_booted)
+    finally:
+        # Also written if the emulator crashed, so that the crash can be reproduced
+        if recorder is not None:
+            data = recorder.movie.to_bytes()
+            with open(record_file, "wb") as file:
+                file.write(data)
+            logger.info(f"Saved movie to file {record_file} ({recorder.movie.num_frames} frames, {len(data)} bytes)")
+        _save_instrumentation(emulator, trace_file, symbols_file, folded_file)
+    logger.info("Exiting emulator")
 
-    display.set_title(cartridge_header.title)
 
-    _run_game(motherboard, display, timer, cartridge, save_file_name)
-    logger.info("Exiting emulator")
+def _enable_instrumentation(emulator: Emulator, counters: bool, trace_file: Optional[str],
+                            sample_interval: Optional[int], instruction_trace_file: Optional[str],
+                            metrics_file: Optional[str], hud: bool):
+    if counters:
+        emulator.enable_counters()
+    if trace_file is not None:
+        emulator.enable_tracing()
+    if sample_interval is not None:
+        emulator.enable_sampling(sample_interval)
+    if instruction_trace_file is not None:
+        emulator.enable_instruction_trace(crash_file=instruction_trace_file)
+    if metrics_file is not None or hud:
+        emulator.enable_metrics(json_file=metrics_file, hud=hud)
+
+
+def _save_instrumentation(emulator: Emulator, trace_file: Optional[str], symbols_file: Optional[str],
+                          folded_file: Optional[str]):
+    if emulator.counters is not None:
+        print(emulator.counters.summary())
+    if emulator.tracer is not None:
+        emulator.tracer.save(trace_file)
+        logger.info(f"Saved trace to file {trace_file} ({min(emulator.tracer.count, emulator.tracer.capacity)} events)")
+    if emulator.sampler is not None:
+        symbols = Symbols.load(symbols_file) if symbols_file is not None else None
+        print(emulator.sampler.report(symbols))
+        if folded_file is not None:
+            with open(folded_file, "w") as file:
+                file.write(emulator.sampler.folded(symbols))
+            logger.info(f"Saved folded stacks to file {folded_file}")
+    if emulator.metrics is not None:
+        print(emulator.metrics.summary())
+        emulator.disable_metrics()
+
+
+def _replay_game(emulator: Emulator, movie_file: str, headless: bool):
+    with open(movie_file, "rb") as file:
+        movie = Movie.parse(file.read())
+    player = MoviePlayer(emulator, movie)
+    logger.info(f"Replaying movie {movie_file} ({movie.num_frames} frames, {len(movie.hashes)} state hashes)")
+
+    if headless:
+        start = time.perf_counter()
+        frames = player.run()
+        elapsed = time.perf_counter() - start
+        logger.info(f"Replayed {frames} frames in {elapsed:.2f}s ({frames / elapsed:.1f} fps)")
+    else:
+        while player.step():
+            if emulator.frontend.handle_user_input() == INPUT_QUIT:
+                return
+        logger.info("Movie ended")
 
 
-def _run_game(motherboard, display, timer, cartridge, save_file_name):
-    logger.info(f"ENTERING INSTRUCTION LOOP... (address={motherboard.program_counter})")
+def _run_game(emulator: Emulator, save_file_name: str, state_file_name: str,
+              recorder: Optional[MovieRecorder] = None, on_booted: Optional[Callable[[], None]] = None):
+    logger.info(f"ENTERING INSTRUCTION LOOP... (address={emulator.program_counter})")
 
-    i = 0
-    cycles_until_next_scanline = 0
-    cycle = 0
+    frontend = emulator.frontend
+    # A movie only goes forwards in time, so there's no rewinding (or loading of states) while recording one. The
+    # history is only kept if the frontend can rewind (e.g. not when headless)
+    rewinder = Rewinder(emulator) if recorder is None and frontend.can_rewind else None
 
     try:
         while True:
 
-            cycle_delta = 0
-            cycle_delta += _handle_interrupts(motherboard)
+            if rewinder is None or not frontend.rewinding or not rewinder.rewind():
+                emulator.step_frame()
+                if rewinder is not None:
+                    rewinder.on_frame()
+                if recorder is not None:
+                    recorder.on_frame()
+                if on_booted is not None and not emulator.boot_rom_mapped:
+                    on_booted()
+                    on_booted = None
+
+            poll_start = build_options.now_ns()
+            user_input_return_value = frontend.handle_user_input()
+            if build_options.COUNTERS and emulator.counters is not None:
+                emulator.counters.input_ns += build_options.now_ns() - poll_start
+            if build_options.TRACING and emulator.tracer is not None:
+                emulator.tracer.input_polled(poll_start)
+            if user_input_return_value == INPUT_QUIT:
+                ram = emulator.cartridge_ram
+                os.makedirs(os.path.dirname(save_file_name), exist_ok=True)
+                with open(save_file_name, "wb") as savefile:
+                    savefile.write(ram)
+                logger.info(f"Saved RAM to file {save_file_name} ({len(ram)} bytes)")
+                return
+            elif user_input_return_value == INPUT_SAVE_STATE:
+                state = emulator.save_state(compress=True)
+                os.makedirs(os.path.dirname(state_file_name), exist_ok=True)
+                with open(state_file_name, "wb") as state_file:
+                    state_file.write(state)
+                logger.info(f"Saved state to file {state_file_name} ({len(state)} bytes)")
+            elif user_input_return_value == INPUT_LOAD_STATE:
+                if recorder is not None:
+                    logger.info("Can't load a state while recording a movie")
+                elif os.path.exists(state_file_name):
+                    with open(state_file_name, "rb") as state_file:
+                        emulator.load_state(state_file.read())
+                    logger.info(f"Loaded state from file {state_file_name}")
+                else:
+                    logger.info(f"No saved state: {state_file_name}")
+
+            if user_input_return_value != INPUT_NONE:
+                # Keys may have been pressed or released in the same batch of events as a hotkey
+                emulator.set_buttons(frontend.buttons)
+
+            if emulator.frame_count % 1000 == 0:
+                logger.info(f"[cycle {int(emulator.cycle_count / 1_000_000)}M]")
 
-            if not motherboard.halted and not motherboard.stopped:
+    except BaseException as e:
+        logger.info(
+            f"Quit after {emulator.frame_count} frames (at addr {emulator.program_counter}): {repr(e)}"
+        )
+        raise e
 
-                cycle_delta += instruction_decoding.fetch_decode_execute(motherboard)
 
-                motherboard.handle_ime_flag()
+def _run_frames(motherboard, display, timer, n, reference_execute, sampler, frame_times) -> int:
+    # reference_execute is the reference CPU's fetch_decode_execute, or None for the native CPU. frame_times is the
+    # frame time histogram of the metrics (see metrics.py), or None.
+    cycles = 0
+    timing = frame_times is not None
+    if reference_execute is not None:
+        for _ in range(n):
+            cycles += _run_frame(motherboard, display, timer, reference_execute, sampler)
+            if timing:
+                _time_frame(frame_times)
+    else:
+        with cython.nogil:
+            for _ in range(n):
+                cycles += _run_frame(motherboard, display, timer, None, sampler)
+                if timing:
+                    _time_frame(frame_times)
+    return cycles
+
+
+def _start_frame_timing(frame_times) -> int:
+    # The first frame is timed from now (here rather than in metrics.py, since it must read the same clock as
+    # _time_frame())
+    frame_times[len(frame_times) - 1] = build_options.now_ns()
+    return 0
 
-            else:
-                # ? This is where we need to involve real-time to determine how many cycles should be emulated
-                cycle_delta += 4
 
-            # With cycle, we mean T-cycle, as defined here https://hacktix.github.io/GBEDG/cpu/
-            # We don't mean M-cycle (which is 4 T-cycles long).
+def _time_frame(frame_times) -> int:
+    # Counts the frame that just ended in its bucket: the bit length of its time in microseconds, and the last bucket
+    # for the slower ones. The last element is the end time of the previous frame.
+    last = len(frame_times) - 1
+    now = build_options.now_ns()
+    us = (now - frame_times[last]) // 1000
+    bucket = 0
+    while us > 0 and bucket < last - 1:
+        us >>= 1
+        bucket += 1
+    frame_times[bucket] += 1
+    frame_times[last] = now
+    return 0
 
-            timer_interrupt = timer.update(cycle_delta)
-            if timer_interrupt:
-                motherboard.memory.IF_flag |= 0b0000_0100  # Timer interrupt
 
-            if cycles_until_next_scanline > 0:
-                cycles_until_next_scanline -= cycle_delta
-            else:
-                interrupt_flag = display.advance_one_scanline()
-                motherboard.memory.IF_flag |= interrupt_flag  # LCDC-STAT or V-Blank interrupts
-                cycles_until_next_scanline += 456
-
-            if i % 300 == 0:
-                user_input_return_value = display.handle_user_input()
-                if user_input_return_value == 1:
-                    motherboard.memory.IF_flag |= 0b0001_0000  # Joypad interrupt
-                    motherboard.stopped = False
-                elif user_input_return_value == -1:
-                    with open(save_file_name, "wb") as savefile:
-                        savefile.write(bytes(cartridge._ram))
-                    logger.info(f"Saved RAM to file {save_file_name} ({len(cartridge._ram)} bytes)")
-                    return
-
-            i += 1
-            cycle += cycle_delta
-
-            if i % 1_000_000 == 0:
-                logger.info(f"[cycle {int(cycle / 1_000_000)}M]")
+def _run_frame(motherboard, display, timer, reference_execute, sampler) -> int:
+    cycles = 0
+    # When the counters are compiled out, this is a constant, and the C compiler drops the timing code below
+    counting = build_options.COUNTERS and motherboard.memory.counters is not None
+    start = build_options.now_ns() if counting else 0
+    # (The same goes for tracing)
+    tracing = build_options.TRACING and motherboard.memory.tracer is not None
+    tracing_instructions = build_options.TRACING and motherboard.memory.instruction_trace is not None
+    draw_start = 0
+    if tracing:
+        motherboard.memory.tracer.start_frame()
 
-    except BaseException as e:
-        logger.info(
-            f"Quit after {i} iterations (at addr {motherboard.program_counter}): {repr(e)}"
-        )
-        raise e
+    while True:
+
+        cycle_delta = 0
+        cycle_delta += _handle_interrupts(motherboard)
+
+        if not motherboard.halted and not motherboard.stopped:
+
+            if tracing_instructions:
+                _trace_instruction(motherboard)
+
+            if reference_execute is not None:
+                with cython.gil:
+                    cycle_delta += reference_execute(motherboard)
+            else:
+                cycle_delta += cpu.execute(motherboard)
+            motherboard.instruction_count += 1
+
+            motherboard.handle_ime_flag()
+
+        else:
+            # ? This is where we need to involve real-time to determine how many cycles should be emulated
+            cycle_delta += 4
+
+        # With cycle, we mean T-cycle, as defined here https://hacktix.github.io/GBEDG/cpu/
+        # We don't mean M-cycle (which is 4 T-cycles long).
+
+        if counting:
+            now = build_options.now_ns()
+            motherboard.memory.counters.cpu_ns += now - start
+            start = now
+
+        timer_interrupt = timer.update(cycle_delta)
+        if timer_interrupt:
+            motherboard.memory.IF_flag |= 0b0000_0100  # Timer interrupt
+
+        if counting:
+            now = build_options.now_ns()
+            motherboard.memory.counters.timer_ns += now - start
+            start = now
+
+        # Whether this update advances the display to the next scanline (which draws it, or presents the frame)
+        advancing = tracing and display._cycles_until_next_scanline <= 0
+        if advancing:
+            draw_start = build_options.now_ns()
+        interrupt_flag = display.update(cycle_delta)
+        motherboard.memory.IF_flag |= interrupt_flag  # LCDC-STAT or V-Blank interrupts
+        if advancing:
+            motherboard.memory.tracer.scanline(draw_start, display.LY, display.LCDC & 0b1000_0000)
+
+        if counting:
+            now = build_options.now_ns()
+            motherboard.memory.counters.ppu_ns += now - start
+            start = now
+
+        cycles += cycle_delta
+        if tracing_instructions:
+            motherboard.memory.instruction_trace.cycles += cycle_delta
+        if sampler is not None:
+            sampler.tick(motherboard, cycle_delta)
+
+        if interrupt_flag & 0b0000_0001:
+            # The display has entered V-Blank, so the frame is complete
+            if counting:
+                motherboard.memory.counters.frames += 1
+            return cycles
+
+
+def _trace_instruction(motherboard):
+    motherboard.memory.instruction_trace.begin(motherboard.program_counter)
+    opcode = motherboard.memory.read(motherboard.program_counter)
+    if opcode == 0xCB:
+        opcode = 0x100 | motherboard.memory.read(motherboard.program_counter + 1)
+    motherboard.memory.instruction_trace.registers(
+        opcode, motherboard.reg.stack_pointer, motherboard.reg.A, motherboard.reg.F, motherboard.reg.B,
+        motherboard.reg.C, motherboard.reg.D, motherboard.reg.E, motherboard.reg.H, motherboard.reg.L,
+        motherboard.IME_flag)
+    return 0
 
 
 def _handle_interrupts(motherboard):
@@ -164,6 +825,9 @@ def _handle_interrupts(motherboard):
         # optimization: don't bother to check for flags if none of the last 5 bits are set
         if flag & 0b0001_1111:
 
+            if build_options.TRACING and motherboard.memory.tracer is not None:
+                motherboard.memory.tracer.interrupt(flag & 0b0001_1111)
+
             if flag & 0b0000_0001:  # V-Blank
                 motherboard.IME_flag = False
                 motherboard.push_to_stack(motherboard.program_counter)
@@ -186,7 +850,9 @@ def _handle_interrupts(motherboard):
                 motherboard.halted = False
                 return 5  # (https://gbdev.io/pandocs/#interrupt-service-routine)
             elif flag & 0b0000_1000:  # Serial I/O transfer complete
-                logger.info("Got a Serial IO interrupt")
+                if build_options.LOG_DEBUG:
+                    with cython.gil:
+                        logger.debug("Got a Serial IO interrupt")
                 motherboard.IME_flag = False
                 motherboard.push_to_stack(motherboard.program_counter)
                 motherboard.program_counter = 0x58
@@ -194,21 +860,21 @@ def _handle_interrupts(motherboard):
                 motherboard.halted = False
                 return 5  # (https://gbdev.io/pandocs/#interrupt-service-routine)
             elif flag & 0b0001_0000:  # Transition from high to low on keypad
-                logger.info("Got a Joypad interrupt")
-                logger.warn("TODO: Implement interrupt: Transition from high to low (joypad)")
-                raise ValueError("Implement interrupt high to low (joypad)")
+                with cython.gil:
+                    logger.info("Got a Joypad interrupt")
+                    logger.warn("TODO: Implement interrupt: Transition from high to low (joypad)")
+                    raise ValueError("Implement interrupt high to low (joypad)")
     return 0
 
 
-def _handle_header_and_entrypoint(motherboard: Motherboard) -> CartridgeHeader:
-    motherboard.program_counter = 0x100
+def _parse_header(memory: Memory) -> CartridgeHeader:
     b = b""
     for i in range(0x0100, 0x0150):
-        b += bytes([motherboard.memory.read(i)])
+        b += bytes([memory.read(i)])
     logger.debug("Cartridge bytes to parse:")
     logger.debug(str(b))
     logger.debug("")
-    logger.debug(str(motherboard.memory._cartridge))
+    logger.debug(str(memory._cartridge))
 
     header = CartridgeHeader.parse(b)
     logger.debug(str(header))
@@ -218,8 +884,25 @@ def _handle_header_and_entrypoint(motherboard: Motherboard) -> CartridgeHeader:
         pass
     else:
         logger.warn(f"We may not handle cartridge correctly: {header.cartridge_type}")
+    return header
+
+
+def _cartridge_ram_size(cartridge_data) -> int:
+    ram_size_enum = RAM_Size(cartridge_data[0x149])
+    if ram_size_enum == RAM_Size.NONE:
+        return 0
+    elif ram_size_enum == RAM_Size.RAM_32KB:
+        return 32 * 1024
+    elif ram_size_enum == RAM_Size.RAM_8KB:
+        return 8 * 1024
+    else:
+        raise ValueError(f"TODO Handle RAM size: {ram_size_enum}")
 
+
+def _handle_header_and_entrypoint(motherboard: Motherboard) -> CartridgeHeader:
+    motherboard.program_counter = 0x100
+    header = _parse_header(motherboard.memory)
     logger.debug("Will load instruction from " + str(motherboard.program_counter))
-    instruction_decoding.fetch_decode_execute(motherboard)
-    instruction_decoding.fetch_decode_execute(motherboard)
+    cpu.execute(motherboard)
+    cpu.execute(motherboard)
     return header
@@ -0,0 +1,64 @@
+from typing import Optional
+
+from gb_pymulator import logger
+
+# Return values of Frontend.handle_user_input()
+INPUT_QUIT = -1
+INPUT_NONE = 0
+INPUT_JOYPAD = 1
+INPUT_SAVE_STATE = 2
+INPUT_LOAD_STATE = 3
+
+
+class Frontend:
+    """ Presents the frames drawn by the display (PPU) and feeds user input into the emulator """
+
+    # Button mask (see joypad.py) that is applied when handle_user_input() returns INPUT_JOYPAD
+    buttons = 0
+
+    # True if the frontend has a rewind key. The emulator only keeps a rewind history (which costs time every frame)
+    # for frontends that can rewind
+    can_rewind = False
+    # True while the user holds the rewind key. The emulator then steps backwards through its rewind history
+    rewinding = False
+
+    # Counted for the metrics (see metrics.py): the frames that weren't shown, and the scanlines that were compared
+    # with the ones on screen when a frame was shown, of which some were unchanged (so they weren't redrawn)
+    skipped_frames = 0
+    compared_lines = 0
+    unchanged_lines = 0
+
+    def attach(self, display):
+        # Called by the display when it's created. The frame is drawn into display.pixel_buffer (160x144 RGB)
+        pass
+
+    def set_title(self, title: str):
+        pass
+
+    def present(self):
+        # Called once per frame, when the display enters V-Blank
+        pass
+
+    def handle_user_input(self) -> int:
+        return INPUT_NONE
+
+    def show_hud(self, text: Optional[str]):
+        # A line of text (e.g. the metrics) over the frame, or None to hide it
+        pass
+
+
+class HeadlessFrontend(Frontend):
+    """ Runs without a window (and without pygame), keeping the latest frame in memory """
+
+    def __init__(self):
+        self.pixel_buffer = None
+        self.frame_count = 0
+
+    def attach(self, display):
+        self.pixel_buffer = display.pixel_buffer
+
+    def set_title(self, title: str):
+        logger.debug(f"Running headless: {title}")
+
+    def present(self):
+        self.frame_count += 1
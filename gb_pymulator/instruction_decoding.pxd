@@ -1,5 +1,5 @@
-# cython: profile=True
 import cython
+from gb_pymulator cimport build_options
 from gb_pymulator.motherboard cimport Motherboard
 
 
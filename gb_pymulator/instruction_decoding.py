@@ -1,7 +1,6 @@
-# cython: profile=True
-
 from typing import Optional
 
+from gb_pymulator import build_options
 from gb_pymulator.instructions import (
     Reg,
     Addr,
@@ -539,6 +538,8 @@ def fetch_decode_execute(motherboard) -> int:
 
 def _fetch_and_decode_instruction(motherboard) -> Optional[Instruction]:
     opcode = motherboard.load_u8()
+    if build_options.COUNTERS and motherboard.memory.counters is not None:
+        motherboard.memory.counters.count_opcode(opcode)
 
     if opcode in OPCODE_TABLE:
         return OPCODE_TABLE[opcode]
@@ -745,6 +746,8 @@ def _fetch_and_decode_instruction(motherboard) -> Optional[Instruction]:
     elif opcode == 0xCB:
 
         opcode_2 = motherboard.load_u8()
+        if build_options.COUNTERS and motherboard.memory.counters is not None:
+            motherboard.memory.counters.count_opcode(0x100 + opcode_2)
 
         if opcode_2 in EXTENDED_OPCODE_TABLE:
             return EXTENDED_OPCODE_TABLE[opcode_2]
@@ -0,0 +1,26 @@
+import cython
+from gb_pymulator cimport build_options
+
+cdef int RECORD_WORDS
+cdef int ACCESS_READ
+cdef int ACCESS_WRITE
+
+@cython.final
+cdef class InstructionTrace:
+
+    cdef readonly object words
+    cdef unsigned long long[::1] _words
+    cdef readonly long long capacity
+    cdef readonly long long count
+    cdef public long long cycles
+    cdef long long _current
+
+    cdef int begin(self, int pc) noexcept nogil
+    @cython.locals(word=cython.ulonglong)
+    cdef int registers(self, int opcode, int sp, int a, int f, int b, int c, int d, int e, int h, int l,
+                       int ime) noexcept nogil
+    @cython.locals(pc=cython.int, access=cython.int)
+    cdef int read_access(self, int address, int value) noexcept nogil
+    cdef int write_access(self, int address, int value) noexcept nogil
+    @cython.locals(word=cython.ulonglong, mask=cython.ulonglong)
+    cdef int _access(self, int address, int value, int access) noexcept nogil
@@ -0,0 +1,112 @@
+"""
+A trace of the last instructions that were executed, for finding out what led up to a crash (e.g. "Unknown opcode" or
+"Disallowed read"). The records are kept in a fixed-size ring buffer, that the emulator writes to a file (see
+trace_file.py for the format, and for reading it with NumPy) when it crashes.
+
+Like the trace events in tracing.py, it's compiled out unless the extension modules are built with
+GB_PYMULATOR_TRACING=1, and then the instructions are only recorded for an emulator that has it enabled (with
+Emulator.enable_instruction_trace()).
+"""
+
+import sys
+from array import array
+
+from gb_pymulator import build_options
+from gb_pymulator import trace_file
+
+# Whether the instruction trace is compiled in
+AVAILABLE = build_options.TRACING
+
+# 2 MB
+DEFAULT_CAPACITY = 1 << 16
+
+ACCESS_READ = trace_file.ACCESS_READ
+ACCESS_WRITE = trace_file.ACCESS_WRITE
+
+# A record is 4 words (see trace_file.FIELDS for what the bytes are, on a little-endian machine):
+#   cycle
+#   pc | opcode << 16 | sp << 32 | address << 48
+#   A | F << 8 | B << 16 | C << 24 | D << 32 | E << 40 | H << 48 | L << 56
+#   value | access << 8 | IME << 16
+RECORD_WORDS = 4
+
+
+class InstructionTrace:
+    def __init__(self, capacity: int = DEFAULT_CAPACITY, cycles: int = 0):
+        """ :param cycles: the emulated cycle that the trace starts at """
+        if capacity <= 0:
+            raise ValueError(f"Expected a positive capacity, but got {capacity}")
+        self.capacity = capacity
+        self.words = array("Q", bytes(8 * RECORD_WORDS * capacity))
+        # A typed view, that can be written without holding the GIL
+        self._words = self.words
+        # The number of instructions that have been recorded (the oldest ones have been overwritten, past the capacity)
+        self.count = 0
+        self.cycles = cycles
+        self._current = 0
+
+    def begin(self, pc):
+        # Starts the record of an instruction. The memory that the instruction is read from isn't one of its accesses.
+        self._current = (self.count % self.capacity) * RECORD_WORDS
+        self._words[self._current] = self.cycles
+        self._words[self._current + 1] = pc
+        self._words[self._current + 2] = 0
+        self._words[self._current + 3] = 0
+        self.count += 1
+        return 0
+
+    def registers(self, opcode, sp, a, f, b, c, d, e, h, l, ime):
+        # The rest of the record, before the instruction executes
+        word = sp
+        self._words[self._current + 1] |= (word << 32) | (opcode << 16)
+        word = l
+        word = (word << 8) | h
+        word = (word << 8) | e
+        word = (word << 8) | d
+        word = (word << 8) | c
+        word = (word << 8) | b
+        word = (word << 8) | f
+        self._words[self._current + 2] = (word << 8) | a
+        self._words[self._current + 3] = ime << 16
+        return 0
+
+    def read_access(self, address, value):
+        if self.count == 0:
+            return 0
+        pc = self._words[self._current + 1] & 0xFFFF
+        access = (self._words[self._current + 3] >> 8) & 0xFF
+        if access == ACCESS_WRITE or pc <= address < pc + 3:
+            # A write is kept over a read, and the instruction's own bytes are fetched rather than accessed
+            return 0
+        self._access(address, value, ACCESS_READ)
+        return 0
+
+    def write_access(self, address, value):
+        if self.count != 0:
+            self._access(address, value, ACCESS_WRITE)
+        return 0
+
+    def _access(self, address, value, access):
+        mask = 0xFFFF
+        word = address
+        self._words[self._current + 1] = (self._words[self._current + 1] & ~(mask << 48)) | (word << 48)
+        word = (access << 8) | value
+        self._words[self._current + 3] = (self._words[self._current + 3] & ~0xFFFF) | word
+        return 0
+
+    def records(self) -> bytes:
+        """ The records, oldest first, in the byte order of trace files """
+        start = (self.count % self.capacity) * RECORD_WORDS if self.count > self.capacity else 0
+        end = min(self.count, self.capacity) * RECORD_WORDS
+        words = self.words[start:end] + self.words[:start]
+        if sys.byteorder == "big":
+            words.byteswap()
+        return words.tobytes()
+
+    def save(self, path: str):
+        """ Write the records to a trace file (see trace_file.py) """
+        records = self.records()
+        with open(path, "wb") as file:
+            file.write(trace_file.MAGIC)
+            file.write(trace_file.HEADER.pack(trace_file.RECORD_SIZE, len(records) // trace_file.RECORD_SIZE))
+            file.write(records)
@@ -1,6 +1,7 @@
 from dataclasses import dataclass
 from typing import Any, Optional
 
+from gb_pymulator import build_options
 from gb_pymulator import logger
 from gb_pymulator.motherboard import Motherboard
 
@@ -97,7 +98,8 @@ class HALT(Instruction):
 
     def execute(self, motherboard: Motherboard):
         motherboard.halted = True
-        logger.debug("HALTING...")
+        if build_options.LOG_DEBUG:
+            logger.debug("HALTING...")
         return 4
 
 
@@ -380,7 +382,8 @@ class DI(Instruction):
 
     def execute(self, motherboard: Motherboard):
         motherboard.disable_interrupts_after_next_instruction()
-        logger.debug("Disabling interrupts (after next instruction)")
+        if build_options.LOG_DEBUG:
+            logger.debug("Disabling interrupts (after next instruction)")
         return 4
 
 
@@ -390,7 +393,8 @@ class EI(Instruction):
 
     def execute(self, motherboard: Motherboard):
         motherboard.enable_interrupts_after_next_instruction()
-        logger.debug("Enabling interrupts (after next instruction)")
+        if build_options.LOG_DEBUG:
+            logger.debug("Enabling interrupts (after next instruction)")
         return 4
 
 
@@ -903,7 +907,8 @@ class STOP(Instruction):
         motherboard.stopped = True
         motherboard.memory.write(0xFF04, 0) # Write to DIV
         # TODO Timer should stop running here (https://gbdev.io/pandocs/#ff04-div-divider-register-r-w)
-        logger.info("Stopping CPU and LCD")
+        if build_options.LOG_INFO:
+            logger.info("Stopping CPU and LCD")
 
         return 4
 
@@ -0,0 +1,18 @@
+import cython
+from gb_pymulator cimport build_options
+from gb_pymulator cimport logger
+
+@cython.final
+cdef class JoyPad:
+
+    cdef int _selected_keys
+    cdef int _button_keys
+    cdef int _direction_keys
+
+    cpdef tuple get_state(self)
+    cpdef set_state(self, tuple state)
+    @cython.locals(newly_pressed=int)
+    cpdef bint set_buttons(self, int mask)
+    cpdef int get_buttons(self)
+    cpdef int register_write(self, int value) noexcept nogil
+    cpdef int register_read(self) noexcept nogil
@@ -1,5 +1,21 @@
+try:
+    import cython
+except ImportError:
+    from gb_pymulator import cython_shim as cython
+
+from gb_pymulator import build_options
 from gb_pymulator import logger
 
+# Bits of the button mask used by JoyPad.set_buttons(). A set bit means that the button is pressed.
+BUTTON_A = 0b0000_0001
+BUTTON_B = 0b0000_0010
+BUTTON_SELECT = 0b0000_0100
+BUTTON_START = 0b0000_1000
+BUTTON_RIGHT = 0b0001_0000
+BUTTON_LEFT = 0b0010_0000
+BUTTON_UP = 0b0100_0000
+BUTTON_DOWN = 0b1000_0000
+
 
 class JoyPad:
     def __init__(self):
@@ -7,64 +23,40 @@ class JoyPad:
         self._button_keys = 0xFF
         self._direction_keys = 0xFF
 
-    def on_press_down(self):
-        self._direction_keys &= 0b0111
-
-    def on_press_up(self):
-        self._direction_keys &= 0b1011
-
-    def on_press_left(self):
-        self._direction_keys &= 0b1101
-
-    def on_press_right(self):
-        self._direction_keys &= 0b1110
-
-    def on_press_start(self):
-        self._button_keys &= 0b0111
-
-    def on_press_select(self):
-        self._button_keys &= 0b1011
-
-    def on_press_b(self):
-        self._button_keys &= 0b1101
-
-    def on_press_a(self):
-        self._button_keys &= 0b1110
-
-    def on_release_down(self):
-        self._direction_keys |= 0b1000
-
-    def on_release_up(self):
-        self._direction_keys |= 0b0100
-
-    def on_release_left(self):
-        self._direction_keys |= 0b0010
-
-    def on_release_right(self):
-        self._direction_keys |= 0b0001
-
-    def on_release_start(self):
-        self._button_keys |= 0b1000
+    def get_state(self) -> tuple:
+        return self._selected_keys, self._button_keys, self._direction_keys
 
-    def on_release_select(self):
-        self._button_keys |= 0b0100
+    def set_state(self, state: tuple):
+        self._selected_keys, self._button_keys, self._direction_keys = state
 
-    def on_release_b(self):
-        self._button_keys |= 0b0010
+    def set_buttons(self, mask):
+        # Returns True if any button went from released to pressed (which requests a joypad interrupt)
+        newly_pressed = mask & ~self.get_buttons()
+        # The upper bits are kept set (as they are at power on), so that setting the mask that is already pressed has
+        # no effect on the machine state
+        self._button_keys = 0b1111_0000 | (~mask & 0b1111)
+        self._direction_keys = 0b1111_0000 | (~(mask >> 4) & 0b1111)
+        return newly_pressed != 0
 
-    def on_release_a(self):
-        self._button_keys |= 0b0001
+    def get_buttons(self):
+        return (~self._button_keys & 0b1111) | ((~self._direction_keys & 0b1111) << 4)
 
-    def register_write(self, value: int):
+    def register_write(self, value):
         if value & 0b0010_0000 == 0:
-            logger.debug("Preparing to read button keys")
+            if build_options.LOG_DEBUG:
+                with cython.gil:
+                    logger.debug("Preparing to read button keys")
             self._selected_keys = self._button_keys
         elif value & 0b0001_0000 == 0:
-            logger.debug("Preparing to read direction keys")
+            if build_options.LOG_DEBUG:
+                with cython.gil:
+                    logger.debug("Preparing to read direction keys")
             self._selected_keys = self._direction_keys
         else:
-            logger.debug("Won't read any keys")
+            if build_options.LOG_DEBUG:
+                with cython.gil:
+                    logger.debug("Won't read any keys")
             self._selected_keys = 0xFF
 
-    def register_read(self) -> int:
+    def register_read(self):
         return self._selected_keys
@@ -0,0 +1,708 @@
+"""
+Experimental: lockstep emulation of many instances of the same ROM, with the state stored as NumPy arrays.
+
+Every instance has its own registers, flags and memory, stored as one array per register ("structure of arrays").
+On each step, the instances are grouped by the opcode that they are about to execute, and each group is executed by
+a single vectorized handler. Instances that share a PC are always in the same group, and instances whose PCs have
+diverged (for example because they were given different inputs) are regrouped on every step.
+
+Only the CPU is emulated faithfully. The devices are approximated from each instance's cycle counter:
+- LY (0xFF44) and the V-Blank interrupt follow the scanline timing, but nothing is drawn
+- DIV (0xFF04) counts up every 256 cycles, and is reset by writes
+- The joypad (0xFF00) reads the button mask of the instance
+- The timer (TIMA), serial port, sound and LCD STAT interrupts are not emulated
+- MBC1-style ROM bank switching is supported, and cartridge RAM is a single 8kB bank
+"""
+
+import numpy
+
+CYCLES_PER_SCANLINE = 456
+CYCLES_PER_FRAME = 154 * CYCLES_PER_SCANLINE
+_VBLANK_OFFSET = 144 * CYCLES_PER_SCANLINE
+
+# Register indices, in the order used by the opcode encoding (where 6 means (HL)). F is stored at index 6.
+_B, _C, _D, _E, _H, _L, _F, _A = range(8)
+_ADDR_HL = 6
+
+_FLAG_Z = 0x80
+_FLAG_N = 0x40
+_FLAG_H = 0x20
+_FLAG_C = 0x10
+
+# Cycles of each unprefixed opcode. For conditional instructions this is the cost when the branch isn't taken.
+# Opcodes that don't exist are 0.
+_CYCLES = numpy.array([
+    4, 12, 8, 8, 4, 4, 8, 4, 20, 8, 8, 8, 4, 4, 8, 4,
+    4, 12, 8, 8, 4, 4, 8, 4, 12, 8, 8, 8, 4, 4, 8, 4,
+    8, 12, 8, 8, 4, 4, 8, 4, 8, 8, 8, 8, 4, 4, 8, 4,
+    8, 12, 8, 8, 12, 12, 12, 4, 8, 8, 8, 8, 4, 4, 8, 4,
+    4, 4, 4, 4, 4, 4, 8, 4, 4, 4, 4, 4, 4, 4, 8, 4,
+    4, 4, 4, 4, 4, 4, 8, 4, 4, 4, 4, 4, 4, 4, 8, 4,
+    4, 4, 4, 4, 4, 4, 8, 4, 4, 4, 4, 4, 4, 4, 8, 4,
+    8, 8, 8, 8, 8, 8, 4, 8, 4, 4, 4, 4, 4, 4, 8, 4,
+    4, 4, 4, 4, 4, 4, 8, 4, 4, 4, 4, 4, 4, 4, 8, 4,
+    4, 4, 4, 4, 4, 4, 8, 4, 4, 4, 4, 4, 4, 4, 8, 4,
+    4, 4, 4, 4, 4, 4, 8, 4, 4, 4, 4, 4, 4, 4, 8, 4,
+    4, 4, 4, 4, 4, 4, 8, 4, 4, 4, 4, 4, 4, 4, 8, 4,
+    8, 12, 12, 16, 12, 16, 8, 16, 8, 16, 12, 0, 12, 24, 8, 16,
+    8, 12, 12, 0, 12, 16, 8, 16, 8, 16, 12, 0, 12, 0, 8, 16,
+    12, 12, 8, 0, 0, 16, 8, 16, 16, 4, 16, 0, 0, 0, 8, 16,
+    12, 12, 8, 4, 0, 16, 8, 16, 12, 8, 16, 4, 0, 0, 8, 16,
+], dtype=numpy.int64)
+
+_LENGTHS = numpy.ones(256, dtype=numpy.int64)
+for _opcode in (0x06, 0x0E, 0x16, 0x1E, 0x26, 0x2E, 0x36, 0x3E, 0x10, 0x18, 0x20, 0x28, 0x30, 0x38,
+                0xC6, 0xCE, 0xD6, 0xDE, 0xE6, 0xEE, 0xF6, 0xFE, 0xE0, 0xF0, 0xE8, 0xF8, 0xCB):
+    _LENGTHS[_opcode] = 2
+for _opcode in (0x01, 0x11, 0x21, 0x31, 0x08, 0xC2, 0xC3, 0xCA, 0xD2, 0xDA, 0xC4, 0xCC, 0xCD, 0xD4, 0xDC,
+                0xEA, 0xFA):
+    _LENGTHS[_opcode] = 3
+
+# Interrupt vectors, indexed by the lowest set bit of the pending interrupts
+_INTERRUPT_VECTORS = numpy.zeros(32, dtype=numpy.int64)
+for _bit in range(5):
+    _INTERRUPT_VECTORS[1 << _bit] = 0x40 + 8 * _bit
+
+
+class LockstepCore:
+    def __init__(self, rom: bytes, num_instances: int):
+        self.num_instances = num_instances
+        self._rom = numpy.frombuffer(bytes(rom), dtype=numpy.uint8)
+        self._rom_size = len(self._rom)
+
+        n = num_instances
+        # Same initial state as the Emulator: the boot ROM is skipped and execution starts at the entry point
+        self.regs = numpy.zeros((n, 8), dtype=numpy.uint8)
+        self.sp = numpy.full(n, 0xFFFE, dtype=numpy.int64)
+        self.pc = numpy.full(n, 0x100, dtype=numpy.int64)
+        self.ime = numpy.ones(n, dtype=bool)
+        self.halted = numpy.zeros(n, dtype=bool)
+        self.cycles = numpy.zeros(n, dtype=numpy.int64)
+        self.memory = numpy.zeros((n, 0x10000), dtype=numpy.uint8)
+        self.buttons = numpy.zeros(n, dtype=numpy.uint8)
+        self._ei_countdown = numpy.zeros(n, dtype=numpy.int8)
+        self._rom_bank_offset = numpy.zeros(n, dtype=numpy.int64)
+        self._div_start = numpy.zeros(n, dtype=numpy.int64)
+        self.memory[:, 0xFF00] = 0xFF
+
+        self._handlers = [None] * 256
+        self._install_handlers()
+
+    # -------------------
+    #   Public API
+    # -------------------
+
+    def step(self):
+        """ Execute one instruction (or service one interrupt) on every instance """
+        self._step(numpy.arange(self.num_instances))
+
+    def run_cycles(self, cycles: int):
+        target = self.cycles + cycles
+        while True:
+            active = numpy.flatnonzero(self.cycles < target)
+            if len(active) == 0:
+                return
+            self._step(active)
+
+    def run_frames(self, n: int):
+        self.run_cycles(n * CYCLES_PER_FRAME)
+
+    def set_buttons(self, masks):
+        """ One button mask per instance (see BUTTON_* in joypad.py) """
+        masks = numpy.asarray(masks, dtype=numpy.uint8)
+        newly_pressed = masks & ~self.buttons
+        self.buttons[:] = masks
+        self.memory[newly_pressed != 0, 0xFF0F] |= 0b0001_0000  # Joypad interrupt
+
+    def read_memory(self, address: int, length: int = 1):
+        """ A (num_instances, length) array of the given address range, as seen by the CPU """
+        idx = numpy.repeat(numpy.arange(self.num_instances), length)
+        addresses = numpy.tile(numpy.arange(address, address + length), self.num_instances)
+        return self._read(idx, addresses).reshape(self.num_instances, length)
+
+    # -------------------
+    #   Stepping
+    # -------------------
+
+    def _step(self, active):
+        self._handle_interrupts(active)
+
+        cycles_before = self.cycles[active]
+        running = active[~self.halted[active]]
+        self.cycles[active[self.halted[active]]] += 4
+
+        if len(running) > 0:
+            pcs = self.pc[running]
+            opcodes = self._read(running, pcs)
+            order = numpy.argsort(opcodes, kind="stable")
+            boundaries = numpy.flatnonzero(numpy.diff(opcodes[order])) + 1
+            for group in numpy.split(order, boundaries):
+                opcode = int(opcodes[group[0]])
+                idx = running[group]
+                pc = pcs[group]
+                handler = self._handlers[opcode]
+                if handler is None:
+                    raise ValueError(f"Unknown opcode: {hex(opcode)}")
+                self.pc[idx] = (pc + _LENGTHS[opcode]) & 0xFFFF
+                extra_cycles = handler(idx, pc)
+                self.cycles[idx] += _CYCLES[opcode] + extra_cycles
+
+            # EI takes effect after the instruction that follows it
+            counting = running[self._ei_countdown[running] > 0]
+            self._ei_countdown[counting] -= 1
+            self.ime[counting[self._ei_countdown[counting] == 0]] = True
+
+        # Request the V-Blank interrupt on instances that have reached line 144
+        frame_before = (cycles_before - _VBLANK_OFFSET) // CYCLES_PER_FRAME
+        frame_after = (self.cycles[active] - _VBLANK_OFFSET) // CYCLES_PER_FRAME
+        self.memory[active[frame_before != frame_after], 0xFF0F] |= 0b0000_0001
+
+    def _handle_interrupts(self, active):
+        pending = (self.memory[active, 0xFFFF] & self.memory[active, 0xFF0F] & 0x1F).astype(numpy.int64)
+        self.halted[active[pending != 0]] = False
+
+        serviced = (pending != 0) & self.ime[active]
+        if not serviced.any():
+            return
+        idx = active[serviced]
+        interrupt_bit = pending[serviced] & -pending[serviced]
+        self.ime[idx] = False
+        self._push(idx, self.pc[idx])
+        self.pc[idx] = _INTERRUPT_VECTORS[interrupt_bit]
+        self.memory[idx, 0xFF0F] &= ~interrupt_bit.astype(numpy.uint8)
+        self.cycles[idx] += 20
+
+    # -------------------
+    #   Memory
+    # -------------------
+
+    def _read(self, idx, address):
+        address = numpy.asarray(address, dtype=numpy.int64)
+        value = self.memory[idx, address]
+
+        in_rom = address < 0x8000
+        if in_rom.any():
+            rom_address = address[in_rom]
+            banked = rom_address >= 0x4000
+            rom_address = numpy.where(banked, self._rom_bank_offset[idx[in_rom]] + rom_address, rom_address)
+            value[in_rom] = self._rom[rom_address % self._rom_size]
+
+        in_io = address >= 0xFF00
+        if in_io.any():
+            io_idx = idx[in_io]
+            io_address = address[in_io]
+            cycles = self.cycles[io_idx]
+            io_value = value[in_io]
+            io_value = numpy.where(io_address == 0xFF44, (cycles // CYCLES_PER_SCANLINE) % 154, io_value)
+            io_value = numpy.where(io_address == 0xFF04, ((cycles - self._div_start[io_idx]) >> 8) & 0xFF,
+                                   io_value)
+            io_value = numpy.where(io_address == 0xFF00, self._joypad_register(io_idx), io_value)
+            value[in_io] = io_value
+
+        return value.astype(numpy.int64)
+
+    def _joypad_register(self, idx):
+        select = self.memory[idx, 0xFF00].astype(numpy.int64)
+        buttons = self.buttons[idx].astype(numpy.int64)
+        pressed = numpy.where(select & 0b0010_0000 == 0, buttons & 0x0F, 0)
+        pressed |= numpy.where(select & 0b0001_0000 == 0, buttons >> 4, 0)
+        return (select & 0xF0) | (~pressed & 0x0F)
+
+    def _write(self, idx, address, value):
+        address = numpy.asarray(address, dtype=numpy.int64)
+        value = numpy.asarray(value, dtype=numpy.int64) & 0xFF
+        if address.ndim == 0:
+            address = numpy.full(len(idx), address)
+        if value.ndim == 0:
+            value = numpy.full(len(idx), value)
+
+        in_rom = address < 0x8000
+        if in_rom.any():
+            bank_select = in_rom & (address >= 0x2000) & (address < 0x4000)
+            bank = numpy.maximum(value[bank_select], 1)
+            self._rom_bank_offset[idx[bank_select]] = (bank - 1) * 0x4000
+            not_rom = ~in_rom
+            idx, address, value = idx[not_rom], address[not_rom], value[not_rom]
+
+        self.memory[idx, address] = value
+
+        special = (address == 0xFF04) | (address == 0xFF46)
+        if special.any():
+            self._div_start[idx[address == 0xFF04]] = self.cycles[idx[address == 0xFF04]]
+            for i, source in zip(idx[address == 0xFF46], value[address == 0xFF46]):
+                # OAM DMA. (Rare enough to not be worth vectorizing)
+                source_addresses = numpy.arange(source * 0x100, source * 0x100 + 0xA0)
+                self.memory[i, 0xFE00:0xFEA0] = self._read(numpy.full(0xA0, i), source_addresses)
+
+    def _read_u16(self, idx, address):
+        return self._read(idx, address) | (self._read(idx, address + 1) << 8)
+
+    def _push(self, idx, value):
+        sp = (self.sp[idx] - 2) & 0xFFFF
+        self.sp[idx] = sp
+        self._write(idx, (sp + 1) & 0xFFFF, value >> 8)
+        self._write(idx, sp, value & 0xFF)
+
+    def _pop(self, idx):
+        sp = self.sp[idx]
+        value = self._read_u16(idx, sp)
+        self.sp[idx] = (sp + 2) & 0xFFFF
+        return value
+
+    # -------------------
+    #   Registers
+    # -------------------
+
+    def _get_r8(self, idx, r):
+        if r == _ADDR_HL:
+            return self._read(idx, self._get_pair(idx, _H))
+        return self.regs[idx, r].astype(numpy.int64)
+
+    def _set_r8(self, idx, r, value):
+        if r == _ADDR_HL:
+            self._write(idx, self._get_pair(idx, _H), value)
+        else:
+            self.regs[idx, r] = value & 0xFF
+
+    def _get_pair(self, idx, high):
+        return (self.regs[idx, high].astype(numpy.int64) << 8) | self.regs[idx, high + 1]
+
+    def _set_pair(self, idx, high, value):
+        self.regs[idx, high] = (value >> 8) & 0xFF
+        self.regs[idx, high + 1] = value & 0xFF
+
+    def _get_rp(self, idx, rp):
+        # BC, DE, HL, SP
+        if rp == 3:
+            return self.sp[idx]
+        return self._get_pair(idx, rp * 2)
+
+    def _set_rp(self, idx, rp, value):
+        if rp == 3:
+            self.sp[idx] = value & 0xFFFF
+        else:
+            self._set_pair(idx, rp * 2, value & 0xFFFF)
+
+    def _carry(self, idx):
+        return (self.regs[idx, _F].astype(numpy.int64) >> 4) & 1
+
+    def _set_flags(self, idx, z=None, n=None, h=None, c=None):
+        # Each flag is a boolean (array), or None to leave it unchanged
+        f = self.regs[idx, _F].astype(numpy.int64)
+        for bit, value in ((_FLAG_Z, z), (_FLAG_N, n), (_FLAG_H, h), (_FLAG_C, c)):
+            if value is not None:
+                f = numpy.where(value, f | bit, f & ~bit)
+        self.regs[idx, _F] = f
+
+    def _condition(self, idx, cc):
+        # NZ, Z, NC, C
+        f = self.regs[idx, _F]
+        flag = (f & _FLAG_Z) != 0 if cc < 2 else (f & _FLAG_C) != 0
+        return flag if cc % 2 else ~flag
+
+    # -------------------
+    #   Instructions
+    # -------------------
+
+    def _install_handlers(self):
+        h = self._handlers
+        h[0x00] = _no_op
+        h[0x10] = _no_op  # STOP
+        h[0x76] = self._halt
+        h[0xF3] = self._di
+        h[0xFB] = self._ei
+        h[0xCB] = self._prefix_cb
+        h[0x07] = self._rlca
+        h[0x0F] = self._rrca
+        h[0x17] = self._rla
+        h[0x1F] = self._rra
+        h[0x27] = self._daa
+        h[0x2F] = self._cpl
+        h[0x37] = self._scf
+        h[0x3F] = self._ccf
+        h[0x08] = self._ld_a16_sp
+        h[0x18] = self._jr
+        h[0xC3] = self._jp
+        h[0xE9] = self._jp_hl
+        h[0xCD] = self._call
+        h[0xC9] = self._ret
+        h[0xD9] = self._reti
+        h[0xE0] = self._ldh_a8_a
+        h[0xF0] = self._ldh_a_a8
+        h[0xE2] = self._ld_c_a
+        h[0xF2] = self._ld_a_c
+        h[0xEA] = self._ld_a16_a
+        h[0xFA] = self._ld_a_a16
+        h[0xE8] = self._add_sp_r8
+        h[0xF8] = self._ld_hl_sp_r8
+        h[0xF9] = self._ld_sp_hl
+
+        for rp in range(4):
+            h[0x01 + rp * 0x10] = _bind(self._ld_rp_d16, rp)
+            h[0x03 + rp * 0x10] = _bind(self._inc_rp, rp)
+            h[0x09 + rp * 0x10] = _bind(self._add_hl_rp, rp)
+            h[0x0B + rp * 0x10] = _bind(self._dec_rp, rp)
+            # (BC), (DE), (HL+), (HL-)
+            h[0x02 + rp * 0x10] = _bind(self._ld_indirect_a, rp)
+            h[0x0A + rp * 0x10] = _bind(self._ld_a_indirect, rp)
+            # BC, DE, HL, AF
+            h[0xC1 + rp * 0x10] = _bind(self._pop_rp, rp)
+            h[0xC5 + rp * 0x10] = _bind(self._push_rp, rp)
+
+        for r in range(8):
+            h[0x04 + r * 8] = _bind(self._inc_r8, r)
+            h[0x05 + r * 8] = _bind(self._dec_r8, r)
+            h[0x06 + r * 8] = _bind(self._ld_r8_d8, r)
+            for source in range(8):
+                if r != _ADDR_HL or source != _ADDR_HL:
+                    h[0x40 + r * 8 + source] = _bind(self._ld_r8_r8, r, source)
+            # ADD, ADC, SUB, SBC, AND, XOR, OR, CP
+            operation = r
+            for source in range(8):
+                h[0x80 + operation * 8 + source] = _bind(self._alu_r8, operation, source)
+            h[0xC6 + operation * 8] = _bind(self._alu_d8, operation)
+            h[0xC7 + r * 8] = _bind(self._rst, r * 8)
+
+        for cc in range(4):
+            h[0x20 + cc * 8] = _bind(self._jr_cc, cc)
+            h[0xC0 + cc * 8] = _bind(self._ret_cc, cc)
+            h[0xC2 + cc * 8] = _bind(self._jp_cc, cc)
+            h[0xC4 + cc * 8] = _bind(self._call_cc, cc)
+
+    def _halt(self, idx, pc):
+        self.halted[idx] = True
+        return 0
+
+    def _di(self, idx, pc):
+        self.ime[idx] = False
+        self._ei_countdown[idx] = 0
+        return 0
+
+    def _ei(self, idx, pc):
+        self._ei_countdown[idx] = 2
+        return 0
+
+    def _ld_rp_d16(self, rp, idx, pc):
+        self._set_rp(idx, rp, self._read_u16(idx, pc + 1))
+        return 0
+
+    def _inc_rp(self, rp, idx, pc):
+        self._set_rp(idx, rp, self._get_rp(idx, rp) + 1)
+        return 0
+
+    def _dec_rp(self, rp, idx, pc):
+        self._set_rp(idx, rp, self._get_rp(idx, rp) - 1)
+        return 0
+
+    def _add_hl_rp(self, rp, idx, pc):
+        hl = self._get_pair(idx, _H)
+        value = self._get_rp(idx, rp)
+        result = hl + value
+        self._set_pair(idx, _H, result & 0xFFFF)
+        self._set_flags(idx, n=False, h=(hl & 0xFFF) + (value & 0xFFF) > 0xFFF, c=result > 0xFFFF)
+        return 0
+
+    def _indirect_address(self, idx, rp):
+        if rp < 2:
+            return self._get_pair(idx, rp * 2)
+        hl = self._get_pair(idx, _H)
+        self._set_pair(idx, _H, (hl + (1 if rp == 2 else -1)) & 0xFFFF)
+        return hl
+
+    def _ld_indirect_a(self, rp, idx, pc):
+        self._write(idx, self._indirect_address(idx, rp), self.regs[idx, _A])
+        return 0
+
+    def _ld_a_indirect(self, rp, idx, pc):
+        self.regs[idx, _A] = self._read(idx, self._indirect_address(idx, rp))
+        return 0
+
+    def _pop_rp(self, rp, idx, pc):
+        value = self._pop(idx)
+        if rp == 3:
+            self.regs[idx, _A] = value >> 8
+            self.regs[idx, _F] = value & 0xF0
+        else:
+            self._set_pair(idx, rp * 2, value)
+        return 0
+
+    def _push_rp(self, rp, idx, pc):
+        if rp == 3:
+            value = (self.regs[idx, _A].astype(numpy.int64) << 8) | self.regs[idx, _F]
+        else:
+            value = self._get_pair(idx, rp * 2)
+        self._push(idx, value)
+        return 0
+
+    def _inc_r8(self, r, idx, pc):
+        value = self._get_r8(idx, r)
+        result = (value + 1) & 0xFF
+        self._set_r8(idx, r, result)
+        self._set_flags(idx, z=result == 0, n=False, h=(value & 0xF) == 0xF)
+        return 0
+
+    def _dec_r8(self, r, idx, pc):
+        value = self._get_r8(idx, r)
+        result = (value - 1) & 0xFF
+        self._set_r8(idx, r, result)
+        self._set_flags(idx, z=result == 0, n=True, h=(value & 0xF) == 0)
+        return 0
+
+    def _ld_r8_d8(self, r, idx, pc):
+        self._set_r8(idx, r, self._read(idx, pc + 1))
+        return 0
+
+    def _ld_r8_r8(self, r, source, idx, pc):
+        self._set_r8(idx, r, self._get_r8(idx, source))
+        return 0
+
+    def _alu_r8(self, operation, source, idx, pc):
+        self._alu(idx, operation, self._get_r8(idx, source))
+        return 0
+
+    def _alu_d8(self, operation, idx, pc):
+        self._alu(idx, operation, self._read(idx, pc + 1))
+        return 0
+
+    def _alu(self, idx, operation, value):
+        a = self.regs[idx, _A].astype(numpy.int64)
+        if operation == 0 or operation == 1:  # ADD, ADC
+            carry = self._carry(idx) if operation == 1 else 0
+            result = a + value + carry
+            self._set_flags(idx, z=(result & 0xFF) == 0, n=False, h=(a & 0xF) + (value & 0xF) + carry > 0xF,
+                            c=result > 0xFF)
+        elif operation == 2 or operation == 3 or operation == 7:  # SUB, SBC, CP
+            carry = self._carry(idx) if operation == 3 else 0
+            result = a - value - carry
+            self._set_flags(idx, z=(result & 0xFF) == 0, n=True, h=(a & 0xF) - (value & 0xF) - carry < 0,
+                            c=result < 0)
+            if operation == 7:
+                return
+        elif operation == 4:  # AND
+            result = a & value
+            self._set_flags(idx, z=result == 0, n=False, h=True, c=False)
+        elif operation == 5:  # XOR
+            result = a ^ value
+            self._set_flags(idx, z=result == 0, n=False, h=False, c=False)
+        else:  # OR
+            result = a | value
+            self._set_flags(idx, z=result == 0, n=False, h=False, c=False)
+        self.regs[idx, _A] = result & 0xFF
+
+    def _rlca(self, idx, pc):
+        a = self.regs[idx, _A].astype(numpy.int64)
+        self.regs[idx, _A] = ((a << 1) | (a >> 7)) & 0xFF
+        self._set_flags(idx, z=False, n=False, h=False, c=(a >> 7) == 1)
+        return 0
+
+    def _rrca(self, idx, pc):
+        a = self.regs[idx, _A].astype(numpy.int64)
+        self.regs[idx, _A] = (a >> 1) | ((a & 1) << 7)
+        self._set_flags(idx, z=False, n=False, h=False, c=(a & 1) == 1)
+        return 0
+
+    def _rla(self, idx, pc):
+        a = self.regs[idx, _A].astype(numpy.int64)
+        self.regs[idx, _A] = ((a << 1) | self._carry(idx)) & 0xFF
+        self._set_flags(idx, z=False, n=False, h=False, c=(a >> 7) == 1)
+        return 0
+
+    def _rra(self, idx, pc):
+        a = self.regs[idx, _A].astype(numpy.int64)
+        self.regs[idx, _A] = (a >> 1) | (self._carry(idx) << 7)
+        self._set_flags(idx, z=False, n=False, h=False, c=(a & 1) == 1)
+        return 0
+
+    def _daa(self, idx, pc):
+        a = self.regs[idx, _A].astype(numpy.int64)
+        f = self.regs[idx, _F]
+        n = (f & _FLAG_N) != 0
+        h = (f & _FLAG_H) != 0
+        c = (f & _FLAG_C) != 0
+        # After an addition, adjust if (half-)carry occurred or if the result is out of bounds.
+        # After a subtraction, only adjust if (half-)carry occurred.
+        adjust_high = numpy.where(n, c, c | (a > 0x99))
+        adjust_low = numpy.where(n, h, h | ((a & 0x0F) > 0x09))
+        correction = numpy.where(adjust_high, 0x60, 0) + numpy.where(adjust_low, 0x06, 0)
+        result = numpy.where(n, a - correction, a + correction) & 0xFF
+        self.regs[idx, _A] = result
+        self._set_flags(idx, z=result == 0, h=False, c=adjust_high)
+        return 0
+
+    def _cpl(self, idx, pc):
+        self.regs[idx, _A] = ~self.regs[idx, _A]
+        self._set_flags(idx, n=True, h=True)
+        return 0
+
+    def _scf(self, idx, pc):
+        self._set_flags(idx, n=False, h=False, c=True)
+        return 0
+
+    def _ccf(self, idx, pc):
+        self._set_flags(idx, n=False, h=False, c=self._carry(idx) == 0)
+        return 0
+
+    def _ld_a16_sp(self, idx, pc):
+        address = self._read_u16(idx, pc + 1)
+        sp = self.sp[idx]
+        self._write(idx, address, sp & 0xFF)
+        self._write(idx, (address + 1) & 0xFFFF, sp >> 8)
+        return 0
+
+    def _jr(self, idx, pc):
+        offset = self._read(idx, pc + 1)
+        self.pc[idx] = (pc + 2 + offset - ((offset & 0x80) << 1)) & 0xFFFF
+        return 0
+
+    def _jr_cc(self, cc, idx, pc):
+        taken = self._condition(idx, cc)
+        self._jr(idx[taken], pc[taken])
+        return numpy.where(taken, 4, 0)
+
+    def _jp(self, idx, pc):
+        self.pc[idx] = self._read_u16(idx, pc + 1)
+        return 0
+
+    def _jp_cc(self, cc, idx, pc):
+        taken = self._condition(idx, cc)
+        self._jp(idx[taken], pc[taken])
+        return numpy.where(taken, 4, 0)
+
+    def _jp_hl(self, idx, pc):
+        self.pc[idx] = self._get_pair(idx, _H)
+        return 0
+
+    def _call(self, idx, pc):
+        self._push(idx, (pc + 3) & 0xFFFF)
+        self.pc[idx] = self._read_u16(idx, pc + 1)
+        return 0
+
+    def _call_cc(self, cc, idx, pc):
+        taken = self._condition(idx, cc)
+        self._call(idx[taken], pc[taken])
+        return numpy.where(taken, 12, 0)
+
+    def _ret(self, idx, pc):
+        self.pc[idx] = self._pop(idx)
+        return 0
+
+    def _ret_cc(self, cc, idx, pc):
+        taken = self._condition(idx, cc)
+        self._ret(idx[taken], pc[taken])
+        return numpy.where(taken, 12, 0)
+
+    def _reti(self, idx, pc):
+        self.ime[idx] = True
+        return self._ret(idx, pc)
+
+    def _rst(self, address, idx, pc):
+        self._push(idx, (pc + 1) & 0xFFFF)
+        self.pc[idx] = address
+        return 0
+
+    def _ldh_a8_a(self, idx, pc):
+        self._write(idx, 0xFF00 + self._read(idx, pc + 1), self.regs[idx, _A])
+        return 0
+
+    def _ldh_a_a8(self, idx, pc):
+        self.regs[idx, _A] = self._read(idx, 0xFF00 + self._read(idx, pc + 1))
+        return 0
+
+    def _ld_c_a(self, idx, pc):
+        self._write(idx, 0xFF00 + self.regs[idx, _C].astype(numpy.int64), self.regs[idx, _A])
+        return 0
+
+    def _ld_a_c(self, idx, pc):
+        self.regs[idx, _A] = self._read(idx, 0xFF00 + self.regs[idx, _C].astype(numpy.int64))
+        return 0
+
+    def _ld_a16_a(self, idx, pc):
+        self._write(idx, self._read_u16(idx, pc + 1), self.regs[idx, _A])
+        return 0
+
+    def _ld_a_a16(self, idx, pc):
+        self.regs[idx, _A] = self._read(idx, self._read_u16(idx, pc + 1))
+        return 0
+
+    def _sp_plus_r8(self, idx, pc):
+        sp = self.sp[idx]
+        offset = self._read(idx, pc + 1)
+        self._set_flags(idx, z=False, n=False, h=(sp & 0xF) + (offset & 0xF) > 0xF,
+                        c=(sp & 0xFF) + offset > 0xFF)
+        return (sp + offset - ((offset & 0x80) << 1)) & 0xFFFF
+
+    def _add_sp_r8(self, idx, pc):
+        self.sp[idx] = self._sp_plus_r8(idx, pc)
+        return 0
+
+    def _ld_hl_sp_r8(self, idx, pc):
+        self._set_pair(idx, _H, self._sp_plus_r8(idx, pc))
+        return 0
+
+    def _ld_sp_hl(self, idx, pc):
+        self.sp[idx] = self._get_pair(idx, _H)
+        return 0
+
+    def _prefix_cb(self, idx, pc):
+        opcodes = self._read(idx, pc + 1)
+        cycles = numpy.zeros(len(idx), dtype=numpy.int64)
+        order = numpy.argsort(opcodes, kind="stable")
+        boundaries = numpy.flatnonzero(numpy.diff(opcodes[order])) + 1
+        for group in numpy.split(order, boundaries):
+            opcode = int(opcodes[group[0]])
+            cycles[group] = self._execute_cb(idx[group], opcode)
+        return cycles
+
+    def _execute_cb(self, idx, opcode):
+        operation = opcode >> 6
+        y = (opcode >> 3) & 7
+        r = opcode & 7
+        value = self._get_r8(idx, r)
+
+        if operation == 1:  # BIT
+            self._set_flags(idx, z=(value >> y) & 1 == 0, n=False, h=True)
+            return 12 if r == _ADDR_HL else 8
+        elif operation == 2:  # RES
+            result = value & ~(1 << y)
+        elif operation == 3:  # SET
+            result = value | (1 << y)
+        else:
+            if y == 0:  # RLC
+                carry = value >> 7
+                result = ((value << 1) | carry) & 0xFF
+            elif y == 1:  # RRC
+                carry = value & 1
+                result = (value >> 1) | (carry << 7)
+            elif y == 2:  # RL
+                carry = value >> 7
+                result = ((value << 1) | self._carry(idx)) & 0xFF
+            elif y == 3:  # RR
+                carry = value & 1
+                result = (value >> 1) | (self._carry(idx) << 7)
+            elif y == 4:  # SLA
+                carry = value >> 7
+                result = (value << 1) & 0xFF
+            elif y == 5:  # SRA
+                carry = value & 1
+                result = (value >> 1) | (value & 0x80)
+            elif y == 6:  # SWAP
+                carry = 0
+                result = ((value & 0x0F) << 4) | (value >> 4)
+            else:  # SRL
+                carry = value & 1
+                result = value >> 1
+            self._set_flags(idx, z=result == 0, n=False, h=False, c=carry == 1)
+
+        self._set_r8(idx, r, result)
+        return 16 if r == _ADDR_HL else 8
+
+
+def _no_op(idx, pc):
+    return 0
+
+
+def _bind(handler, *args):
+    def bound(idx, pc):
+        return handler(*args, idx, pc)
+
+    return bound
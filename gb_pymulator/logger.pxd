@@ -1,4 +1,3 @@
-# cython: profile=True
 import cython
 
 cdef int TRACE
@@ -6,9 +5,13 @@ cdef int DEBUG
 cdef int INFO
 cdef int WARN
 cdef int LOG_LEVEL
+cdef int WARN_REPEATS
 
+cpdef set_level(str name)
 cpdef warn(str msg)
+cpdef bint warning_due(long long count) noexcept nogil
+cpdef warn_limited(long long count, str msg, tuple args=*)
+cdef bint _is_power_of_ten(long long count) noexcept nogil
 cpdef info(str msg)
 cpdef debug(str msg)
 cpdef trace(str msg)
-
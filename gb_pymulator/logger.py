@@ -1,16 +1,65 @@
-# cython: profile=True
+"""
+Log messages, printed to stdout.
+
+The messages in the emulation loop (e.g. every joypad poll, or every EI instruction) are guarded by the level that is
+compiled in (build_options.LOG_DEBUG etc.), so below it, neither the message nor taking the GIL costs anything:
+
+    if build_options.LOG_DEBUG:
+        with cython.gil:
+            logger.debug(f"...")
+
+The level that is printed can then be raised or lowered with set_level() while running.
+"""
+
 TRACE = 1
 DEBUG = 2
 INFO = 3
 WARN = 4
 
+LEVELS = {"trace": TRACE, "debug": DEBUG, "info": INFO, "warn": WARN}
+
 LOG_LEVEL = INFO
 
+# A warning that repeats (see warn_limited()) is printed this many times, and after that only when the number of
+# times it has happened reaches a power of 10
+WARN_REPEATS = 3
+
+
+def set_level(name):
+    """ Print the messages of this level ("trace", "debug", "info" or "warn") and above """
+    global LOG_LEVEL
+    if name not in LEVELS:
+        raise ValueError(f"Unknown log level: {name} (expected one of {', '.join(LEVELS)})")
+    LOG_LEVEL = LEVELS[name]
+
 
 def warn(msg):
     print(f"[WARN] {msg}")
 
 
+def warning_due(count):
+    """ Whether the count-th time that a repeated warning happens is printed (see WARN_REPEATS) """
+    return count <= WARN_REPEATS or _is_power_of_ten(count)
+
+
+def warn_limited(count, msg, args=()):
+    """
+    A warning for something that can happen every frame, so that it doesn't flood the output. The caller counts how
+    many times it has happened, and can check warning_due(count) first, without holding the GIL. The message is only
+    formatted (with str.format(*args)) if it's printed.
+    """
+    if not warning_due(count):
+        return
+    msg = msg.format(*args)
+    warn(msg if count <= WARN_REPEATS else f"{msg} (happened {count} times)")
+
+
+def _is_power_of_ten(count):
+    while count % 10 == 0:
+        count //= 10
+    return count == 1
+
+
 def info(msg):
     if LOG_LEVEL <= INFO:
         print(f"[INFO] {msg}")
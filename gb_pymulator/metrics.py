@@ -0,0 +1,155 @@
+"""
+Live performance metrics of a running emulator: frames/s, speed relative to a real Game Boy, instructions/s, a
+histogram of frame times, and how much of the presenting the frontend skipped (frames that it didn't show, and lines
+that it didn't redraw since they hadn't changed).
+
+The emulator counts the time of each frame in a histogram as it ends (which reads the clock once per frame, also
+within a run_frames(n) call), and updates the other counters once per run_frames() call. The rates are computed at the
+end of each window (a second by default), which is also when a line is appended to the JSON-lines
+file and the heads-up display in the window is updated, if they are enabled.
+"""
+
+import time
+from array import array
+from typing import Optional
+
+from gb_pymulator.frontend import Frontend
+
+# A real Game Boy's clock
+CYCLES_PER_SECOND = 4_194_304
+
+DEFAULT_WINDOW = 1.0
+
+# Frame times are counted by powers of 2 of microseconds: bucket i holds the frames that took less than 2^i us (and at
+# least 2^(i-1) us), and the last bucket also holds the slower ones
+HISTOGRAM_BUCKETS = 20
+
+
+class Metrics:
+    def __init__(self, frontend: Optional[Frontend] = None, window: float = DEFAULT_WINDOW,
+                 json_file: Optional[str] = None, hud: bool = False):
+        """
+        :param frontend: the emulator's frontend, that the skipped frames and redrawn lines are counted by
+        :param window: seconds between the updates of the rates
+        :param json_file: append the metrics to this file at the end of each window, as a line of JSON
+        :param hud: show the rates on the frontend's heads-up display
+        """
+        if window <= 0:
+            raise ValueError(f"Expected a positive window, but got {window}")
+        self.window_ns = int(window * 1_000_000_000)
+        self.frames = 0
+        self.cycles = 0
+        self.instructions = 0
+        # Frame counts by frame time (see HISTOGRAM_BUCKETS), that the emulator adds to. A frame's time is the wall
+        # time since the previous one ended (or since the metrics were enabled), so it includes presenting it and
+        # polling the input, or whatever an embedding program does between frames. The last element is the end time of
+        # the previous frame.
+        self._frame_times = array("q", bytes(8 * (HISTOGRAM_BUCKETS + 1)))
+
+        # The rates over the last window
+        self.fps = 0.0
+        self.speed = 0.0
+        self.instructions_per_second = 0.0
+        # (None until the frontend has shown a frame)
+        self.line_cache_hit_rate = None
+
+        self._json_file = open(json_file, "a") if json_file is not None else None
+        self._frontend = frontend
+        self._hud = hud and frontend is not None
+        self._start_ns = time.perf_counter_ns()
+        self._last_ns = self._start_ns
+        self._window = (self._start_ns, 0, 0, 0, *_line_counts(frontend))
+
+    def on_frames(self, frames: int, cycles: int, instructions: int):
+        # Called by the emulator after running frames
+        now = time.perf_counter_ns()
+        self._last_ns = now
+        self.frames += frames
+        self.cycles += cycles
+        self.instructions += instructions
+        if now - self._window[0] >= self.window_ns:
+            self._end_window(now)
+
+    def _end_window(self, now: int):
+        start, frames, cycles, instructions, unchanged_lines, compared_lines = self._window
+        seconds = (now - start) / 1_000_000_000
+        self.fps = (self.frames - frames) / seconds
+        self.speed = (self.cycles - cycles) / seconds / CYCLES_PER_SECOND * 100
+        self.instructions_per_second = (self.instructions - instructions) / seconds
+        # The lines that the frontend compared with the ones on screen, and didn't need to redraw
+        unchanged_now, compared_now = _line_counts(self._frontend)
+        if compared_now != compared_lines:
+            self.line_cache_hit_rate = (unchanged_now - unchanged_lines) / (compared_now - compared_lines)
+        self._window = (now, self.frames, self.cycles, self.instructions, unchanged_now, compared_now)
+
+        if self._json_file is not None:
+            # Imported here, so that importing the emulator doesn't import json
+            import json
+            self._json_file.write(json.dumps(self.as_dict()) + "\n")
+            self._json_file.flush()
+        if self._hud:
+            self._frontend.show_hud(self.hud_text())
+
+    @property
+    def skipped_frames(self) -> int:
+        """ The frames that the frontend didn't show (e.g. since the window is only redrawn at 20 fps) """
+        return self._frontend.skipped_frames if self._frontend is not None else 0
+
+    @property
+    def frame_times(self) -> list:
+        """ Frame counts by frame time (see HISTOGRAM_BUCKETS) """
+        return self._frame_times.tolist()[:HISTOGRAM_BUCKETS]
+
+    def histogram(self) -> list:
+        """ (upper bound in microseconds, or None for the last bucket, frame count) of the non-empty buckets """
+        return [(1 << i if i < HISTOGRAM_BUCKETS - 1 else None, count)
+                for i, count in enumerate(self.frame_times) if count]
+
+    def as_dict(self) -> dict:
+        return {
+            "time": round((self._last_ns - self._start_ns) / 1_000_000_000, 3),
+            "frames": self.frames,
+            "cycles": self.cycles,
+            "instructions": self.instructions,
+            "fps": round(self.fps, 1),
+            "speed_percent": round(self.speed, 1),
+            "instructions_per_second": round(self.instructions_per_second),
+            "frame_time_histogram": {_bucket_name(bound): count for bound, count in self.histogram()},
+            "skipped_frames": self.skipped_frames,
+            "line_cache_hit_rate": (round(self.line_cache_hit_rate, 3) if self.line_cache_hit_rate is not None
+                                    else None),
+        }
+
+    def hud_text(self) -> str:
+        return f"{self.fps:.0f} fps  {self.speed:.0f}% speed  {self.instructions_per_second / 1e6:.2f} MIPS"
+
+    def summary(self) -> str:
+        """ A readable report of the whole run """
+        seconds = max((self._last_ns - self._start_ns) / 1_000_000_000, 1e-9)
+        lines = [f"{self.frames} frames in {seconds:.1f}s: {self.frames / seconds:.1f} fps, "
+                 f"{self.cycles / seconds / CYCLES_PER_SECOND * 100:.0f}% speed, "
+                 f"{self.instructions / seconds / 1e6:.2f}M instructions/s, {self.skipped_frames} skipped frames",
+                 "Frame times:"]
+        timed_frames = max(sum(self.frame_times), 1)
+        for bound, count in self.histogram():
+            lines.append(f"  {_bucket_name(bound):>10} {count:>8} {count / timed_frames * 100:>5.1f}%")
+        return "\n".join(lines)
+
+    def close(self):
+        if self._hud:
+            self._frontend.show_hud(None)
+        if self._json_file is not None:
+            self._json_file.close()
+            self._json_file = None
+
+
+def _line_counts(frontend: Optional[Frontend]) -> tuple:
+    if frontend is None:
+        return 0, 0
+    return frontend.unchanged_lines, frontend.compared_lines
+
+
+def _bucket_name(bound: Optional[int]) -> str:
+    if bound is None:
+        return f">={1 << (HISTOGRAM_BUCKETS - 2)}us"
+    return f"<{bound}us"
@@ -1,40 +1,74 @@
-# cython: profile=True
 import cython
+from gb_pymulator cimport build_options
+from gb_pymulator.cartridge cimport Cartridge
+from gb_pymulator.counters cimport Counters
+from gb_pymulator.instruction_trace cimport InstructionTrace
+from gb_pymulator.joypad cimport JoyPad
 from gb_pymulator.timer cimport Timer
+from gb_pymulator.tracing cimport Tracer
 from gb_pymulator.display cimport Display
+from gb_pymulator cimport logger
 
+cdef int SERIAL_OUTPUT_LIMIT
+
+@cython.final
 cdef class Memory:
 
     cdef public int IF_flag
     cdef public int IE_flag
 
-    cdef int[0x2000] _internal_ram
-    cdef int[127] _high_internal_ram
+    cdef readonly bytearray internal_ram
+    cdef readonly bytearray high_internal_ram
+    cdef unsigned char[::1] _internal_ram
+    cdef unsigned char[::1] _high_internal_ram
     cdef Timer _timer
     cdef Display _display
-    cdef _cartridge
-    cdef _joypad
-
-    cpdef write(self, int address, int value)
-    cpdef int read(self, int address)
+    cdef Cartridge _cartridge
+    cdef JoyPad _joypad
+    cdef readonly bytes boot_rom
+    cdef readonly bint boot_rom_mapped
+    cdef const unsigned char[::1] _rom0
+    cdef int _serial_data
+    cdef int _serial_control
+    cdef readonly bytearray serial_output
+    cdef public Counters counters
+    cdef public Tracer tracer
+    cdef public InstructionTrace instruction_trace
+
+    cdef _attach_buffers(self)
+    cdef _map_rom0(self)
+    cpdef tuple get_state(self)
+    cpdef set_state(self, tuple state)
+    @cython.locals(transfer_source_address=int, i=int)
+    cpdef int write(self, int address, int value) except -1 nogil
+    @cython.locals(value=int)
+    cpdef int read(self, int address) except -1 nogil
+    cpdef int peek(self, int address) except -1 nogil
 
+@cython.final
 cdef class Registers:
 
     cdef public int stack_pointer
-
-    cdef dict _registers
-    cdef list _register_pairs
-
+    cdef public int A
+    cdef public int B
+    cdef public int C
+    cdef public int D
+    cdef public int E
+    cdef public int F
+    cdef public int H
+    cdef public int L
+
+    cpdef tuple get_state(self)
+    cpdef set_state(self, tuple state)
     cpdef set(self, str register_name, int value)
-    cpdef int get(self, str register_name)
+    cpdef int get(self, str register_name) except? -1
     cpdef decrement(self, str register_name)
     cpdef increment(self, str register_name)
     cpdef set_bit(self, str register_name, int bit, bint value)
-    cpdef bint get_bit(self, str register_name, int bit)
-    cpdef bint get_flag_condition(self, str key)
-
-
+    cpdef bint get_bit(self, str register_name, int bit) except -1
+    cpdef bint get_flag_condition(self, str key) except -1
 
+@cython.final
 cdef class Motherboard:
 
     cdef public Registers reg
@@ -43,19 +77,24 @@ cdef class Motherboard:
     cdef public int program_counter
     cdef public int halted
     cdef public int stopped
-    cdef _ei_countdown
-    cdef _di_countdown
-
-    cpdef enable_interrupts_after_next_instruction(self)
-    cpdef disable_interrupts_after_next_instruction(self)
-    cpdef handle_ime_flag(self)
-    cpdef push_to_stack(self, int value)
-    cpdef int pop_from_stack(self)
+    cdef int _ei_countdown
+    cdef int _di_countdown
+    cdef public long long instruction_count
+
+    cpdef tuple get_state(self)
+    cpdef set_state(self, tuple state)
+    cpdef int enable_interrupts_after_next_instruction(self) noexcept nogil
+    cpdef int disable_interrupts_after_next_instruction(self) noexcept nogil
+    cpdef int handle_ime_flag(self) noexcept nogil
+    cpdef int push_to_stack(self, int value) except -1 nogil
+    @cython.locals(value=int)
+    cpdef int pop_from_stack(self) except -1 nogil
 
     @cython.locals(value=int)
-    cdef int load_u8(self)
+    cdef int load_u8(self) except -1 nogil
 
     @cython.locals(value=int)
-    cdef int load_i8(self)
+    cdef int load_i8(self) except? -1 nogil
 
-    cdef int load_u16(self)
+    @cython.locals(low=int)
+    cdef int load_u16(self) except -1 nogil
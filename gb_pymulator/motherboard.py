@@ -1,15 +1,27 @@
-# cython: profile=True
+import copyreg
+from typing import Optional
 
+try:
+    import cython
+except ImportError:
+    from gb_pymulator import cython_shim as cython
+
+from gb_pymulator import build_options
 from gb_pymulator.cartridge import Cartridge
 from gb_pymulator.display import Display
 from gb_pymulator.joypad import JoyPad
 from gb_pymulator import logger
 from gb_pymulator.timer import Timer
 
+# The serial output that is kept (the oldest half is dropped when it's full), unless it's drained with
+# Emulator.read_serial()
+SERIAL_OUTPUT_LIMIT = 64 * 1024
+
 
 class Memory:
 
-    def __init__(self, cartridge: Cartridge, joypad: JoyPad, timer: Timer, display: Display):
+    def __init__(self, cartridge: Cartridge, joypad: JoyPad, timer: Timer, display: Display,
+                 boot_rom: Optional[bytes] = None):
 
         # This flag tells us which interrupts have been "requested" by the hardware (they are "pending")
         self.IF_flag = 0
@@ -17,43 +29,125 @@ class Memory:
         # This flag tells us which interrupts are enabled (typically enabled/disabled by the program code)
         self.IE_flag = 0
 
-        self._internal_ram = [0] * 0x2000
-        self._high_internal_ram = [0] * 127
+        self.internal_ram = bytearray(0x2000)
+        self.high_internal_ram = bytearray(127)
+
+        # Serial port: the byte to transfer (SB), and the transfer control (SC). No link cable is connected, so a
+        # transfer completes right away, and the bytes that were sent are collected in serial_output (test ROMs print
+        # their results there), up to SERIAL_OUTPUT_LIMIT.
+        self._serial_data = 0
+        self._serial_control = 0
+        self.serial_output = bytearray()
 
         self._timer = timer
         self._display = display
         self._cartridge = cartridge
         self._joypad = joypad
 
+        # While the boot ROM is mapped, it's read instead of the first 256 bytes of the cartridge. It unmaps itself
+        # (by writing to 0xFF50) when it's done, and jumps to the cartridge's entrypoint.
+        self.boot_rom = boot_rom
+        self.boot_rom_mapped = boot_rom is not None
+        self._attach_buffers()
+
+        # Execution counters, trace events and the instruction trace, when they are compiled in and enabled (see
+        # counters.py, tracing.py and instruction_trace.py)
+        self.counters = None
+        self.tracer = None
+        self.instruction_trace = None
+
+    def _attach_buffers(self):
+        # Typed views of the RAM, that can be accessed without holding the GIL
+        self._internal_ram = self.internal_ram
+        self._high_internal_ram = self.high_internal_ram
+        self._map_rom0()
+
+    def _map_rom0(self):
+        # The first ROM bank, as seen by the CPU
+        if self.boot_rom_mapped:
+            self._rom0 = self.boot_rom + self._cartridge.data[len(self.boot_rom):0x4000]
+        else:
+            self._rom0 = self._cartridge.data
+
+    def __reduce__(self):
+        # The typed views can't be copied (or pickled) automatically, so the state is listed explicitly
+        return copyreg.__newobj__, (type(self),), (self.internal_ram, self.high_internal_ram, self.get_state(),
+                                                   self._timer, self._display, self._cartridge, self._joypad,
+                                                   self.boot_rom)
+
+    def __setstate__(self, state):
+        (self.internal_ram, self.high_internal_ram, flags, self._timer, self._display, self._cartridge,
+         self._joypad, self.boot_rom) = state
+        self.boot_rom_mapped = False
+        self.serial_output = bytearray()
+        self.counters = None
+        self.tracer = None
+        self.instruction_trace = None
+        self._attach_buffers()
+        self.set_state(flags)
+
+    def get_state(self) -> tuple:
+        # The RAM is saved separately, as bytes (and the serial output isn't saved at all)
+        return self.IF_flag, self.IE_flag, self.boot_rom_mapped, self._serial_data, self._serial_control
+
+    def set_state(self, state: tuple):
+        boot_rom_mapped = state[2]
+        if boot_rom_mapped and self.boot_rom is None:
+            raise ValueError("The state was saved while the boot ROM was running, but no boot ROM is loaded")
+        self.IF_flag, self.IE_flag, _, self._serial_data, self._serial_control = state
+        if boot_rom_mapped != self.boot_rom_mapped:
+            self.boot_rom_mapped = boot_rom_mapped
+            self._map_rom0()
+
     def write(self, address, value):
 
         if address < 0:
-            raise ValueError(f"Trying to write negative address {address} (value:{value})")
+            with cython.gil:
+                raise ValueError(f"Trying to write negative address {address} (value:{value})")
+
+        if build_options.COUNTERS and self.counters is not None:
+            self.counters.count_write(address)
 
-        if value is None:
-            raise ValueError(f"Trying to write None to {hex(address)}")
+        # Memory holds bytes, even if an instruction computed a result that overflows
+        value &= 0xFF
+
+        if build_options.TRACING and self.instruction_trace is not None:
+            self.instruction_trace.write_access(address, value)
 
         if 0x0000 <= address < 0x8000:
             # Cartridge ROM or memory bank
             self._cartridge.write(address, value)
+            if build_options.TRACING and self.tracer is not None:
+                self.tracer.bank_switch(address, value)
         elif 0x8000 <= address < 0xA000:
-            self._display.VRAM[address - 0x8000] = value
+            self._display._vram[address - 0x8000] = value
         elif 0xA000 <= address < 0xC000:
             # Switchable RAM bank
             self._cartridge.write(address, value)
         elif 0xC000 <= address < 0xE000:
             self._internal_ram[address - 0xC000] = value
         elif 0xFE00 <= address < 0xFEA0:
-            self._display.OAM[address - 0xFE00] = value
+            self._display._oam[address - 0xFE00] = value
         elif 0xFEA0 <= address < 0xFF00:
             # Unused area
             pass
         elif address == 0xFF00:
             self._joypad.register_write(value)
-            return
-        elif 0xFF01 <= address <= 0xFF02:
-            # Serial transfer IO registers
-            pass
+        elif address == 0xFF01:
+            self._serial_data = value
+        elif address == 0xFF02:
+            if value & 0b1000_0001 == 0b1000_0001:
+                # A transfer, clocked by the gameboy. Nothing is connected, so 0xFF is received
+                with cython.gil:
+                    if len(self.serial_output) >= SERIAL_OUTPUT_LIMIT:
+                        del self.serial_output[:SERIAL_OUTPUT_LIMIT // 2]
+                    self.serial_output.append(self._serial_data)
+                self._serial_data = 0xFF
+                self._serial_control = value & 0b0111_1111
+                self.IF_flag |= 0b0000_1000  # Serial interrupt
+            else:
+                # Without the internal clock, a transfer would wait for the other gameboy
+                self._serial_control = value
         elif 0xFF04 <= address <= 0xFF07:
             self._timer.write(address, value)
         elif address == 0xFF0F:
@@ -68,16 +162,23 @@ class Memory:
             self._display.write_reg(address, value)
         elif address == 0xFF46:
             # DMA
+            if build_options.TRACING and self.tracer is not None:
+                self.tracer.dma(value)
             transfer_source_address = value * 0x100
             for i in range(0xA0):
-                self._display.OAM[i] = self.read(transfer_source_address + i)
+                self._display._oam[i] = self.read(transfer_source_address + i)
         elif 0xFF47 <= address <= 0xFF4B:
             self._display.write_reg(address, value)
         elif 0xFF4C <= address < 0xFF50:
             # unused memory area
             pass
         elif address == 0xFF50:
-            raise Exception("TODO: disable boot rom")
+            # Once unmapped, the boot ROM can't be mapped again (until the machine is reset)
+            if value & 1 and self.boot_rom_mapped:
+                with cython.gil:
+                    logger.info("Boot ROM unmapped")
+                    self.boot_rom_mapped = False
+                    self._map_rom0()
         elif 0xFF51 <= address < 0xFF80:
             # unused memory area
             pass
@@ -86,14 +187,29 @@ class Memory:
         elif address == 0xFFFF:
             self.IE_flag = value
         else:
-            raise ValueError(f"Disallowed write ({value}) to {hex(address)}")
+            with cython.gil:
+                raise ValueError(f"Disallowed write ({value}) to {hex(address)}")
+        return 0
 
     def read(self, address):
-        if address < 0x8000:
-            # Cartridge ROM or memory bank
+        if build_options.COUNTERS and self.counters is not None:
+            self.counters.count_read(address)
+
+        if build_options.TRACING and self.instruction_trace is not None:
+            value = self.peek(address)
+            self.instruction_trace.read_access(address, value)
+            return value
+        return self.peek(address)
+
+    def peek(self, address):
+        # A read that isn't counted or traced, for tools that inspect the memory (e.g. the sampler)
+        if address < 0x4000:
+            return self._rom0[address]
+        elif address < 0x8000:
+            # Cartridge memory bank
             return self._cartridge.read(address)
         elif address < 0xA000:
-            return self._display.VRAM[address - 0x8000]
+            return self._display._vram[address - 0x8000]
         elif address < 0xC000:
             # Switchable RAM bank
             return self._cartridge.read(address)
@@ -102,14 +218,21 @@ class Memory:
             return self._internal_ram[address - 0xC000]
         elif address < 0xFE00:
             # Echo of internal RAM. Not supported
-            raise ValueError(f"Disallowed read from {hex(address)}")
+            with cython.gil:
+                raise ValueError(f"Disallowed read from {hex(address)}")
         elif address < 0xFEA0:
-            return self._display.OAM[address - 0xFE00]
+            return self._display._oam[address - 0xFE00]
         elif address < 0xFF00:
             # Empty unusable area
-            raise ValueError(f"Disallowed read from {hex(address)}")
+            with cython.gil:
+                raise ValueError(f"Disallowed read from {hex(address)}")
         elif address == 0xFF00:
             return self._joypad.register_read()
+        elif address == 0xFF01:
+            return self._serial_data
+        elif address == 0xFF02:
+            # The unused bits read as 1
+            return self._serial_control | 0b0111_1110
         elif 0xFF04 <= address <= 0xFF07:
             return self._timer.read(address)
         elif address == 0xFF0F:
@@ -124,7 +247,8 @@ class Memory:
         elif address == 0xFFFF:
             return self.IE_flag
         else:
-            raise ValueError(f"Disallowed read from {hex(address)}")
+            with cython.gil:
+                raise ValueError(f"Disallowed read from {hex(address)}")
 
 
 class Motherboard:
@@ -133,11 +257,24 @@ class Motherboard:
         self.IME_flag = True  # Interrupt Master Enable
         self.memory = memory
         self.program_counter = program_counter
-        self.halted: bool = False
-        self.stopped: bool = False
+        self.halted = False
+        self.stopped = False
+
+        # Number of instructions until interrupts are enabled/disabled (-1 when nothing is pending)
+        self._ei_countdown = -1
+        self._di_countdown = -1
 
-        self._ei_countdown = None
-        self._di_countdown = None
+        # Number of executed instructions (a statistic, rather than part of the machine state)
+        self.instruction_count = 0
+
+    def get_state(self) -> tuple:
+        return (self.program_counter, self.IME_flag, self.halted, self.stopped, self._ei_countdown,
+                self._di_countdown) + self.reg.get_state()
+
+    def set_state(self, state: tuple):
+        (self.program_counter, self.IME_flag, self.halted, self.stopped, self._ei_countdown,
+         self._di_countdown) = state[:6]
+        self.reg.set_state(state[6:])
 
     def enable_interrupts_after_next_instruction(self):
         self._ei_countdown = 2
@@ -146,25 +283,30 @@ class Motherboard:
         self._di_countdown = 2
 
     def handle_ime_flag(self):
-        if self._ei_countdown is not None:
+        if self._ei_countdown != -1:
             self._ei_countdown -= 1
             if self._ei_countdown == 0:
-                logger.debug("Enabling interrupts")
+                if build_options.LOG_DEBUG:
+                    with cython.gil:
+                        logger.debug("Enabling interrupts")
                 self.IME_flag = True
-                self._ei_countdown = None
-        if self._di_countdown is not None:
+                self._ei_countdown = -1
+        if self._di_countdown != -1:
             self._di_countdown -= 1
             if self._di_countdown == 0:
-                logger.debug("Disabling interrupts")
+                if build_options.LOG_DEBUG:
+                    with cython.gil:
+                        logger.debug("Disabling interrupts")
                 self.IME_flag = False
-                self._di_countdown = None
+                self._di_countdown = -1
 
     def push_to_stack(self, value):
         self.memory.write(self.reg.stack_pointer - 1, value >> 8)
         self.memory.write(self.reg.stack_pointer - 2, value & 0xFF)
         self.reg.stack_pointer -= 2
+        return 0
 
-    def pop_from_stack(self) -> int:
+    def pop_from_stack(self):
         value = self.memory.read(self.reg.stack_pointer)
         value += self.memory.read(self.reg.stack_pointer + 1) << 8
         self.reg.stack_pointer += 2
@@ -176,53 +318,86 @@ class Motherboard:
         return value
 
     def load_i8(self):
-        value = self.memory.read(self.program_counter)
-        self.program_counter += 1
-        return int.from_bytes(bytes([value]), byteorder="little", signed=True)
+        value = self.load_u8()
+        return value - 0x100 if value & 0x80 else value
 
     def load_u16(self):
-        b = bytes([self.memory.read(self.program_counter),
-                   self.memory.read(self.program_counter + 1)])
-        self.program_counter += 2
-        return int.from_bytes(b, byteorder="little")
+        low = self.load_u8()
+        return low | (self.load_u8() << 8)
 
 
 class Registers:
     def __init__(self):
         self.stack_pointer = 0xFFFE  # start value from boot rom
-        self._registers = {
-            "A": 0,
-            "B": 0,
-            "C": 0,
-            "D": 0,
-            "E": 0,
-            "F": 0,
-            "H": 0,
-            "L": 0,
-        }
-        self._register_pairs = ["AF", "BC", "DE", "HL"]
+        self.A = 0
+        self.B = 0
+        self.C = 0
+        self.D = 0
+        self.E = 0
+        self.F = 0
+        self.H = 0
+        self.L = 0
+
+    def get_state(self) -> tuple:
+        return self.A, self.B, self.C, self.D, self.E, self.F, self.H, self.L, self.stack_pointer
+
+    def set_state(self, state: tuple):
+        self.A, self.B, self.C, self.D, self.E, self.F, self.H, self.L, self.stack_pointer = state
 
     def set(self, register_name, value):
         if register_name == "SP":
             self.stack_pointer = value
             return
-        if register_name in self._register_pairs:
+        if len(register_name) == 2:
+            # AF, BC, DE or HL
             self.set(register_name[0], value >> 8)
             self.set(register_name[1], value & 0xFF)
             return
         value = value & 0xFF
 
-        if register_name == "F":
-            value = value & 0xF0
-
-        self._registers[register_name] = value
+        if register_name == "A":
+            self.A = value
+        elif register_name == "F":
+            self.F = value & 0xF0
+        elif register_name == "B":
+            self.B = value
+        elif register_name == "C":
+            self.C = value
+        elif register_name == "D":
+            self.D = value
+        elif register_name == "E":
+            self.E = value
+        elif register_name == "H":
+            self.H = value
+        elif register_name == "L":
+            self.L = value
+        else:
+            raise ValueError(f"Unknown register: '{register_name}'")
 
     def get(self, register_name):
         if register_name == "SP":
             return self.stack_pointer
-        if register_name in self._register_pairs:
+        if len(register_name) == 2:
             return (self.get(register_name[0]) << 8) + self.get(register_name[1])
-        return self._registers[register_name]
+
+        if register_name == "A":
+            return self.A
+        elif register_name == "F":
+            return self.F
+        elif register_name == "B":
+            return self.B
+        elif register_name == "C":
+            return self.C
+        elif register_name == "D":
+            return self.D
+        elif register_name == "E":
+            return self.E
+        elif register_name == "H":
+            return self.H
+        elif register_name == "L":
+            return self.L
+        else:
+            raise ValueError(f"Unknown register: '{register_name}'")
 
     def decrement(self, register_name):
         self.set(register_name, self.get(register_name) - 1)
@@ -232,12 +407,12 @@ class Registers:
 
     def set_bit(self, register_name, bit, value):
         if value:
-            self._registers[register_name] = self._registers[register_name] | (1 << bit)
+            self.set(register_name, self.get(register_name) | (1 << bit))
         else:
-            self._registers[register_name] = self._registers[register_name] & ~(1 << bit)
+            self.set(register_name, self.get(register_name) & ~(1 << bit))
 
     def get_bit(self, register_name, bit) -> bool:
-        return bool(self._registers[register_name] & (1 << bit))
+        return bool(self.get(register_name) & (1 << bit))
 
     def get_flag_condition(self, key):
 
@@ -0,0 +1,175 @@
+"""
+Movies: the joypad input of a play session, recorded frame by frame, so that the session can be replayed exactly.
+
+Input is only applied between frames (with Emulator.set_buttons()), so a movie is the state that the session started
+from, followed by the frames where the button mask changed. Optionally, a hash of the machine state is recorded every
+hash_interval frames, so that a replay that diverges from the recording (a desync) is detected at the frame where it
+happens, rather than by looking at the screen.
+
+Layout (little-endian):
+
+    header   magic b"GBPM", format version (u16)
+    payload  (zlib-compressed)
+             start state: its length (u32) followed by the save state (see save_state.py)
+             number of frames (u32)
+             number of input events (u32), and for each event: frame (u32), button mask (u8)
+             number of state hashes (u32), and for each hash: frame (u32), CRC-32 of the uncompressed save state (u32)
+
+Frames are counted like Emulator.frame_count: an event at frame N applies to the frame that runs when frame_count is N,
+and a hash at frame N is taken when frame_count has reached N.
+"""
+
+import struct
+import zlib
+from dataclasses import dataclass, field
+from typing import List, Tuple
+
+MAGIC = b"GBPM"
+VERSION = 1
+
+_HEADER = struct.Struct("<4sH")
+_COUNT = struct.Struct("<I")
+_EVENT = struct.Struct("<IB")
+_HASH = struct.Struct("<II")
+
+
+class DesyncError(Exception):
+    """ A replayed state doesn't match the hash that was recorded for it """
+
+    def __init__(self, frame: int, expected: int, actual: int):
+        super().__init__(f"Desync at frame {frame}: state hash {actual:08x}, but {expected:08x} was recorded")
+        self.frame = frame
+
+
+def state_hash(emulator) -> int:
+    return zlib.crc32(emulator.save_state())
+
+
+@dataclass
+class Movie:
+    start_state: bytes
+    # The number of frames from the start state to the end of the recording
+    num_frames: int = 0
+    # (frame, button mask), ordered by frame
+    events: List[Tuple[int, int]] = field(default_factory=list)
+    # (frame, state hash), ordered by frame
+    hashes: List[Tuple[int, int]] = field(default_factory=list)
+
+    def to_bytes(self) -> bytes:
+        parts = [_COUNT.pack(len(self.start_state)), self.start_state, _COUNT.pack(self.num_frames),
+                 _COUNT.pack(len(self.events))]
+        parts += [_EVENT.pack(frame, mask) for frame, mask in self.events]
+        parts.append(_COUNT.pack(len(self.hashes)))
+        parts += [_HASH.pack(frame, hash_value) for frame, hash_value in self.hashes]
+        return _HEADER.pack(MAGIC, VERSION) + zlib.compress(b"".join(parts), 9)
+
+    @staticmethod
+    def parse(data: bytes) -> "Movie":
+        if len(data) < _HEADER.size:
+            raise ValueError("Not a movie (too short)")
+        magic, version = _HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError("Not a movie (wrong magic bytes)")
+        if version != VERSION:
+            raise ValueError(f"Unsupported movie version: {version} (expected {VERSION})")
+
+        try:
+            payload = zlib.decompress(data[_HEADER.size:])
+            offset = 0
+            (length,) = _COUNT.unpack_from(payload, offset)
+            offset += _COUNT.size
+            start_state = payload[offset:offset + length]
+            offset += length
+            (num_frames, num_events) = struct.unpack_from("<II", payload, offset)
+            offset += 2 * _COUNT.size
+            events = list(_EVENT.iter_unpack(payload[offset:offset + num_events * _EVENT.size]))
+            offset += num_events * _EVENT.size
+            (num_hashes,) = _COUNT.unpack_from(payload, offset)
+            offset += _COUNT.size
+            hashes = list(_HASH.iter_unpack(payload[offset:offset + num_hashes * _HASH.size]))
+        except (zlib.error, struct.error) as e:
+            raise ValueError(f"Corrupt movie: {e}")
+        if len(events) != num_events or len(hashes) != num_hashes:
+            raise ValueError("Corrupt movie: truncated")
+        return Movie(start_state, num_frames, events, hashes)
+
+
+class MovieRecorder:
+    """ Records the input of a session, starting from the emulator's current state """
+
+    def __init__(self, emulator, hash_interval: int = 0):
+        """
+        :param hash_interval: frames between recorded state hashes (0 to record no hashes)
+        """
+        self._emulator = emulator
+        self._hash_interval = hash_interval
+        self._start_frame = emulator.frame_count
+        self._buttons = emulator.get_buttons()
+        self.movie = Movie(emulator.save_state(compress=True))
+
+    def on_frame(self):
+        """ Called after each emulated frame (the buttons that were pressed during it are recorded) """
+        emulator = self._emulator
+        buttons = emulator.get_buttons()
+        if buttons != self._buttons:
+            self.movie.events.append((emulator.frame_count - 1, buttons))
+            self._buttons = buttons
+        if self._hash_interval and emulator.frame_count % self._hash_interval == 0:
+            self.movie.hashes.append((emulator.frame_count, state_hash(emulator)))
+        self.movie.num_frames = emulator.frame_count - self._start_frame
+
+
+class MoviePlayer:
+    """ Replays a movie on an emulator (for the same ROM), checking the recorded state hashes if verify is set """
+
+    def __init__(self, emulator, movie: Movie, verify: bool = True):
+        self._emulator = emulator
+        self._movie = movie
+        self._verify = verify
+        emulator.load_state(movie.start_state)
+        self.end_frame = emulator.frame_count + movie.num_frames
+        self._next_event = 0
+        self._next_hash = 0
+
+    def step(self) -> bool:
+        """ Run one frame of the movie. Returns False (and does nothing) when the movie has ended. """
+        return self._run_until(self._emulator.frame_count + 1)
+
+    def run(self) -> int:
+        """
+        Run the rest of the movie, as fast as possible: frames between events and hashes are run in one batch.
+        Returns the number of frames that were run.
+        """
+        start_frame = self._emulator.frame_count
+        while self._run_until(self.end_frame):
+            pass
+        return self._emulator.frame_count - start_frame
+
+    def _run_until(self, frame: int) -> bool:
+        # Runs at most until the frame, but stops early at the next event or hash (so that it can be applied/checked)
+        emulator = self._emulator
+        events = self._movie.events
+        hashes = self._movie.hashes
+        if emulator.frame_count >= self.end_frame:
+            return False
+
+        while self._next_event < len(events) and events[self._next_event][0] <= emulator.frame_count:
+            emulator.set_buttons(events[self._next_event][1])
+            self._next_event += 1
+
+        stop = min(frame, self.end_frame)
+        if self._next_event < len(events):
+            stop = min(stop, events[self._next_event][0])
+        if self._verify and self._next_hash < len(hashes):
+            stop = min(stop, hashes[self._next_hash][0])
+        emulator.run_frames(stop - emulator.frame_count)
+
+        if self._verify:
+            while self._next_hash < len(hashes) and hashes[self._next_hash][0] <= emulator.frame_count:
+                hash_frame, expected = hashes[self._next_hash]
+                self._next_hash += 1
+                if hash_frame == emulator.frame_count:
+                    actual = state_hash(emulator)
+                    if actual != expected:
+                        raise DesyncError(hash_frame, expected, actual)
+        return True
@@ -0,0 +1,203 @@
+"""
+A store for many machine states that share most of their memory, e.g. the states of a search that branches from the
+same game state.
+
+The memory regions of each state (work RAM, video RAM, OAM, cartridge RAM, ...) are split into 256-byte pages, which
+are stored once per distinct content (addressed by their hash) and reference counted by the states that use them. A
+state is then its register values plus a list of page ids, so states that differ in a few pages cost a few pages.
+
+When the pages exceed the memory cap, the least recently used ones are moved to a spill file on disk, and read back
+when a state that uses them is restored.
+"""
+
+import hashlib
+import os
+import tempfile
+from array import array
+from collections import OrderedDict
+from typing import Optional
+
+PAGE_SIZE = 256
+
+
+def _digest(page) -> bytes:
+    return hashlib.blake2b(page, digest_size=16).digest()
+
+
+class PageStore:
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, spill_file: Optional[str] = None):
+        """
+        :param max_bytes: cap for the memory used by pages (the least recently used are spilled to disk above it)
+        :param spill_file: path of the spill file (a temporary file by default)
+        """
+        self._max_bytes = max_bytes
+        self._spill_path = spill_file
+        self._spill = None
+
+        # handle -> (registers etc. as a flat array, the length of each group in it, page ids, region lengths).
+        # The arrays take a fraction of the memory that tuples of Python ints would.
+        self._states = {}
+        self._next_handle = 0
+
+        # Pages are identified by small ints, that are assigned to each distinct content
+        self._page_ids = {}  # hash -> id
+        self._hashes = {}  # id -> hash
+        self._refcounts = {}  # id -> number of uses by stored states
+        self._free_ids = []
+        # id -> page, least recently used first
+        self._pages = OrderedDict()
+        # id -> (offset, length) in the spill file. Freed slots are reused.
+        self._spilled = {}
+        self._free_slots = []
+        self._spill_size = 0
+
+        # The content and page hashes of each region in the last put(), since consecutive states mostly have the same
+        # pages (comparing them is cheaper than hashing them)
+        self._previous_regions = {}
+
+        self.memory_bytes = 0
+        # What the stored states would take as full copies of their memory
+        self.logical_bytes = 0
+
+    def __len__(self):
+        return len(self._states)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def num_pages(self) -> int:
+        return len(self._refcounts)
+
+    @property
+    def spilled_pages(self) -> int:
+        return len(self._spilled)
+
+    def put(self, emulator) -> int:
+        """ Store the emulator's current state. Returns a handle for restore() and release(). """
+        page_ids = array("I")
+        region_lengths = []
+        for index, buffer in enumerate(emulator._buffers()):
+            content = bytes(buffer)
+            previous_content, previous_hashes = self._previous_regions.get(index, (b"", None))
+            if len(previous_content) != len(content):
+                previous_content = None
+            unchanged = content == previous_content
+            hashes = []
+            for page_index, offset in enumerate(range(0, len(content), PAGE_SIZE)):
+                end = offset + PAGE_SIZE
+                page = content[offset:end]
+                if previous_content is not None and (unchanged or page == previous_content[offset:end]):
+                    page_hash = previous_hashes[page_index]
+                else:
+                    page_hash = _digest(page)
+                hashes.append(page_hash)
+                page_ids.append(self._add_page(page_hash, page))
+            self._previous_regions[index] = (content, hashes)
+            region_lengths.append(len(content))
+            self.logical_bytes += len(content)
+        self._evict()
+
+        int_groups = emulator._get_state()
+        handle = self._next_handle
+        self._next_handle += 1
+        self._states[handle] = (array("q", [value for group in int_groups for value in group]),
+                                tuple(len(group) for group in int_groups), page_ids, tuple(region_lengths))
+        return handle
+
+    def restore(self, emulator, handle: int):
+        """ Load a stored state into the emulator (which must run the same ROM) """
+        values, group_lengths, page_ids, region_lengths = self._states[handle]
+        int_groups = []
+        start = 0
+        for length in group_lengths:
+            int_groups.append(tuple(values[start:start + length]))
+            start += length
+        emulator._check_state(int_groups)
+        if list(region_lengths) != [len(buffer) for buffer in emulator._buffers()]:
+            raise ValueError("The state doesn't match the memory layout")
+
+        regions = []
+        start = 0
+        for length in region_lengths:
+            num_pages = (length + PAGE_SIZE - 1) // PAGE_SIZE
+            regions.append(b"".join([self._page(page_id) for page_id in page_ids[start:start + num_pages]]))
+            start += num_pages
+        self._evict()
+        emulator._set_state(int_groups, regions)
+
+    def release(self, handle: int):
+        """ Remove a state from the store. Pages that no other state uses are freed. """
+        _, _, page_ids, region_lengths = self._states.pop(handle)
+        self.logical_bytes -= sum(region_lengths)
+        for page_id in page_ids:
+            refcount = self._refcounts[page_id] - 1
+            if refcount > 0:
+                self._refcounts[page_id] = refcount
+                continue
+            del self._refcounts[page_id]
+            del self._page_ids[self._hashes.pop(page_id)]
+            self._free_ids.append(page_id)
+            page = self._pages.pop(page_id, None)
+            if page is not None:
+                self.memory_bytes -= len(page)
+            else:
+                offset, _ = self._spilled.pop(page_id)
+                self._free_slots.append(offset)
+
+    def close(self):
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
+            if self._spill_path is not None:
+                os.remove(self._spill_path)
+
+    def _add_page(self, page_hash: bytes, page: bytes) -> int:
+        page_id = self._page_ids.get(page_hash)
+        if page_id is not None:
+            self._refcounts[page_id] += 1
+            if page_id in self._pages:
+                self._pages.move_to_end(page_id)
+            return page_id
+
+        page_id = self._free_ids.pop() if self._free_ids else len(self._page_ids)
+        self._page_ids[page_hash] = page_id
+        self._hashes[page_id] = page_hash
+        self._refcounts[page_id] = 1
+        self._pages[page_id] = page
+        self.memory_bytes += len(page)
+        return page_id
+
+    def _page(self, page_id: int) -> bytes:
+        page = self._pages.get(page_id)
+        if page is not None:
+            self._pages.move_to_end(page_id)
+            return page
+        # Read back from the spill file (it's evicted again, if needed, when it's the least recently used)
+        offset, length = self._spilled.pop(page_id)
+        self._spill.seek(offset)
+        page = self._spill.read(length)
+        self._free_slots.append(offset)
+        self._pages[page_id] = page
+        self.memory_bytes += length
+        return page
+
+    def _evict(self):
+        while self.memory_bytes > self._max_bytes and self._pages:
+            page_id, page = self._pages.popitem(last=False)
+            self.memory_bytes -= len(page)
+            if self._spill is None:
+                self._spill = open(self._spill_path, "w+b") if self._spill_path is not None \
+                    else tempfile.TemporaryFile()
+            # Every slot is PAGE_SIZE bytes, so that freed slots can hold any page
+            if self._free_slots:
+                offset = self._free_slots.pop()
+            else:
+                offset = self._spill_size
+                self._spill_size += PAGE_SIZE
+            self._spill.seek(offset)
+            self._spill.write(page)
+            self._spilled[page_id] = (offset, len(page))
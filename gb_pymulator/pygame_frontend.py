@@ -0,0 +1,203 @@
+from typing import Optional
+
+import pygame
+from pygame.surface import Surface
+
+from gb_pymulator import logger
+from gb_pymulator.frontend import Frontend, INPUT_JOYPAD, INPUT_LOAD_STATE, INPUT_NONE, INPUT_QUIT, INPUT_SAVE_STATE
+from gb_pymulator.joypad import (
+    BUTTON_A, BUTTON_B, BUTTON_DOWN, BUTTON_LEFT, BUTTON_RIGHT, BUTTON_SELECT, BUTTON_START, BUTTON_UP
+)
+from gb_pymulator.key_bindings import UserInputKeyBindings
+
+# Integer factors that the 160x144 LCD can be scaled up by in the window
+SCALE_FACTORS = range(1, 7)
+
+SCREEN_RESOLUTION = (160, 144)
+
+HUD_POSITION = (2, 2)
+HUD_FONT_SIZE = 18
+HUD_COLOR = (255, 255, 0)
+HUD_BACKGROUND = (0, 0, 0)
+
+
+class PygameFrontend(Frontend):
+    def __init__(self, user_input_key_bindings: UserInputKeyBindings, scale: int = 2):
+        if scale not in SCALE_FACTORS:
+            raise ValueError(f"Unsupported scale factor: {scale} (expected 1-6)")
+
+        logger.debug("Initializing pygame")
+        pygame.init()
+        self._scale = scale
+        self._screen = pygame.display.set_mode((SCREEN_RESOLUTION[0] * scale, SCREEN_RESOLUTION[1] * scale))
+        self._screen.fill((0, 0, 0))
+        pygame.display.update()
+        logger.debug("Pygame initialized")
+        self._last_draw = pygame.time.get_ticks()
+
+        self._display = None
+        self._pixel_buffer = None
+        self._frame_surface = None
+        self._scaled_surface = None
+        self._scaled_size = self._screen.get_size()
+        self._presented_buffer = None
+        self._pixel_lines = None
+        self._presented_lines = None
+        self._dirty_rect = pygame.Rect(0, 0, SCREEN_RESOLUTION[0] * scale, 0)
+
+        self._hud_text = None
+        self._hud_font = None
+        self._hud_surface = None
+        # Where the HUD is on screen, while it's shown
+        self._hud_rect = None
+        self._hud_changed = False
+        # The areas of the window that a present updates (reused, so that presenting doesn't allocate a list)
+        self._updated_rects = []
+
+        # Button mask (see joypad.py) of the keys that are currently held down
+        self.buttons = 0
+        # Rewinds while Backspace is held
+        self.can_rewind = True
+        self.rewinding = False
+        self._key_buttons = {
+            user_input_key_bindings.down: BUTTON_DOWN,
+            user_input_key_bindings.up: BUTTON_UP,
+            user_input_key_bindings.left: BUTTON_LEFT,
+            user_input_key_bindings.right: BUTTON_RIGHT,
+            user_input_key_bindings.start: BUTTON_START,
+            user_input_key_bindings.select: BUTTON_SELECT,
+            user_input_key_bindings.a: BUTTON_A,
+            user_input_key_bindings.b: BUTTON_B,
+        }
+
+    def attach(self, display):
+        self._display = display
+        self._pixel_buffer = display.pixel_buffer
+
+        # All surfaces used for presenting a frame are allocated up front. The frame surface shares memory with
+        # the pixel buffer, so drawing a line updates it in place.
+        self._frame_surface = pygame.image.frombuffer(self._pixel_buffer, SCREEN_RESOLUTION, "RGB")
+        if self._scale == 1:
+            self._scaled_surface = self._frame_surface
+        else:
+            self._scaled_surface = Surface(self._scaled_size, 0, self._frame_surface)
+
+        # A copy of the last presented frame, used to find the scanlines that have changed since then
+        self._presented_buffer = bytearray(len(self._pixel_buffer))
+        self._pixel_lines = _line_views(self._pixel_buffer)
+        self._presented_lines = _line_views(self._presented_buffer)
+
+    def set_title(self, title: str):
+        pygame.display.set_caption(title)
+
+    def present(self):
+        try:
+            current_time = pygame.time.get_ticks()
+
+            # Here we limit FPS to get better performance
+            if current_time > self._last_draw + 50:
+                self._last_draw = current_time
+                self._present_frame()
+            else:
+                self.skipped_frames += 1
+
+        except BaseException as e:
+            raise Exception(f"Pygame frame error: {repr(e)}")
+
+    def _present_frame(self):
+        self.compared_lines += 144
+        if self._pixel_buffer == self._presented_buffer and not self._hud_changed:
+            self.unchanged_lines += 144
+            return
+
+        first_dirty_line = -1
+        last_dirty_line = -1
+        dirty_lines = 0
+        for y in range(144):
+            if self._pixel_lines[y] != self._presented_lines[y]:
+                self._presented_lines[y][:] = self._pixel_lines[y]
+                if first_dirty_line == -1:
+                    first_dirty_line = y
+                last_dirty_line = y
+                dirty_lines += 1
+        self.unchanged_lines += 144 - dirty_lines
+
+        updated_rects = self._updated_rects
+        updated_rects.clear()
+        if first_dirty_line != -1:
+            if self._scale != 1:
+                pygame.transform.scale(self._frame_surface, self._scaled_size, self._scaled_surface)
+
+            # Only the band of scanlines that changed is pushed to the window
+            self._dirty_rect.y = first_dirty_line * self._scale
+            self._dirty_rect.height = (last_dirty_line - first_dirty_line + 1) * self._scale
+            self._screen.blit(self._scaled_surface, self._dirty_rect, self._dirty_rect)
+            updated_rects.append(self._dirty_rect)
+
+        if self._hud_changed or (self._hud_rect is not None and first_dirty_line != -1):
+            hud_rect = self._draw_hud()
+            if hud_rect is not None:
+                updated_rects.append(hud_rect)
+        pygame.display.update(updated_rects)
+
+    def show_hud(self, text: Optional[str]):
+        if text == self._hud_text:
+            return
+        self._hud_text = text
+        if text is None:
+            self._hud_surface = None
+        else:
+            if self._hud_font is None:
+                self._hud_font = pygame.font.Font(None, HUD_FONT_SIZE)
+            self._hud_surface = self._hud_font.render(text, True, HUD_COLOR, HUD_BACKGROUND)
+        self._hud_changed = True
+
+    def _draw_hud(self) -> Optional[pygame.Rect]:
+        # The frame is redrawn where the previous HUD was, and then the HUD is drawn over it. Returns the changed area.
+        rect = self._hud_surface.get_rect(topleft=HUD_POSITION) if self._hud_surface is not None else None
+        changed = rect if self._hud_rect is None else self._hud_rect if rect is None else rect.union(self._hud_rect)
+        self._hud_rect = rect
+        self._hud_changed = False
+        if changed is None:
+            # It was shown and hidden again without being drawn
+            return None
+        self._screen.blit(self._scaled_surface, changed, changed)
+        if self._hud_surface is not None:
+            self._screen.blit(self._hud_surface, rect)
+        return changed
+
+    def handle_user_input(self) -> int:
+        result = INPUT_NONE
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                return INPUT_QUIT
+            elif event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_ESCAPE:
+                    return INPUT_QUIT
+                elif event.key in self._key_buttons:
+                    self.buttons |= self._key_buttons[event.key]
+                    if result == INPUT_NONE:
+                        result = INPUT_JOYPAD
+                elif event.key == pygame.K_c:
+                    self._display.cycle_color_map()
+                elif event.key == pygame.K_F5:
+                    # Hotkeys take precedence over joypad input (self.buttons is still kept up to date)
+                    result = INPUT_SAVE_STATE
+                elif event.key == pygame.K_F9:
+                    result = INPUT_LOAD_STATE
+                elif event.key == pygame.K_BACKSPACE:
+                    self.rewinding = True
+            elif event.type == pygame.KEYUP:
+                if event.key == pygame.K_BACKSPACE:
+                    self.rewinding = False
+                elif event.key in self._key_buttons:
+                    self.buttons &= ~self._key_buttons[event.key]
+                    if result == INPUT_NONE:
+                        result = INPUT_JOYPAD
+        return result
+
+
+def _line_views(pixel_buffer: bytearray):
+    line_size = SCREEN_RESOLUTION[0] * 3
+    view = memoryview(pixel_buffer)
+    return [view[y * line_size:(y + 1) * line_size] for y in range(SCREEN_RESOLUTION[1])]
@@ -0,0 +1,112 @@
+"""
+Rewind: a bounded history of save states, that the emulator can be stepped back through.
+
+A state is captured every few frames. Most of them are stored as the XOR of the state and the previous one, which is
+mostly zeros (only a few bytes of RAM change between frames) and compresses to a fraction of the full state. Every
+keyframe_interval captures, a full (compressed) state is stored instead. A state is rebuilt from the closest keyframe
+before it, so the history can be evicted a keyframe group at a time, oldest first, when it exceeds its memory cap.
+"""
+
+import zlib
+from collections import deque
+
+
+def _xor(a: bytes, b: bytes) -> bytes:
+    # Python's big integers XOR thousands of bytes at C speed
+    return (int.from_bytes(a, "little") ^ int.from_bytes(b, "little")).to_bytes(len(a), "little")
+
+
+class Rewinder:
+    def __init__(self, emulator, interval: int = 2, keyframe_interval: int = 60, max_bytes: int = 16 * 1024 * 1024):
+        """
+        :param interval: frames between captured states
+        :param keyframe_interval: captured states between keyframes
+        :param max_bytes: cap for the memory used by the history (the oldest states are evicted above it)
+        """
+        self._emulator = emulator
+        self._interval = interval
+        self._keyframe_interval = keyframe_interval
+        self._max_bytes = max_bytes
+
+        # (is_keyframe, compressed data), oldest first
+        self._entries = deque()
+        self._size = 0
+        self._captures_since_keyframe = 0
+        self._frames_since_capture = 0
+        self._previous_state = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def size(self) -> int:
+        """ Memory used by the stored states, in bytes """
+        return self._size
+
+    def on_frame(self):
+        """ Called after each emulated frame. Captures a state every interval frames. """
+        self._frames_since_capture += 1
+        if self._frames_since_capture >= self._interval:
+            self.capture()
+
+    def capture(self):
+        state = self._emulator.save_state()
+        if self._previous_state is None or self._captures_since_keyframe >= self._keyframe_interval:
+            entry = (True, zlib.compress(state, 1))
+            self._captures_since_keyframe = 0
+        else:
+            entry = (False, zlib.compress(_xor(state, self._previous_state), 1))
+        self._captures_since_keyframe += 1
+        self._frames_since_capture = 0
+        self._previous_state = state
+
+        self._entries.append(entry)
+        self._size += len(entry[1])
+        self._evict()
+
+    def rewind(self) -> bool:
+        """
+        Go back to the previous captured state, and run one frame from there so that the frame is redrawn.
+        Returns False (and does nothing) when there is no older state to go back to.
+        """
+        if len(self._entries) < 2:
+            return False
+        is_keyframe, data = self._entries.pop()
+        self._size -= len(data)
+
+        newest = len(self._entries) - 1
+        if is_keyframe:
+            state = self._state_at(newest)
+        else:
+            # _previous_state is the state that was just popped, so undoing its delta gives the one before it
+            state = _xor(self._previous_state, zlib.decompress(data))
+        self._captures_since_keyframe = newest - self._keyframe_before(newest) + 1
+        self._emulator.load_state(state)
+        self._previous_state = state
+        self._frames_since_capture = 0
+        self._emulator.step_frame()
+        return True
+
+    def _keyframe_before(self, index: int) -> int:
+        while not self._entries[index][0]:
+            index -= 1
+        return index
+
+    def _state_at(self, index: int) -> bytes:
+        keyframe_index = self._keyframe_before(index)
+        state = zlib.decompress(self._entries[keyframe_index][1])
+        for i in range(keyframe_index + 1, index + 1):
+            state = _xor(state, zlib.decompress(self._entries[i][1]))
+        return state
+
+    def _evict(self):
+        # The oldest keyframe and the deltas that depend on it are evicted together, but the newest group is kept
+        while self._size > self._max_bytes:
+            group_size = 1
+            while group_size < len(self._entries) and not self._entries[group_size][0]:
+                group_size += 1
+            if group_size == len(self._entries):
+                break
+            for _ in range(group_size):
+                _, data = self._entries.popleft()
+                self._size -= len(data)
@@ -0,0 +1,30 @@
+import cython
+from gb_pymulator.motherboard cimport Motherboard, Memory
+
+cdef int MAX_DEPTH
+cdef int MAX_STACK_SCAN
+cdef int RECORD_SIZE
+cdef int BUFFERED_SAMPLES
+
+cdef int _key(int bank, int address) noexcept nogil
+
+@cython.locals(opcode=cython.int)
+cdef bint _is_return_address(Memory memory, int address) except -1 nogil
+
+@cython.final
+cdef class Sampler:
+
+    cdef readonly int interval
+    cdef readonly long long samples
+    cdef dict _stacks
+    cdef int _countdown
+    cdef object _records
+    cdef int[::1] _records_view
+    cdef int _buffered
+
+    cdef int tick(self, Motherboard motherboard, int cycles) except -1 nogil
+    @cython.locals(record=cython.int, depth=cython.int, bank=cython.int, pc=cython.int,
+                   address=cython.int, end=cython.int, return_address=cython.int)
+    cdef int _sample(self, Motherboard motherboard) except -1 nogil
+    @cython.locals(i=cython.int, record=cython.int, depth=cython.int)
+    cdef _flush(self)
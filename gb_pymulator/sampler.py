@@ -0,0 +1,158 @@
+"""
+A sampling profiler for the guest code: where the game spends its emulated cycles, by routine. Every interval cycles,
+the program counter and ROM bank are sampled, together with the callers that are found on the stack. With a symbol
+file (see symbols.py), the samples are attributed to the game's routines, and they can be written as folded stacks,
+for flamegraph.pl or speedscope.
+
+Unlike the counters and tracing, the sampler is always compiled in, since all it costs while it's disabled is a check
+per instruction.
+"""
+
+from array import array
+from collections import Counter
+from typing import Optional
+
+try:
+    import cython
+except ImportError:
+    from gb_pymulator import cython_shim as cython
+
+from gb_pymulator.symbols import Symbols, address_name
+
+# ~4000 samples per emulated second
+DEFAULT_INTERVAL = 1024
+
+# The callers that are kept per sample (the outermost ones are dropped), and the stack words that are looked at
+MAX_DEPTH = 32
+MAX_STACK_SCAN = 256
+
+# A sample is stored as its depth, followed by the keys of the sampled address and its callers (innermost first)
+RECORD_SIZE = 1 + MAX_DEPTH
+
+# Samples are collected in a buffer without holding the GIL, and counted (by stack) when it's full
+BUFFERED_SAMPLES = 4096
+
+
+def _key(bank, address) -> int:
+    return (bank << 16) | address
+
+
+def _is_return_address(memory, address) -> bool:
+    # Whether the address comes right after a CALL instruction in the ROM
+    if address < 3 or address >= 0x8000:
+        return False
+    opcode = memory.peek(address - 3)
+    # CALL, CALL NZ, CALL Z, CALL NC or CALL C
+    return opcode == 0xCD or opcode == 0xC4 or opcode == 0xCC or opcode == 0xD4 or opcode == 0xDC
+
+
+class Sampler:
+    def __init__(self, interval: int = DEFAULT_INTERVAL):
+        if interval <= 0:
+            raise ValueError(f"Expected a positive interval, but got {interval}")
+        self.interval = interval
+        self.samples = 0
+        # Sample counts by stack (tuples of keys, outermost caller first)
+        self._stacks = {}
+        self._countdown = interval
+        self._records = array("i", bytes(4 * RECORD_SIZE * BUFFERED_SAMPLES))
+        # A typed view, that can be written without holding the GIL
+        self._records_view = self._records
+        self._buffered = 0
+
+    def tick(self, motherboard, cycles):
+        # Called after each instruction
+        self._countdown -= cycles
+        if self._countdown > 0:
+            return 0
+        self._countdown += self.interval
+        return self._sample(motherboard)
+
+    def _sample(self, motherboard):
+        record = self._buffered * RECORD_SIZE
+        bank = motherboard.memory._cartridge.rom_bank()
+        pc = motherboard.program_counter
+        self._records_view[record + 1] = _key(bank if 0x4000 <= pc < 0x8000 else 0, pc)
+        depth = 1
+
+        # The calls aren't tracked as they happen. Instead, the words on the stack that look like return addresses are
+        # taken to be the callers (so other words can be mistaken for one, e.g. a saved register). The stack is in
+        # work RAM or high RAM. It's peeked at, so that the counters and the instruction trace don't see the sampler.
+        address = motherboard.reg.stack_pointer
+        if 0xC000 <= address < 0xE000:
+            end = min(0xE000, address + 2 * MAX_STACK_SCAN)
+        elif 0xFF80 <= address < 0xFFFF:
+            end = 0xFFFF
+        else:
+            end = address
+        while address + 1 < end and depth < MAX_DEPTH:
+            return_address = motherboard.memory.peek(address) | (motherboard.memory.peek(address + 1) << 8)
+            if _is_return_address(motherboard.memory, return_address):
+                # The CALL instruction, so that a call at the end of a routine is attributed to that routine
+                self._records_view[record + 1 + depth] = _key(bank if return_address >= 0x4000 else 0,
+                                                              return_address - 3)
+                depth += 1
+            address += 2
+
+        self._records_view[record] = depth
+        self._buffered += 1
+        self.samples += 1
+        if self._buffered == BUFFERED_SAMPLES:
+            with cython.gil:
+                self._flush()
+        return 0
+
+    def _flush(self):
+        for i in range(self._buffered):
+            record = i * RECORD_SIZE
+            depth = self._records_view[record]
+            stack = tuple(self._records[record + 1:record + 1 + depth])[::-1]
+            self._stacks[stack] = self._stacks.get(stack, 0) + 1
+        self._buffered = 0
+
+    def reset(self):
+        self._buffered = 0
+        self._stacks = {}
+        self.samples = 0
+
+    def stacks(self) -> dict:
+        """ Sample counts by stack, as tuples of (bank, address), from the outermost caller to the sampled address """
+        self._flush()
+        return {tuple((key >> 16, key & 0xFFFF) for key in stack): count for stack, count in self._stacks.items()}
+
+    def _named_stacks(self, symbols: Optional[Symbols]) -> Counter:
+        cycles = Counter()
+        for stack, count in self.stacks().items():
+            names = [symbols.name(bank, address) if symbols is not None else address_name(bank, address)
+                     for bank, address in stack]
+            cycles[tuple(names)] += count * self.interval
+        return cycles
+
+    def routines(self, symbols: Optional[Symbols] = None) -> list:
+        """
+        (routine, self cycles, total cycles) of each sampled routine, with the most self cycles first. The total
+        includes the routines that it calls. Without symbols, each address is a routine of its own.
+        """
+        self_cycles = Counter()
+        total_cycles = Counter()
+        for names, cycles in self._named_stacks(symbols).items():
+            self_cycles[names[-1]] += cycles
+            # (A recursive routine is only counted once per sample)
+            for name in set(names):
+                total_cycles[name] += cycles
+        return [(name, self_cycles[name], total_cycles[name])
+                for name in sorted(total_cycles, key=lambda n: (self_cycles[n], total_cycles[n]), reverse=True)]
+
+    def folded(self, symbols: Optional[Symbols] = None) -> str:
+        """ The samples as folded stacks ("Main;UpdatePlayer;ReadJoypad 2048" per line), weighted by cycles """
+        return "".join(f"{';'.join(names)} {cycles}\n" for names, cycles in sorted(self._named_stacks(symbols).items()))
+
+    def report(self, symbols: Optional[Symbols] = None, top: int = 20) -> str:
+        """ The routines that the most emulated cycles were spent in """
+        total = max(self.samples * self.interval, 1)
+        lines = [f"{self.samples} samples, every {self.interval} cycles. Routines by emulated cycles:",
+                 f"  {'routine':<32} {'self':>12} {'self %':>7} {'total %':>8}"]
+        for name, self_cycles, total_cycles in self.routines(symbols)[:top]:
+            lines.append(f"  {name:<32} {self_cycles:>12} {self_cycles / total * 100:>6.1f}% "
+                         f"{total_cycles / total * 100:>7.1f}%")
+        return "\n".join(lines)
@@ -0,0 +1,90 @@
+"""
+Save states: the state of the whole machine as a compact, versioned binary blob.
+
+Layout (little-endian):
+
+    header   magic b"GBPS", format version (u16), flags (u8)
+    payload  (zlib-compressed when FLAG_COMPRESSED is set)
+             number of integer groups (u16), and for each group: its length (u16) followed by the integers (i64)
+             number of memory regions (u16), and for each region: its length (u32) followed by the bytes
+
+The groups and regions are listed by Emulator.save_state(). Bump VERSION whenever their layout changes.
+"""
+
+import struct
+import zlib
+from typing import List, Sequence, Tuple
+
+MAGIC = b"GBPS"
+VERSION = 3
+
+FLAG_COMPRESSED = 0b0000_0001
+
+_HEADER = struct.Struct("<4sHB")
+_COUNT = struct.Struct("<H")
+_LENGTH = struct.Struct("<I")
+
+
+class InvalidStateError(ValueError):
+    """ The data isn't a save state of this format version, or is corrupt """
+
+
+def encode(int_groups: Sequence[Sequence[int]], regions: Sequence[bytes], compress: bool = False) -> bytes:
+    parts = [_COUNT.pack(len(int_groups))]
+    for group in int_groups:
+        parts.append(_COUNT.pack(len(group)))
+        parts.append(struct.pack(f"<{len(group)}q", *group))
+    parts.append(_COUNT.pack(len(regions)))
+    for region in regions:
+        parts.append(_LENGTH.pack(len(region)))
+        parts.append(region)
+    payload = b"".join(parts)
+
+    flags = 0
+    if compress:
+        # The fastest compression level. Most of the state is RAM with long runs of zeros, so it still shrinks a lot
+        payload = zlib.compress(payload, 1)
+        flags |= FLAG_COMPRESSED
+    return _HEADER.pack(MAGIC, VERSION, flags) + payload
+
+
+def decode(data: bytes) -> Tuple[List[Tuple[int, ...]], List[bytes]]:
+    if len(data) < _HEADER.size:
+        raise InvalidStateError("Not a save state (too short)")
+    magic, version, flags = _HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise InvalidStateError("Not a save state (wrong magic bytes)")
+    if version != VERSION:
+        raise InvalidStateError(f"Unsupported save state version: {version} (expected {VERSION})")
+
+    payload = memoryview(data)[_HEADER.size:]
+    if flags & FLAG_COMPRESSED:
+        try:
+            payload = memoryview(zlib.decompress(payload))
+        except zlib.error as e:
+            raise InvalidStateError(f"Corrupt save state: {e}")
+
+    try:
+        offset = 0
+        (num_groups,) = _COUNT.unpack_from(payload, offset)
+        offset += _COUNT.size
+        int_groups = []
+        for _ in range(num_groups):
+            (length,) = _COUNT.unpack_from(payload, offset)
+            offset += _COUNT.size
+            int_groups.append(struct.unpack_from(f"<{length}q", payload, offset))
+            offset += length * 8
+
+        (num_regions,) = _COUNT.unpack_from(payload, offset)
+        offset += _COUNT.size
+        regions = []
+        for _ in range(num_regions):
+            (length,) = _LENGTH.unpack_from(payload, offset)
+            offset += _LENGTH.size
+            regions.append(bytes(payload[offset:offset + length]))
+            offset += length
+    except struct.error as e:
+        raise InvalidStateError(f"Corrupt save state: {e}")
+    if offset != len(payload):
+        raise InvalidStateError("Corrupt save state: wrong length")
+    return int_groups, regions
@@ -0,0 +1,88 @@
+"""
+A cache of save states on disk, keyed by the SHA-1 of the ROM and a name, so that a session (or a test run) can start
+from a known state instead of replaying the boot and title screens every time:
+
+    snapshots/<ROM SHA-1>/<name>.state
+
+The post-boot state (right after the boot ROM has handed over to the cartridge) is cached under post_boot_name(), and
+any other checkpoint can be stored under a name of the user's choosing.
+"""
+
+import hashlib
+import os
+import re
+from typing import Callable, List
+
+from gb_pymulator import logger
+from gb_pymulator.save_state import InvalidStateError
+
+DEFAULT_DIRECTORY = "snapshots"
+
+_VALID_NAME = re.compile(r"^[A-Za-z0-9_.-]+$")
+
+
+def post_boot_name(boot_rom: bytes) -> str:
+    # The post-boot state depends on the boot ROM too
+    return f"post_boot_{hashlib.sha1(boot_rom).hexdigest()[:8]}"
+
+
+class SnapshotCache:
+    def __init__(self, directory: str = DEFAULT_DIRECTORY):
+        self.directory = directory
+
+    def path(self, emulator, name: str) -> str:
+        if not _VALID_NAME.match(name):
+            raise ValueError(f"Invalid snapshot name: '{name}' (use letters, digits, '_', '-' and '.')")
+        return os.path.join(self.directory, emulator.rom_sha1, f"{name}.state")
+
+    def names(self, emulator) -> List[str]:
+        """ The names of the snapshots that are cached for the emulator's ROM """
+        rom_directory = os.path.join(self.directory, emulator.rom_sha1)
+        if not os.path.isdir(rom_directory):
+            return []
+        return sorted(file_name[:-len(".state")] for file_name in os.listdir(rom_directory)
+                      if file_name.endswith(".state"))
+
+    def save(self, emulator, name: str):
+        path = self.path(emulator, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written to a temporary file first, so that a concurrent test run never reads a partial state
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+        with open(temporary_path, "wb") as file:
+            file.write(emulator.save_state(compress=True))
+        os.replace(temporary_path, path)
+
+    def load(self, emulator, name: str) -> bool:
+        """
+        Load the named snapshot into the emulator. Returns False (and does nothing) if it isn't cached. A snapshot that
+        isn't a valid save state (e.g. saved by an older version of the emulator) is deleted, and is also a miss. A
+        snapshot that doesn't fit the emulator (see Emulator.load_state()) raises ValueError, and is kept.
+        """
+        path = self.path(emulator, name)
+        if not os.path.exists(path):
+            return False
+        with open(path, "rb") as file:
+            data = file.read()
+        try:
+            emulator.load_state(data)
+        except InvalidStateError as e:
+            logger.warn(f"Deleting snapshot that can't be loaded: {path} ({e})")
+            os.remove(path)
+            return False
+        return True
+
+    def delete(self, emulator, name: str):
+        path = self.path(emulator, name)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def load_or_create(self, emulator, name: str, create: Callable) -> bool:
+        """
+        Load the named snapshot, or (if it isn't cached) call create(emulator) to run the emulator into the state, and
+        cache it. Returns True if the snapshot was loaded from the cache.
+        """
+        if self.load(emulator, name):
+            return True
+        create(emulator)
+        self.save(emulator, name)
+        return False
@@ -0,0 +1,66 @@
+"""
+Symbol files, that name the routines of a game. The format is the one that RGBDS (rgblink -n) and no$gmb write: a
+line per label, as "BANK:ADDRESS Name" in hex (e.g. "01:4a3c UpdatePlayer"), with ";" comments.
+"""
+
+import bisect
+from collections import defaultdict
+from typing import Dict, Tuple
+
+from gb_pymulator.counters import region
+
+
+class Symbols:
+    def __init__(self, labels: Dict[Tuple[int, int], str]):
+        """ :param labels: names by (bank, address) """
+        self.labels = labels
+        # Sorted addresses of each bank, for finding the label that an address comes after
+        self._addresses = defaultdict(list)
+        for bank, address in sorted(labels):
+            self._addresses[bank].append(address)
+
+    @staticmethod
+    def parse(text: str, local_labels: bool = False) -> "Symbols":
+        """
+        :param local_labels: keep local labels (e.g. "UpdatePlayer.loop"). By default, an address in a loop is
+                             attributed to the routine that the loop is in.
+        """
+        labels = {}
+        section = "labels"
+        for line in text.splitlines():
+            line = line.split(";")[0].strip()
+            if not line:
+                continue
+            if line.startswith("["):
+                # Newer no$gmb files are split into sections, of which only [labels] has addresses
+                section = line.strip("[]").lower()
+                continue
+            fields = line.split(maxsplit=1)
+            if section != "labels" or len(fields) != 2 or ":" not in fields[0]:
+                continue
+            if not local_labels and "." in fields[1]:
+                continue
+            bank, address = fields[0].split(":")
+            try:
+                labels[(int(bank, 16), int(address, 16))] = fields[1].strip()
+            except ValueError:
+                continue
+        return Symbols(labels)
+
+    @staticmethod
+    def load(path: str, local_labels: bool = False) -> "Symbols":
+        with open(path) as file:
+            return Symbols.parse(file.read(), local_labels)
+
+    def name(self, bank: int, address: int) -> str:
+        """ The label at or before the address, in the same bank and region (or the address, if there's none) """
+        addresses = self._addresses.get(bank, [])
+        index = bisect.bisect_right(addresses, address) - 1
+        if index >= 0 and region(addresses[index]) == region(address):
+            return self.labels[(bank, addresses[index])]
+        return address_name(bank, address)
+
+
+def address_name(bank: int, address: int) -> str:
+    """ An address as it's written in symbol files (e.g. "01:4A3C") """
+    return f"{bank:02X}:{address:04X}"
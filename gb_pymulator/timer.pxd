@@ -1,8 +1,8 @@
-# cython: profile=True
 import cython
 
-cdef list BITMASKS
+cdef int[4] BITMASKS
 
+@cython.final
 cdef class Timer:
 
     cdef int div
@@ -12,7 +12,9 @@ cdef class Timer:
     cdef unsigned int _previous_and_result
     cdef int _interrupt_countdown
 
+    cpdef tuple get_state(self)
+    cpdef set_state(self, tuple state)
     @cython.locals(bitmask=int, timer_enable=bint, should_interrupt=bint, div_bit=bint, and_result=bint)
-    cdef bint update(self, int cycle_delta)
-    cdef write(self, int address, int value)
-    cdef int read(self, int address)
\ No newline at end of file
+    cpdef bint update(self, int cycle_delta) noexcept nogil
+    cpdef int write(self, int address, int value) noexcept nogil
+    cpdef int read(self, int address) noexcept nogil
@@ -1,5 +1,3 @@
-# cython: profile=True
-
 BITMASKS = [
     0b0000_0010_0000_0000,  # TAC 0: bit 9
     0b0000_0000_0000_1000,  # TAC 1: bit 3
@@ -19,6 +17,12 @@ class Timer:
         self._previous_and_result = 0
         self._interrupt_countdown = -1
 
+    def get_state(self) -> tuple:
+        return self.div, self.tima, self.tma, self.tac, self._previous_and_result, self._interrupt_countdown
+
+    def set_state(self, state: tuple):
+        self.div, self.tima, self.tma, self.tac, self._previous_and_result, self._interrupt_countdown = state
+
     def write(self, address, value):
         if address == 0xFF04:
             self.div = 0
@@ -38,12 +42,13 @@ class Timer:
             return self.tma
         elif address == 0xFF07:
             return self.tac
+        return 0
 
     def update(self, cycle_delta) -> bool:
 
         # Algorithm described here https://hacktix.github.io/GBEDG/timers/#timer-operation
         bitmask = BITMASKS[self.tac & 0b11]
-        timer_enable = bool(self.tac & 0b100)
+        timer_enable = self.tac & 0b100 != 0
 
         should_interrupt = False
 
@@ -62,7 +67,7 @@ class Timer:
 
             self.div += 1
 
-            div_bit = bool(self.div & bitmask)
+            div_bit = self.div & bitmask != 0
             and_result = div_bit & timer_enable
 
             # If "falling edge"
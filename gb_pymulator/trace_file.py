@@ -0,0 +1,73 @@
+"""
+The file format of instruction traces (see instruction_trace.py), and a reader for analysing them with NumPy.
+
+A file starts with MAGIC, followed by the size of a record and the number of records (as little-endian uint32), and
+then the records, oldest first. Each record is an executed instruction: the emulated cycle that it started at, the
+registers before it executed, and the last memory access that it made (a write, if it made one).
+
+    python -m gb_pymulator.trace_file crash.gbtrace --last 50
+"""
+
+import struct
+
+MAGIC = b"GBITRACE"
+HEADER = struct.Struct("<II")
+RECORD_SIZE = 32
+
+# The access field of a record
+ACCESS_NONE = 0
+ACCESS_READ = 1
+ACCESS_WRITE = 2
+
+# The fields of a record, as a NumPy dtype. Opcodes 0x100-0x1FF are the CB-prefixed ones.
+FIELDS = [
+    ("cycle", "<u8"),
+    ("pc", "<u2"), ("opcode", "<u2"), ("sp", "<u2"), ("address", "<u2"),
+    ("a", "u1"), ("f", "u1"), ("b", "u1"), ("c", "u1"), ("d", "u1"), ("e", "u1"), ("h", "u1"), ("l", "u1"),
+    ("value", "u1"), ("access", "u1"), ("ime", "u1"), ("padding", "V5"),
+]
+
+
+def load(path: str):
+    """ The records of a trace file, as a NumPy structured array (e.g. records["pc"]) """
+    import numpy
+    with open(path, "rb") as file:
+        data = file.read()
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError(f"Not an instruction trace: {path}")
+    record_size, count = HEADER.unpack_from(data, len(MAGIC))
+    if record_size != RECORD_SIZE:
+        raise ValueError(f"Unsupported record size {record_size} (expected {RECORD_SIZE})")
+    return numpy.frombuffer(data, dtype=numpy.dtype(FIELDS), count=count, offset=len(MAGIC) + HEADER.size)
+
+
+def format_record(record) -> str:
+    opcode = int(record["opcode"])
+    opcode_name = f"CB {opcode - 0x100:02X}" if opcode >= 0x100 else f"{opcode:02X}   "
+    line = (f"{int(record['cycle']):>12} {int(record['pc']):04X}: {opcode_name} "
+            f"A={int(record['a']):02X} F={int(record['f']):02X} B={int(record['b']):02X} C={int(record['c']):02X} "
+            f"D={int(record['d']):02X} E={int(record['e']):02X} H={int(record['h']):02X} L={int(record['l']):02X} "
+            f"SP={int(record['sp']):04X}{' IME' if record['ime'] else '    '}")
+    if record["access"] == ACCESS_READ:
+        line += f"  read  [{int(record['address']):04X}] = {int(record['value']):02X}"
+    elif record["access"] == ACCESS_WRITE:
+        line += f"  write [{int(record['address']):04X}] = {int(record['value']):02X}"
+    return line
+
+
+def main():
+    # Imported here, since the emulator imports this module for the format
+    import argparse
+    parser = argparse.ArgumentParser(description="Print the last instructions of an instruction trace")
+    parser.add_argument("trace_file")
+    parser.add_argument("--last", type=int, default=100, help="How many instructions to print (0 for all)")
+    args = parser.parse_args()
+
+    records = load(args.trace_file)
+    print(f"{len(records)} instructions in {args.trace_file}")
+    for record in records[-args.last if args.last else 0:]:
+        print(format_record(record))
+
+
+if __name__ == "__main__":
+    main()
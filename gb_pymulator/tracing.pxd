@@ -0,0 +1,39 @@
+import cython
+from gb_pymulator cimport build_options
+
+cdef int FRAME
+cdef int CPU
+cdef int DRAW_LINE
+cdef int PRESENT
+cdef int INPUT
+cdef int ROM_BANK
+cdef int RAM_BANK
+cdef int DMA
+cdef int INTERRUPT
+cdef int FIELDS
+
+@cython.final
+cdef class Tracer:
+
+    cdef readonly object events
+    cdef long long[::1] _events
+    cdef readonly long long capacity
+    cdef readonly long long count
+    cdef readonly long long origin_ns
+    cdef readonly long long frames
+    cdef long long _frame_start
+    cdef long long _cpu_start
+
+    @cython.locals(index=cython.longlong)
+    cdef int _record(self, int name, long long start, long long end, long long arg) noexcept nogil
+    @cython.locals(now=cython.longlong)
+    cpdef int start_frame(self) noexcept nogil
+    @cython.locals(end=cython.longlong)
+    cdef int scanline(self, long long start, int line, bint lcd_enabled) noexcept nogil
+    cpdef int input_polled(self, long long start) noexcept nogil
+    @cython.locals(now=cython.longlong)
+    cdef int bank_switch(self, int address, int value) noexcept nogil
+    @cython.locals(now=cython.longlong)
+    cdef int dma(self, int value) noexcept nogil
+    @cython.locals(vector=cython.int, now=cython.longlong)
+    cdef int interrupt(self, int flag) noexcept nogil
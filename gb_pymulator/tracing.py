@@ -0,0 +1,155 @@
+"""
+Trace events, for seeing what the host was doing during the frames that took too long (the spikes that make the
+game stutter, which the averages of the execution counters hide). They're saved in the Chrome trace event format,
+that chrome://tracing and https://ui.perfetto.dev open.
+
+Each emulated frame is a span, from the start of one frame to the start of the next (so it includes the time spent
+outside of the emulator, e.g. waiting in the frontend). Nested in it are spans for the CPU (including the timer), for
+drawing each scanline (Display._draw_line), for presenting the frame and for polling the input, and instant events
+for bank switches, OAM DMA transfers and interrupts.
+
+The events are kept in a ring buffer, so only the latest ones are saved. Like the counters, tracing is compiled out
+unless the extension modules are built with GB_PYMULATOR_TRACING=1 (see setup.py), and then it only happens for an
+emulator that has it enabled (with Emulator.enable_tracing()).
+"""
+
+from array import array
+
+from gb_pymulator import build_options
+
+# Whether tracing is compiled in
+AVAILABLE = build_options.TRACING
+
+# Event names, as indices into NAMES
+FRAME = 0
+CPU = 1
+DRAW_LINE = 2
+PRESENT = 3
+INPUT = 4
+ROM_BANK = 5
+RAM_BANK = 6
+DMA = 7
+INTERRUPT = 8
+NAMES = ["frame", "cpu", "draw_line", "present", "input", "rom_bank", "ram_bank", "dma", "interrupt"]
+
+# The rest are instant events
+SPANS = {FRAME, CPU, DRAW_LINE, PRESENT, INPUT}
+
+# The name of the argument of each kind of event (if it has one)
+ARGUMENT_NAMES = {FRAME: "frame", DRAW_LINE: "line", ROM_BANK: "bank", RAM_BANK: "bank", DMA: "source",
+                  INTERRUPT: "vector"}
+
+# Each event is stored as (name, start, end, argument), with the times in nanoseconds
+FIELDS = 4
+
+# ~16 MB, which holds around 30 seconds of frames
+DEFAULT_CAPACITY = 1 << 19
+
+
+class Tracer:
+    def __init__(self, capacity: int = DEFAULT_CAPACITY):
+        if capacity <= 0:
+            raise ValueError(f"Expected a positive capacity, but got {capacity}")
+        self.capacity = capacity
+        self.events = array("q", bytes(8 * FIELDS * capacity))
+        # A typed view, that can be written without holding the GIL
+        self._events = self.events
+        # The number of events that have been recorded (the oldest ones have been overwritten, past the capacity)
+        self.count = 0
+        self.origin_ns = build_options.now_ns()
+        self.frames = 0
+        self._frame_start = 0
+        self._cpu_start = 0
+
+    def _record(self, name, start, end, arg):
+        index = (self.count % self.capacity) * FIELDS
+        self._events[index] = name
+        self._events[index + 1] = start
+        self._events[index + 2] = end
+        self._events[index + 3] = arg
+        self.count += 1
+        return 0
+
+    def start_frame(self):
+        """ Called when the emulator starts a frame. Ends the span of the previous frame. """
+        now = build_options.now_ns()
+        if self._frame_start != 0:
+            self._record(FRAME, self._frame_start, now, self.frames)
+        self.frames += 1
+        self._frame_start = now
+        self._cpu_start = now
+        return 0
+
+    def scanline(self, start, line, lcd_enabled):
+        # Called when the display has advanced to the next scanline (and drawn it), after running the CPU since the
+        # previous scanline that was drawn
+        if not lcd_enabled or line > 144:
+            return 0
+        end = build_options.now_ns()
+        self._record(CPU, self._cpu_start, start, -1)
+        if line < 144:
+            self._record(DRAW_LINE, start, end, line)
+        else:
+            # Entering V-Blank
+            self._record(PRESENT, start, end, -1)
+        self._cpu_start = end
+        return 0
+
+    def input_polled(self, start):
+        self._record(INPUT, start, build_options.now_ns(), -1)
+        return 0
+
+    def bank_switch(self, address, value):
+        # Called on a write to the cartridge's control registers
+        now = build_options.now_ns()
+        if 0x2000 <= address < 0x4000:
+            self._record(ROM_BANK, now, now, value)
+        elif 0x4000 <= address < 0x6000:
+            self._record(RAM_BANK, now, now, value)
+        return 0
+
+    def dma(self, value):
+        now = build_options.now_ns()
+        self._record(DMA, now, now, value * 0x100)
+        return 0
+
+    def interrupt(self, flag):
+        # The interrupt with the highest priority (the lowest bit) of the requested ones is serviced
+        vector = 0x40
+        while not flag & 1:
+            flag >>= 1
+            vector += 8
+        now = build_options.now_ns()
+        self._record(INTERRUPT, now, now, vector)
+        return 0
+
+    def trace_events(self) -> list:
+        """ The recorded events in the Chrome trace event format, oldest first (with the times in microseconds) """
+        trace_events = [
+            {"name": "process_name", "ph": "M", "pid": 1, "tid": 1, "args": {"name": "gb-pymulator"}},
+            {"name": "thread_name", "ph": "M", "pid": 1, "tid": 1, "args": {"name": "emulator"}},
+        ]
+        for i in range(max(self.count - self.capacity, 0), self.count):
+            index = (i % self.capacity) * FIELDS
+            name = self.events[index]
+            start = self.events[index + 1]
+            end = self.events[index + 2]
+            arg = self.events[index + 3]
+            event = {"name": NAMES[name], "pid": 1, "tid": 1, "ts": (start - self.origin_ns) / 1000}
+            if name in SPANS:
+                event["ph"] = "X"
+                event["dur"] = (end - start) / 1000
+            else:
+                event["ph"] = "i"
+                event["s"] = "t"
+            if name in ARGUMENT_NAMES:
+                event["args"] = {ARGUMENT_NAMES[name]: f"0x{arg:04X}" if name in (DMA, INTERRUPT) else arg}
+            trace_events.append(event)
+        return trace_events
+
+    def save(self, path: str):
+        """ Write the events as a JSON trace file """
+        # Imported here, so that importing the emulator doesn't import json
+        import json
+        with open(path, "w") as file:
+            json.dump({"traceEvents": self.trace_events(), "displayTimeUnit": "ms"}, file, separators=(",", ":"))
@@ -0,0 +1,158 @@
+import multiprocessing
+from multiprocessing import shared_memory
+from typing import Optional, Sequence
+
+import numpy
+
+from gb_pymulator.emulator import Emulator
+
+FRAME_SHAPE = (144, 160, 3)
+
+_STEP = "step"
+_RESET = "reset"
+_CLOSE = "close"
+
+
+class VectorEnv:
+    """
+    Many emulator instances running the same ROM, hosted by a pool of worker processes.
+
+    Observations (frames and selected RAM bytes) and actions (button masks) are exchanged through shared memory.
+    The arrays returned by reset() and step() are views of that shared memory, and are overwritten by the next call.
+    """
+
+    def __init__(self, rom: bytes, num_envs: int, num_workers: Optional[int] = None,
+                 ram_addresses: Sequence[int] = (), frames_per_step: int = 1):
+        if num_workers is None:
+            num_workers = min(num_envs, multiprocessing.cpu_count())
+        if not 0 < num_workers <= num_envs:
+            raise ValueError(f"Invalid number of workers {num_workers} for {num_envs} envs")
+
+        self.num_envs = num_envs
+        self.num_workers = num_workers
+        self.ram_addresses = list(ram_addresses)
+
+        self._frames_shm = shared_memory.SharedMemory(create=True, size=num_envs * numpy.prod(FRAME_SHAPE))
+        self._ram_shm = shared_memory.SharedMemory(create=True, size=max(1, num_envs * len(self.ram_addresses)))
+        self._actions_shm = shared_memory.SharedMemory(create=True, size=num_envs)
+        self.frames = numpy.ndarray((num_envs, *FRAME_SHAPE), dtype=numpy.uint8, buffer=self._frames_shm.buf)
+        self.ram = numpy.ndarray((num_envs, len(self.ram_addresses)), dtype=numpy.uint8, buffer=self._ram_shm.buf)
+        self._actions = numpy.ndarray((num_envs,), dtype=numpy.uint8, buffer=self._actions_shm.buf)
+
+        # Instances are divided into contiguous ranges, one range per worker
+        bounds = numpy.linspace(0, num_envs, num_workers + 1).astype(int)
+        self._connections = []
+        self._processes = []
+        for worker_index in range(num_workers):
+            parent_connection, child_connection = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=_run_worker,
+                args=(child_connection, rom, int(bounds[worker_index]), int(bounds[worker_index + 1]), num_envs,
+                      self.ram_addresses, frames_per_step,
+                      self._frames_shm.name, self._ram_shm.name, self._actions_shm.name),
+                daemon=True,
+            )
+            process.start()
+            child_connection.close()
+            self._connections.append(parent_connection)
+            self._processes.append(process)
+        self._ranges = [(int(bounds[i]), int(bounds[i + 1])) for i in range(num_workers)]
+        self._closed = False
+        self._wait_for_workers()
+
+    def reset(self, env_indices: Optional[Sequence[int]] = None):
+        """ Restore instances to the snapshot taken when they were created (all instances by default) """
+        indices = range(self.num_envs) if env_indices is None else env_indices
+        for (start, end), connection in zip(self._ranges, self._connections):
+            connection.send((_RESET, [i for i in indices if start <= i < end]))
+        self._wait_for_workers()
+        return self.frames, self.ram
+
+    def step(self, actions: Sequence[int]):
+        """ Apply one button mask per instance and advance all instances. Returns (frames, ram). """
+        self._actions[:] = actions
+        for connection in self._connections:
+            connection.send((_STEP, None))
+        self._wait_for_workers()
+        return self.frames, self.ram
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        for connection in self._connections:
+            try:
+                connection.send((_CLOSE, None))
+            except BrokenPipeError:
+                # The worker has already exited
+                pass
+        for process in self._processes:
+            process.join()
+        for shm in (self._frames_shm, self._ram_shm, self._actions_shm):
+            shm.close()
+            shm.unlink()
+
+    def _wait_for_workers(self):
+        for connection in self._connections:
+            error = connection.recv()
+            if error is not None:
+                self.close()
+                raise RuntimeError(f"Emulator worker failed: {error}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def _run_worker(connection, rom: bytes, start: int, end: int, num_envs: int, ram_addresses, frames_per_step: int,
+                frames_shm_name: str, ram_shm_name: str, actions_shm_name: str):
+    frames_shm = shared_memory.SharedMemory(name=frames_shm_name)
+    ram_shm = shared_memory.SharedMemory(name=ram_shm_name)
+    actions_shm = shared_memory.SharedMemory(name=actions_shm_name)
+    frames = numpy.ndarray((num_envs, *FRAME_SHAPE), dtype=numpy.uint8, buffer=frames_shm.buf)
+    ram = numpy.ndarray((num_envs, len(ram_addresses)), dtype=numpy.uint8, buffer=ram_shm.buf)
+    actions = numpy.ndarray((num_envs,), dtype=numpy.uint8, buffer=actions_shm.buf)
+
+    try:
+        try:
+            emulators = [Emulator(rom) for _ in range(start, end)]
+            initial_snapshots = [emulator.snapshot() for emulator in emulators]
+            for i, emulator in enumerate(emulators, start):
+                _write_observation(emulator, frames[i], ram[i], ram_addresses)
+        except Exception as e:
+            connection.send(repr(e))
+            return
+        connection.send(None)
+
+        while True:
+            command, argument = connection.recv()
+            try:
+                if command == _STEP:
+                    for i, emulator in enumerate(emulators, start):
+                        emulator.set_buttons(int(actions[i]))
+                        emulator.run_frames(frames_per_step)
+                        _write_observation(emulator, frames[i], ram[i], ram_addresses)
+                elif command == _RESET:
+                    for i in argument:
+                        emulator = emulators[i - start]
+                        emulator.restore(initial_snapshots[i - start])
+                        _write_observation(emulator, frames[i], ram[i], ram_addresses)
+                elif command == _CLOSE:
+                    return
+                connection.send(None)
+            except Exception as e:
+                connection.send(repr(e))
+    finally:
+        # The arrays must be released before the shared memory can be closed
+        del frames, ram, actions
+        for shm in (frames_shm, ram_shm, actions_shm):
+            shm.close()
+        connection.close()
+
+
+def _write_observation(emulator: Emulator, frame, ram, ram_addresses):
+    frame[:] = emulator.frame_array()
+    for j, address in enumerate(ram_addresses):
+        ram[j] = emulator.read_memory(address)[0]
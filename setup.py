@@ -1,19 +1,87 @@
-from distutils.core import setup
+import os
+import platform
+import sys
 
-from Cython.Build import cythonize
+from setuptools import setup
 
-setup(
-    ext_modules=cythonize(
-        [
-            "gb_pymulator/emulator.py",
-            "gb_pymulator/motherboard.py",
-            "gb_pymulator/timer.py",
-            "gb_pymulator/display.py",
-            "gb_pymulator/instruction_decoding.py",
-            "gb_pymulator/logger.py",
-        ],
+try:
+    from Cython.Build import cythonize
+except ImportError:
+    cythonize = None
+
+# Modules that are compiled ahead of time (each with a .pxd file that declares its types)
+COMPILED_MODULES = [
+    "gb_pymulator/emulator.py",
+    "gb_pymulator/cpu.py",
+    "gb_pymulator/cartridge.py",
+    "gb_pymulator/joypad.py",
+    "gb_pymulator/motherboard.py",
+    "gb_pymulator/timer.py",
+    "gb_pymulator/display.py",
+    "gb_pymulator/instruction_decoding.py",
+    "gb_pymulator/logger.py",
+    "gb_pymulator/counters.py",
+    "gb_pymulator/tracing.py",
+    "gb_pymulator/sampler.py",
+    "gb_pymulator/instruction_trace.py",
+]
+
+# Build options, from the environment (rebuild with "build_ext --force" after changing them):
+# - GB_PYMULATOR_PROFILE=1 compiles in Cython's profiling hooks, so that cProfile sees the compiled functions
+# - GB_PYMULATOR_COUNTERS=1 compiles in the execution counters (see gb_pymulator/counters.py)
+# - GB_PYMULATOR_TRACING=1 compiles in the trace events and the instruction trace (see gb_pymulator/tracing.py and
+#   gb_pymulator/instruction_trace.py)
+# - GB_PYMULATOR_LOG_LEVEL=N compiles in the log messages of the emulation loop from level N and up (see
+#   gb_pymulator/logger.py). By default, it's 3 (info), so e.g. the debug message of every joypad poll is compiled out.
+#   5 also compiles out the warnings.
+PROFILE = os.environ.get("GB_PYMULATOR_PROFILE") == "1"
+COUNTERS = os.environ.get("GB_PYMULATOR_COUNTERS") == "1"
+TRACING = os.environ.get("GB_PYMULATOR_TRACING") == "1"
+LOG_LEVEL = os.environ.get("GB_PYMULATOR_LOG_LEVEL")
+
+
+def ext_modules():
+    if platform.python_implementation() == "PyPy":
+        # PyPy's JIT runs the plain Python modules faster than it runs extension modules
+        return []
+    if cythonize is None:
+        # Installed as plain Python modules instead. They behave the same, only slower.
+        print("Cython is not installed. Skipping compilation of extension modules.")
+        return []
+    extensions = cythonize(
+        COMPILED_MODULES,
         language_level="3",
         build_dir="build",
-        annotate=True
+        annotate=True,
+        compiler_directives={"profile": PROFILE},
+        # The profiling hooks are in the generated C code, so it's regenerated when the options may have changed
+        force="--force" in sys.argv,
     )
+    for extension in extensions:
+        # If there is no working C compiler, the plain Python modules are used
+        extension.optional = True
+        if COUNTERS:
+            extension.define_macros.append(("GB_PYMULATOR_COUNTERS", "1"))
+        if TRACING:
+            extension.define_macros.append(("GB_PYMULATOR_TRACING", "1"))
+        if LOG_LEVEL:
+            extension.define_macros.append(("GB_PYMULATOR_LOG_LEVEL", str(int(LOG_LEVEL))))
+    return extensions
+
+
+setup(
+    name="gb-pymulator",
+    version="0.1.0",
+    description="A gameboy emulator written in Python",
+    packages=["gb_pymulator"],
+    package_data={"gb_pymulator": ["*.pxd"]},
+    ext_modules=ext_modules(),
+    python_requires=">=3.8",
+    extras_require={
+        "window": ["pygame"],
+        "numpy": ["numpy"],
+    },
+    entry_points={
+        "console_scripts": ["gb-pymulator=gb_pymulator.__main__:main"],
+    },
 )
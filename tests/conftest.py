@@ -0,0 +1,29 @@
+import pytest
+
+# A ROM that turns the LCD on, and then keeps reading the buttons into work RAM ($C000) and the background palette, so
+# that what it draws depends on the buttons that are held. It crashes (on an invalid opcode) when Start is pressed.
+INPUT_ROM_CODE = bytes([
+    0x3E, 0x91,  # LD A, $91
+    0xE0, 0x40,  # LDH ($40), A
+    0x3E, 0x10,  # LD A, $10 (select the buttons)
+    0xE0, 0x00,  # LDH ($00), A
+    0xF0, 0x00,  # LDH A, ($00)
+    0xEA, 0x00, 0xC0,  # LD ($C000), A
+    0xE0, 0x47,  # LDH ($47), A
+    0xCB, 0x5F,  # BIT 3, A (Start, which reads as 0 when pressed)
+    0x28, 0x02,  # JR Z, +2
+    0x18, 0xEF,  # JR -17
+    0xD3,  # (invalid)
+])
+
+
+@pytest.fixture(scope="session")
+def input_rom() -> bytes:
+    rom = bytearray(0x8000)
+    rom[0x100:0x104] = bytes([0x00, 0xC3, 0x50, 0x01])  # NOP, JP $0150
+    rom[0x150:0x150 + len(INPUT_ROM_CODE)] = INPUT_ROM_CODE
+    checksum = 0
+    for byte in rom[0x134:0x14D]:
+        checksum = checksum - byte - 1
+    rom[0x14D] = checksum & 0xFF
+    return bytes(rom)
@@ -0,0 +1,28 @@
+from gb_pymulator.emulator import Emulator
+from gb_pymulator.joypad import BUTTON_A, BUTTON_B
+
+
+def _run(emulator: Emulator, buttons: int, frames: int = 3):
+    emulator.set_buttons(buttons)
+    emulator.run_frames(frames)
+
+
+def test_clone_is_independent(input_rom):
+    source = Emulator(input_rom)
+    _run(source, BUTTON_B)
+
+    clone = source.clone()
+    assert clone.save_state() == source.save_state()
+    assert bytes(clone.frame()) == bytes(source.frame())
+
+    _run(clone, BUTTON_A)
+    _run(source, 0)
+    assert clone.read_memory(0xC000) != source.read_memory(0xC000)
+    assert bytes(clone.frame()) != bytes(source.frame())
+
+    # The source runs exactly like an emulator that was never cloned
+    unaffected = Emulator(input_rom)
+    _run(unaffected, BUTTON_B)
+    _run(unaffected, 0)
+    assert source.save_state() == unaffected.save_state()
+    assert bytes(source.frame()) == bytes(unaffected.frame())
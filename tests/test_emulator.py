@@ -0,0 +1,25 @@
+import os
+
+import pytest
+
+from gb_pymulator.emulator import Emulator
+
+ROM_FILE = os.path.join(os.path.dirname(__file__), "..", "test_roms", "06-ld r,r.gb")
+
+
+def test_read_memory_matches_the_memory_map():
+    emulator = Emulator(ROM_FILE)
+    emulator.run_frames(30)
+    memory = emulator._memory
+    # Ranges within one buffer, ranges across buffers and other areas (ROM, I/O registers), and single bytes
+    for address, length in [(0xC000, 0x2000), (0xC123, 5), (0xFF80, 0x7F), (0x8000, 0x2000), (0xFE00, 0xA0),
+                            (0x0100, 0x50), (0xFF40, 6), (0xFFFE, 2), (0xDFFF, 1), (0xFFFF, 1)]:
+        expected = bytes(memory.peek(a) for a in range(address, address + length))
+        assert emulator.read_memory(address, length) == expected, hex(address)
+    assert emulator.read_memory(0xC000, 0) == b""
+
+
+@pytest.mark.parametrize("address, length", [(0xFFFF, 2), (0x10000, 1), (-1, 1), (0xC000, -1)])
+def test_read_memory_rejects_ranges_outside_the_address_space(address, length):
+    with pytest.raises(ValueError, match="Invalid memory range"):
+        Emulator(ROM_FILE).read_memory(address, length)
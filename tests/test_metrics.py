@@ -0,0 +1,49 @@
+import json
+import os
+import time
+
+from gb_pymulator.emulator import Emulator
+from gb_pymulator.metrics import HISTOGRAM_BUCKETS
+
+ROM_FILE = os.path.join(os.path.dirname(__file__), "..", "test_roms", "01-special.gb")
+
+
+def _emulator() -> Emulator:
+    with open(ROM_FILE, "rb") as file:
+        return Emulator(file.read())
+
+
+def test_every_frame_is_counted_in_the_histogram():
+    emulator = _emulator()
+    metrics = emulator.enable_metrics()
+    emulator.run_frames(25)
+    assert len(metrics.frame_times) == HISTOGRAM_BUCKETS
+    assert sum(metrics.frame_times) == 25
+
+    # A stall between two batches is the time of the first frame of the second one
+    time.sleep(0.05)
+    emulator.run_frames(15)
+    assert sum(metrics.frame_times) == 40
+    assert metrics.frames == 40
+    assert any(bound is None or bound >= 50_000 for bound, _ in metrics.histogram())
+    assert sum(count for _, count in metrics.histogram()) == 40
+
+
+def test_json_lines_export(tmp_path):
+    json_file = tmp_path / "metrics.jsonl"
+    emulator = _emulator()
+    # A window ends at (almost) every run_frames() call
+    emulator.enable_metrics(window=1e-9, json_file=str(json_file))
+    for _ in range(4):
+        emulator.run_frames(5)
+    emulator.disable_metrics()
+
+    lines = [json.loads(line) for line in json_file.read_text().splitlines()]
+    assert len(lines) == 4
+    assert [line["frames"] for line in lines] == [5, 10, 15, 20]
+    for line in lines:
+        assert sum(line["frame_time_histogram"].values()) == line["frames"]
+        assert line["fps"] > 0
+        assert line["instructions"] > 0
+        assert line["skipped_frames"] == 0
+        assert line["line_cache_hit_rate"] is None
@@ -0,0 +1,67 @@
+import os
+
+import pytest
+
+from gb_pymulator.emulator import Emulator
+from gb_pymulator.joypad import BUTTON_A, BUTTON_RIGHT, BUTTON_START
+from gb_pymulator.movie import DesyncError, Movie, MoviePlayer, MovieRecorder, state_hash
+
+ROM_FILE = os.path.join(os.path.dirname(__file__), "..", "test_roms", "01-special.gb")
+
+NUM_FRAMES = 240
+HASH_INTERVAL = 10
+# Button masks that are held from these frames on
+INPUT = {30: BUTTON_START, 45: 0, 125: BUTTON_A | BUTTON_RIGHT, 180: BUTTON_RIGHT, 200: 0}
+
+
+def _emulator() -> Emulator:
+    with open(ROM_FILE, "rb") as file:
+        return Emulator(file.read())
+
+
+def _record() -> tuple:
+    # Returns the movie file, and the state hash at the end of the recording
+    emulator = _emulator()
+    emulator.run_frames(5)
+    recorder = MovieRecorder(emulator, HASH_INTERVAL)
+    for _ in range(NUM_FRAMES):
+        if emulator.frame_count in INPUT:
+            emulator.set_buttons(INPUT[emulator.frame_count])
+        emulator.step_frame()
+        recorder.on_frame()
+    return recorder.movie.to_bytes(), state_hash(emulator)
+
+
+@pytest.fixture(scope="module")
+def recording():
+    return _record()
+
+
+def test_replay_matches_the_recording(recording):
+    data, end_hash = recording
+    movie = Movie.parse(data)
+    assert movie.num_frames == NUM_FRAMES
+    assert [mask for _, mask in movie.events] == list(INPUT.values())
+    assert len(movie.hashes) == NUM_FRAMES // HASH_INTERVAL
+
+    emulator = _emulator()
+    player = MoviePlayer(emulator, movie)
+    assert player.run() == NUM_FRAMES
+    assert state_hash(emulator) == end_hash
+
+
+def test_changed_input_is_a_desync(recording):
+    data, _ = recording
+    movie = Movie.parse(data)
+    index = list(INPUT).index(125)
+    frame, mask = movie.events[index]
+    movie.events[index] = (frame, mask | BUTTON_START)
+
+    emulator = _emulator()
+    player = MoviePlayer(emulator, Movie.parse(movie.to_bytes()))
+    with pytest.raises(DesyncError) as error:
+        player.run()
+    # Detected at the first hash after the changed input
+    first_hash_after = (frame // HASH_INTERVAL + 1) * HASH_INTERVAL
+    assert error.value.frame == first_hash_after
+    assert emulator.frame_count == first_hash_after
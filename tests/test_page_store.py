@@ -0,0 +1,56 @@
+import os
+
+import pytest
+
+from gb_pymulator.emulator import Emulator
+from gb_pymulator.page_store import PAGE_SIZE, PageStore
+
+ROM_FILE = os.path.join(os.path.dirname(__file__), "..", "test_roms", "06-ld r,r.gb")
+
+NUM_STATES = 12
+
+
+def _emulator() -> Emulator:
+    with open(ROM_FILE, "rb") as file:
+        return Emulator(file.read())
+
+
+@pytest.mark.parametrize("spill", [False, True])
+def test_states_share_pages_and_are_restored_exactly(tmp_path, spill):
+    emulator = _emulator()
+    emulator.run_frames(10)
+    pages_per_state = sum((len(buffer) + PAGE_SIZE - 1) // PAGE_SIZE for buffer in emulator._buffers())
+
+    # With a tiny cap, most pages are spilled to disk, and read back when restoring
+    max_bytes = 4 * PAGE_SIZE if spill else 256 * 1024 * 1024
+    with PageStore(max_bytes, spill_file=str(tmp_path / "pages.spill")) as store:
+        states = {}
+        handle = store.put(emulator)
+        states[handle] = emulator.save_state()
+        first_pages = store.num_pages
+        for _ in range(NUM_STATES - 1):
+            # A frame of the test changes a few pages of RAM
+            emulator.run_frames(1)
+            handle = store.put(emulator)
+            states[handle] = emulator.save_state()
+
+        assert len(set(states.values())) == NUM_STATES
+        assert store.num_pages - first_pages < (NUM_STATES - 1) * pages_per_state
+        # Consecutive states share almost all of their pages
+        assert store.num_pages - first_pages < pages_per_state
+        assert store.logical_bytes > store.memory_bytes + store.spilled_pages * PAGE_SIZE
+        if spill:
+            assert store.spilled_pages > 0
+
+        restored = _emulator()
+        for handle, state in reversed(states.items()):
+            store.restore(restored, handle)
+            assert restored.save_state() == state
+
+        # Releasing a state keeps the pages that the others use
+        released = next(iter(states))
+        store.release(released)
+        del states[released]
+        for handle, state in states.items():
+            store.restore(restored, handle)
+            assert restored.save_state() == state
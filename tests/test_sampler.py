@@ -0,0 +1,28 @@
+import os
+
+import pytest
+
+from gb_pymulator import counters
+from gb_pymulator.emulator import Emulator
+
+ROM_FILE = os.path.join(os.path.dirname(__file__), "..", "test_roms", "cpu_instrs.gb")
+
+
+def _counted_accesses(sampling: bool) -> dict:
+    with open(ROM_FILE, "rb") as file:
+        emulator = Emulator(file.read())
+    emulator.enable_counters()
+    if sampling:
+        emulator.enable_sampling(interval=64)
+    emulator.run_frames(30)
+    if sampling:
+        assert emulator.sampler.samples > 0
+    stats = emulator.counters.as_dict()
+    # (The host times differ between runs)
+    del stats["ns_per_frame"]
+    return stats
+
+
+@pytest.mark.skipif(not counters.AVAILABLE, reason="The counters are compiled out (GB_PYMULATOR_COUNTERS=1)")
+def test_sampler_does_not_change_the_counters():
+    assert _counted_accesses(sampling=True) == _counted_accesses(sampling=False)
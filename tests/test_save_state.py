@@ -0,0 +1,85 @@
+import os
+import struct
+
+import pytest
+
+from gb_pymulator import save_state
+from gb_pymulator.emulator import Emulator
+from gb_pymulator.save_state import InvalidStateError
+
+ROM_DIRECTORY = os.path.join(os.path.dirname(__file__), "..", "test_roms")
+
+
+def _emulator(rom_name: str = "06-ld r,r.gb") -> Emulator:
+    with open(os.path.join(ROM_DIRECTORY, rom_name), "rb") as file:
+        return Emulator(file.read())
+
+
+def _machine(emulator: Emulator) -> tuple:
+    # What the game has drawn, and its work RAM and high RAM
+    return bytes(emulator.frame()), emulator.read_memory(0xC000, 0x2000), emulator.read_memory(0xFF80, 0x7F)
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_round_trip(compress):
+    emulator = _emulator()
+    emulator.run_frames(20)
+    state = emulator.save_state(compress)
+    saved = _machine(emulator)
+    # The test prints its result during these frames
+    emulator.run_frames(15)
+    expected = _machine(emulator)
+    assert expected[0] != saved[0]
+    expected_counts = emulator.frame_count, emulator.cycle_count
+
+    emulator.load_state(state)
+    assert emulator.frame_count == 20
+    emulator.run_frames(15)
+    assert _machine(emulator) == expected
+    assert (emulator.frame_count, emulator.cycle_count) == expected_counts
+
+    # A new emulator for the same ROM continues the same way
+    other = _emulator()
+    other.load_state(state)
+    other.run_frames(15)
+    assert _machine(other) == expected
+
+
+def test_bad_magic_is_rejected():
+    state = bytearray(_emulator().save_state())
+    state[:len(save_state.MAGIC)] = b"NOPE"
+    with pytest.raises(InvalidStateError, match="magic"):
+        _emulator().load_state(bytes(state))
+
+
+def test_other_version_is_rejected():
+    state = bytearray(_emulator().save_state())
+    struct.pack_into("<H", state, len(save_state.MAGIC), save_state.VERSION + 1)
+    with pytest.raises(InvalidStateError, match="version"):
+        _emulator().load_state(bytes(state))
+
+
+def test_truncated_state_is_rejected():
+    state = _emulator().save_state()
+    with pytest.raises(InvalidStateError):
+        _emulator().load_state(state[:-10])
+
+
+@pytest.mark.parametrize("mismatch", ["truncated", "corrupt", "other_rom"])
+def test_failed_load_leaves_the_emulator_unchanged(mismatch):
+    source = _emulator()
+    source.run_frames(30)
+    if mismatch == "truncated":
+        state, error = source.save_state()[:-10], InvalidStateError
+    elif mismatch == "corrupt":
+        compressed = source.save_state(compress=True)
+        state, error = compressed[:20] + bytes(len(compressed) - 20), InvalidStateError
+    else:
+        state, error = _emulator("01-special.gb").save_state(), ValueError
+
+    emulator = _emulator()
+    emulator.run_frames(10)
+    before = emulator.save_state(), _machine(emulator)
+    with pytest.raises(error):
+        emulator.load_state(state)
+    assert (emulator.save_state(), _machine(emulator)) == before
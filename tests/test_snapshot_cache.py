@@ -0,0 +1,57 @@
+import os
+import struct
+
+import pytest
+
+from gb_pymulator import save_state
+from gb_pymulator.emulator import Emulator
+from gb_pymulator.snapshot_cache import SnapshotCache
+
+ROM_FILE = os.path.join(os.path.dirname(__file__), "..", "test_roms", "01-special.gb")
+BOOT_ROM_FILE = os.path.join(os.path.dirname(__file__), "..", "DMG_ROM.bin")
+
+
+def _emulator() -> Emulator:
+    with open(ROM_FILE, "rb") as file:
+        return Emulator(file.read())
+
+
+def test_snapshot_with_another_version_is_rebuilt(tmp_path):
+    cache = SnapshotCache(str(tmp_path))
+    emulator = _emulator()
+    emulator.run_frames(10)
+    cache.save(emulator, "checkpoint")
+
+    # The same state, as if it was saved by an older version of the emulator
+    path = cache.path(emulator, "checkpoint")
+    with open(path, "rb") as file:
+        data = bytearray(file.read())
+    struct.pack_into("<H", data, len(save_state.MAGIC), save_state.VERSION - 1)
+    with open(path, "wb") as file:
+        file.write(data)
+
+    created = []
+    fresh = _emulator()
+    assert not cache.load_or_create(fresh, "checkpoint", lambda e: created.append(e.run_frames(10)))
+    assert len(created) == 1
+    assert fresh.frame_count == 10
+
+    # The rebuilt snapshot is loaded on the next run
+    assert cache.load(_emulator(), "checkpoint")
+
+
+def test_snapshot_from_the_boot_rom_is_kept_when_it_doesnt_fit(tmp_path):
+    cache = SnapshotCache(str(tmp_path))
+    booting = Emulator(ROM_FILE, boot_rom=BOOT_ROM_FILE)
+    booting.run_frames(5)
+    cache.save(booting, "booting")
+
+    # An emulator without a boot ROM can't run the state, but that doesn't make the snapshot invalid
+    emulator = _emulator()
+    emulator.run_frames(3)
+    before = emulator.save_state()
+    with pytest.raises(ValueError, match="boot ROM"):
+        cache.load(emulator, "booting")
+    assert emulator.save_state() == before
+    assert os.path.exists(cache.path(emulator, "booting"))
+    assert cache.load(Emulator(ROM_FILE, boot_rom=BOOT_ROM_FILE), "booting")
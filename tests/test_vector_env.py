@@ -0,0 +1,66 @@
+from multiprocessing import shared_memory
+
+import numpy
+import pytest
+
+from gb_pymulator.emulator import Emulator
+from gb_pymulator.joypad import BUTTON_A, BUTTON_B, BUTTON_START, BUTTON_UP
+from gb_pymulator.vector_env import VectorEnv
+
+RAM_ADDRESSES = [0xC000, 0xFF47]
+FRAMES_PER_STEP = 2
+# One button mask per env, for each step
+ACTIONS = [[BUTTON_A, 0, BUTTON_B], [BUTTON_A | BUTTON_UP, BUTTON_B, 0], [0, BUTTON_A, BUTTON_A]]
+
+
+def _step(emulator: Emulator, action: int):
+    emulator.set_buttons(action)
+    emulator.run_frames(FRAMES_PER_STEP)
+
+
+def _assert_observation(frames, ram, i: int, emulator: Emulator):
+    assert numpy.array_equal(frames[i], emulator.frame_array())
+    assert list(ram[i]) == [emulator.read_memory(address)[0] for address in RAM_ADDRESSES]
+
+
+def _env(rom: bytes) -> VectorEnv:
+    # 3 envs on 2 workers: the second worker hosts 2 of them
+    return VectorEnv(rom, num_envs=3, num_workers=2, ram_addresses=RAM_ADDRESSES, frames_per_step=FRAMES_PER_STEP)
+
+
+def test_steps_match_single_process_emulators(input_rom):
+    emulators = [Emulator(input_rom) for _ in range(3)]
+    with _env(input_rom) as env:
+        for actions in ACTIONS:
+            frames, ram = env.step(actions)
+            for i, emulator in enumerate(emulators):
+                _step(emulator, actions[i])
+                _assert_observation(frames, ram, i, emulator)
+        assert len({bytes(env.frames[i]) for i in range(3)}) > 1
+
+        # Only env 1 goes back to the start
+        emulators[1] = Emulator(input_rom)
+        frames, ram = env.reset([1])
+        for i, emulator in enumerate(emulators):
+            _assert_observation(frames, ram, i, emulator)
+
+        frames, ram = env.step(ACTIONS[0])
+        for i, emulator in enumerate(emulators):
+            _step(emulator, ACTIONS[0][i])
+            _assert_observation(frames, ram, i, emulator)
+
+
+def test_worker_error_raises_and_frees_the_shared_memory(input_rom):
+    env = _env(input_rom)
+    names = [shm.name for shm in (env._frames_shm, env._ram_shm, env._actions_shm)]
+    env.step(ACTIONS[0])
+    # Start makes the ROM crash, in the worker of env 2
+    with pytest.raises(RuntimeError, match="Emulator worker failed"):
+        env.step([0, 0, BUTTON_START])
+
+    assert not any(process.is_alive() for process in env._processes)
+    for name in names:
+        with pytest.raises(FileNotFoundError):
+            shared_memory.SharedMemory(name=name)
+    # Closing again does nothing
+    env.close()